@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# Parsing a large number of expressions with a pool of processes.  Each worker builds its parser once, with
+# the parser_factory given to parse_batch, then parses the expressions by chunks.  A chunk comes back as the
+# bytes of tree_format.dump_trees and the errors of its expressions, which is much smaller to send between
+# processes than the pickled nodes; the trees are decoded only when they are asked for.
+#
+# parser_factory is sent to the workers, it must be a function of a module such as shunting_yard.cexp_parser.
+#
+# The scaling from 1 to n cores is still to be measured with benchmarks.py parallel on a multi-core machine;
+# on a single core, one worker parses x0.55-0.7 as fast as the parser in the calling process.
+
+import importlib
+import multiprocessing
+import os
+import sys
+import tree_format
+from tree import node_factory
+
+# The parser of the worker process, built by init_worker
+worker_parser = None
+
+
+def init_worker(parser_factory):
+    global worker_parser
+    worker_parser = parser_factory()
+
+
+# The trees of chunk and the errors by index in the chunk.  Any exception is an error of its expression only,
+# some parsers raising others than RuntimeError on bad input, and its tree is None.  The error trees of the
+# operator precedence parsers hold their symbols, which are sent as leaves with their repr.
+def parse_chunk(chunk):
+    trees = []
+    errors = {}
+    for i, s in enumerate(chunk):
+        try:
+            trees.append(worker_parser.parse(s))
+        except Exception as error:
+            trees.append(None)
+            errors[i] = '{}: {}'.format(type(error).__name__, error)
+    return tree_format.dump_trees(trees, repr), errors
+
+
+# The results of parse_batch, in the order of the expressions: tree(i) decodes the tree of expression i, which
+# is None when error(i) gives its error message.
+class BatchResult:
+    def __init__(self, chunks, chunksize, count):
+        self.chunks = [(tree_format.TreeFile.from_bytes(data), errors) for data, errors in chunks]
+        self.chunksize = chunksize
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError('batch index out of range')
+        return self.tree(i)
+
+    def __iter__(self):
+        for trees, errors in self.chunks:
+            yield from trees
+
+    def tree(self, i, factory=node_factory):
+        trees, errors = self.chunks[i // self.chunksize]
+        return trees.tree(i % self.chunksize, factory)
+
+    def error(self, i):
+        trees, errors = self.chunks[i // self.chunksize]
+        return errors.get(i % self.chunksize)
+
+    # The (index, message) pairs of the expressions which could not be parsed, in order
+    def errors(self):
+        for n, (trees, errors) in enumerate(self.chunks):
+            for i in sorted(errors):
+                yield n * self.chunksize + i, errors[i]
+
+    # The size of the data received from the workers
+    def nbytes(self):
+        return sum(len(trees.mapping) for trees, errors in self.chunks)
+
+
+# Parse expressions, a list of strings, with workers processes, os.cpu_count() by default, each one building
+# its parser with parser_factory.  The expressions are sent by chunks of chunksize; the default gives each
+# worker about four chunks, which balances the load without paying the cost of a message per expression.
+def parse_batch(expressions, parser_factory, workers=None, chunksize=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, -(-len(expressions) // (4 * workers)))
+    chunks = [expressions[i:i + chunksize] for i in range(0, len(expressions), chunksize)]
+    with multiprocessing.Pool(workers, init_worker, (parser_factory,)) as pool:
+        results = pool.map(parse_chunk, chunks, chunksize=1)
+    return BatchResult(results, chunksize, len(expressions))
+
+
+# Parse the lines of a file with the cexp_parser of a module and print those which can not be parsed, for
+# example: batch.py shunting_yard expressions.txt 8
+def main(args):
+    module = importlib.import_module(args[1])
+    with open(args[2]) as f:
+        expressions = [line.rstrip('\n') for line in f]
+    workers = int(args[3]) if len(args) > 3 else None
+    result = parse_batch(expressions, module.cexp_parser, workers)
+    failures = 0
+    for i, message in result.errors():
+        print('{}: {} -> {}'.format(i + 1, expressions[i], message))
+        failures += 1
+    print('{} expressions, {} errors, {} bytes of trees'.format(len(result), failures, result.nbytes()))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import tree
+import batch
+import andychu_cexp_tests
+import jmb_cexp_tests
+import operator_precedence
+import modified_operator_precedence
+import recursive_operator_precedence
+import shunting_yard
+import pratt
+
+
+def sequential(parser, s):
+    try:
+        return tree.sexp(parser.parse(s)), None
+    except Exception as error:
+        return 'None', '{}: {}'.format(type(error).__name__, error)
+
+
+# The batch gives, in order, the trees and errors of parsing each expression in this process
+def check_batch(module, corpus, workers, chunksize):
+    parser = module.cexp_parser()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [sequential(parser, s) for s in corpus]
+        result = batch.parse_batch(corpus, module.cexp_parser, workers, chunksize)
+    if len(result) != len(corpus):
+        print('Failed {} batch: {} results != {}'.format(module.__name__, len(result), len(corpus)))
+    for i, (s, (sexpr, error)) in enumerate(zip(corpus, expected)):
+        got = (tree.sexp(result[i]), result.error(i))
+        if got != (sexpr, error):
+            print('Failed {} batch: {} => {} != {}'.format(module.__name__, s, got, (sexpr, error)))
+    if [i for i, message in result.errors()] != [i for i, (sexpr, error) in enumerate(expected) if error]:
+        print('Failed {} batch errors'.format(module.__name__))
+
+
+def batch_tests():
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    jmb_cexp_tests.all_tests(lambda s, expected: corpus.append(s))
+    check_batch(shunting_yard, corpus, 2, 7)
+    check_batch(pratt, corpus, 3, None)
+    check_batch(pratt, [], 2, None)
+    # the error trees holding parser symbols come back with the same S-expression
+    for module in [operator_precedence, modified_operator_precedence, recursive_operator_precedence]:
+        check_batch(module, ['a + b', ')', 'c', 'a +', 'f(a', 'a b'], 2, 2)
+
+
+if __name__ == "__main__":
+    batch_tests()
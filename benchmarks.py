@@ -0,0 +1,822 @@
+#! /usr/bin/env python3
+# Micro benchmarks for the lexer and the parsers.  Give the names of the benchmarks to run as arguments,
+# all of them are run when there is none.
+
+import contextlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import timeit
+import tracemalloc
+import batch
+import lexer
+import tree
+import evaluation
+import precedence
+import tree_format
+import andychu_cexp_tests
+import jmb_cexp_tests
+import operator_precedence
+import shunting_yard
+import modified_operator_precedence
+import recursive_operator_precedence
+import pratt
+import pratt_tdop_parser
+import pratt_generator
+
+
+def cexp_corpus():
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    jmb_cexp_tests.reg_tests(lambda s, expected: corpus.append(s))
+    return corpus
+
+
+def measure(fn, repeat=7):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Memory still allocated when fn returns, while its result is alive
+def retained_memory(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def report_memory(name, peak, reference=None, what='peak'):
+    if reference is None:
+        print('   {:45} {:10.1f} kB {}'.format(name, peak / 1024, what))
+    else:
+        print('   {:45} {:10.1f} kB {}   x{:.2f}'.format(name, peak / 1024, what, reference / peak))
+
+
+def report(name, elapsed, reference=None):
+    if reference is None:
+        print('   {:45} {:10.2f} ms'.format(name, elapsed * 1000))
+    else:
+        print('   {:45} {:10.2f} ms   x{:.2f}'.format(name, elapsed * 1000, reference / elapsed))
+
+
+def bench_lexer(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    print('lexer: {} expressions'.format(len(corpus)))
+
+    def generator():
+        for s in corpus:
+            for tk in lexer.tokenize(s):
+                pass
+
+    def buffer():
+        for s in corpus:
+            lexer.tokenize_buffer(s)
+
+    def buffer_iteration():
+        for s in corpus:
+            for tk in lexer.tokenize_buffer(s):
+                pass
+
+    reference = measure(generator)
+    report('tokenize generator', reference)
+    report('tokenize_buffer', measure(buffer), reference)
+    report('tokenize_buffer then iteration', measure(buffer_iteration), reference)
+
+    buffers = [lexer.tokenize_buffer(s) for s in corpus]
+    for name, parser in [('shunting_yard', shunting_yard.cexp_parser()), ('pratt', pratt.cexp_parser()),
+                         ('frozen shunting_yard', shunting_yard.cexp_parser().freeze())]:
+
+        def from_string():
+            for s in corpus:
+                parser.parse(s)
+
+        def from_buffer():
+            for b in buffers:
+                parser.parse(b)
+
+        reference = measure(from_string)
+        report('{}.parse(str)'.format(name), reference)
+        report('{}.parse(TokenBuffer)'.format(name), measure(from_buffer), reference)
+
+
+def bench_mmap(scale):
+    corpus = cexp_corpus() * (200 * scale)
+    print('mmap: {} expressions'.format(len(corpus)))
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write('\n'.join(corpus).encode('ascii'))
+    parser = pratt.cexp_parser()
+
+    def decoded():
+        with open(path, 'rb') as f:
+            for line in f.read().decode('ascii').split('\n'):
+                parser.parse(line)
+
+    def mapped():
+        for span, tree in lexer.parse_expressions(parser, path):
+            pass
+
+    try:
+        reference = measure(decoded)
+        report('decode then parse(str)', reference)
+        report('parse_expressions on the mapping', measure(mapped), reference)
+        reference = peak_memory(decoded)
+        report_memory('decode then parse(str)', reference)
+        report_memory('parse_expressions on the mapping', peak_memory(mapped), reference)
+    finally:
+        os.remove(path)
+
+
+def bench_stream(scale):
+    terms = 100000 * scale
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'w') as f:
+        f.write(' + '.join('a{}'.format(i) for i in range(terms)))
+    print('stream: summation of {} terms, {} bytes'.format(terms, os.path.getsize(path)))
+
+    def whole():
+        with open(path) as f:
+            for tk in lexer.tokenize(f.read()):
+                pass
+
+    def streamed():
+        with open(path) as f:
+            for tk in lexer.tokenize_stream(f):
+                pass
+
+    def parse_whole():
+        with open(path) as f:
+            shunting_yard.cexp_parser().parse(f.read())
+
+    def parse_streamed():
+        with open(path) as f:
+            shunting_yard.cexp_parser().parse(f)
+
+    try:
+        reference = measure(whole, 3)
+        report('tokenize(file content)', reference)
+        report('tokenize_stream(file)', measure(streamed, 3), reference)
+        reference = peak_memory(whole)
+        report_memory('tokenize(file content)', reference)
+        report_memory('tokenize_stream(file)', peak_memory(streamed), reference)
+        reference = peak_memory(parse_whole)
+        report_memory('shunting_yard.parse(file content)', reference)
+        report_memory('shunting_yard.parse(file)', peak_memory(parse_streamed), reference)
+    finally:
+        os.remove(path)
+
+
+def bench_operators(scale):
+    spaced = ' , '.join(['x = - - a + ~ b * ! c << d >= - e && f || g ? h : i [ j ] -> k ++'] * 20)
+    dense = spaced.replace(' ', '')
+    corpus = [spaced] * (100 * scale)
+    print('operators: {} operator dense expressions of {} tokens'.format(len(corpus),
+                                                                          len(lexer.tokenize_buffer(spaced))))
+    parser = shunting_yard.cexp_parser()
+    ops = lexer.operator_lexer(parser)
+
+    def regex_buffer():
+        for s in corpus:
+            lexer.tokenize_buffer(s)
+
+    def trie_buffer():
+        for s in corpus:
+            ops.tokenize_buffer(s)
+
+    def regex_parse():
+        for s in corpus:
+            parser.parse(lexer.tokenize_buffer(s))
+
+    def trie_parse():
+        for s in corpus:
+            parser.parse(ops.tokenize_buffer(s))
+
+    def trie_parse_dense():
+        for i in range(len(corpus)):
+            parser.parse(ops.tokenize_buffer(dense))
+
+    reference = measure(regex_buffer)
+    report('tokenize_buffer', reference)
+    report('operator lexer tokenize_buffer', measure(trie_buffer), reference)
+    reference = measure(regex_parse)
+    report('shunting_yard.parse(tokenize_buffer)', reference)
+    report('shunting_yard.parse(operator lexer)', measure(trie_parse), reference)
+    report('shunting_yard.parse(operator lexer) unspaced', measure(trie_parse_dense), reference)
+
+
+
+def bench_freeze(scale):
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    corpus = corpus * (50 * scale)
+    parser = shunting_yard.cexp_parser()
+    frozen = shunting_yard.cexp_parser().freeze()
+
+    def parse(parser, buffers):
+        for tokens in buffers:
+            try:
+                parser.parse(tokens)
+            except (RuntimeError, IndexError):
+                pass
+
+    spaced = ' , '.join(['x = - - a + ~ b * ! c << d >= - e && f || g ? h : i [ j ] -> k ++'] * 20)
+    for name, buffers in [('expressions of the andychu corpus', [lexer.tokenize_buffer(s) for s in corpus]),
+                          ('operator dense expressions', [lexer.tokenize_buffer(spaced)] * (50 * scale))]:
+        print('freeze: {} {}'.format(len(buffers), name))
+        stdout = sys.stdout
+        # some expressions of the corpus make the parser dump its stacks
+        sys.stdout = io.StringIO()
+        try:
+            reference = measure(lambda: parse(parser, buffers), 15)
+            elapsed = measure(lambda: parse(frozen, buffers), 15)
+        finally:
+            sys.stdout = stdout
+        report('shunting_yard.parse', reference)
+        report('shunting_yard.parse frozen', elapsed, reference)
+
+
+# One parser shared by threads, each parsing its share of the corpus.  With the GIL, the parsers being pure
+# Python, the time stays that of one thread; free-threaded builds divide it by the number of cores.
+def bench_threads(scale):
+    corpus = [s for s in cexp_corpus() if s] * (20 * scale)
+    print('threads: {} expressions, {} cores'.format(len(corpus), os.cpu_count()))
+    for module in [shunting_yard, pratt]:
+        parser = module.cexp_parser()
+
+        def parse(expressions):
+            for s in expressions:
+                try:
+                    parser.parse(s)
+                except (RuntimeError, IndexError):
+                    pass
+
+        def run(threads):
+            workers = [threading.Thread(target=parse, args=(corpus[i::threads],)) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        stdout = sys.stdout
+        # some expressions of the corpus make shunting_yard dump its stacks
+        sys.stdout = io.StringIO()
+        try:
+            times = [(threads, measure(lambda: run(threads))) for threads in [1, 2, 4, 8]]
+        finally:
+            sys.stdout = stdout
+        reference = times[0][1]
+        for threads, elapsed in times:
+            report('{}.parse shared by {} threads'.format(module.__name__, threads), elapsed, reference)
+
+
+# Latency of push parsing: once the tokens have been fed as they arrived, only finish is left to do when the
+# input ends, while parse starts then
+def bench_push(scale):
+    s = ' + '.join('a{} * b{}'.format(i, i) for i in range(500 * scale))
+    tokens = list(lexer.tokenize(s))
+    print('push: an expression of {} tokens'.format(len(tokens)))
+    for module in [shunting_yard, modified_operator_precedence]:
+        parser = module.cexp_parser()
+        reference = measure(lambda: parser.parse(s))
+        report('{}.parse'.format(module.__name__), reference)
+        contexts = []
+
+        def feed():
+            context = parser.start()
+            for tk in tokens:
+                context.feed(tk)
+            contexts.append(context)
+
+        report('{} feed'.format(module.__name__), measure(feed), reference)
+        report('{} finish after feed'.format(module.__name__), measure(lambda: contexts.pop().finish()), reference)
+
+
+# Values of numeric rules: parsing to a tree then walking it, or evaluating while parsing
+def bench_evaluate(scale):
+    rules = ['x*y - y*z', '(a + b) * (a - b) / 2', 'a < b && c >= 0 ? a * 2 + 1 : b ** 2',
+             'max(a, b, c) - min(x, y) * 3', '-x + y * (z - 1) % 7 << 1'] * (200 * scale)
+    bindings = {'x': 3, 'y': 4, 'z': 5, 'a': 1.5, 'b': 2.5, 'c': 7, 'max': max, 'min': min}
+    print('evaluate: {} rules'.format(len(rules)))
+    for module in [shunting_yard, pratt]:
+        parser = module.cexp_parser()
+        reference = measure(lambda: [evaluation.tree_value(parser.parse(s), bindings) for s in rules])
+        report('{}.parse then tree_value'.format(module.__name__), reference)
+        report('{}.evaluate'.format(module.__name__),
+               measure(lambda: [parser.evaluate(s, bindings) for s in rules]), reference)
+
+
+def bench_rpn(scale):
+    terms = ['x * y', '(a + b) * 2', '-x % 7', 'max(a, b, c)', 'y ** 2 / z'] * (2000 * scale)
+    s = ' + '.join(terms)
+    bindings = {'x': 3, 'y': 4, 'z': 5, 'a': 1.5, 'b': 2.5, 'c': 7, 'max': max}
+    print('rpn: {} terms'.format(len(terms)))
+    parser = shunting_yard.cexp_parser()
+    reference = measure(lambda: evaluation.tree_value(parser.parse(s), bindings))
+    report('parse then tree_value', reference)
+    report('evaluate', measure(lambda: parser.evaluate(s, bindings)), reference)
+    report('compile then run', measure(lambda: parser.compile(s).evaluate(bindings)), reference)
+    program = parser.compile(s)
+    report('run a compiled program', measure(lambda: program.evaluate(bindings)), reference)
+    tree_memory = retained_memory(lambda: parser.parse(s))
+    report_memory('tree', tree_memory, what='retained')
+    report_memory('program', retained_memory(lambda: parser.compile(s)), tree_memory, what='retained')
+
+
+# Time per token of operator_precedence on inputs growing to 10^6 tokens: flat, left associative operators
+# keep the stack short, right associative ones and nested parenthesis make it as deep as the input
+def bench_op_scaling(scale):
+    shapes = [('flat', lambda n: ' + '.join(['a'] * (n // 2))),
+              ('right associative', lambda n: ' = '.join(['a'] * (n // 2))),
+              ('nested', lambda n: '(' * (n // 2) + 'a' + ')' * (n // 2))]
+    parser = operator_precedence.cexp_parser()
+    print('op_scaling: operator_precedence, ns per token')
+    for name, shape in shapes:
+        reference = None
+        for n in [10 ** k * scale for k in range(3, 7)]:
+            s = shape(n)
+            elapsed = measure(lambda: parser.parse(s), repeat=3 if n < 10 ** 6 else 1) / n
+            if reference is None:
+                reference = elapsed
+            print('   {:45} {:10.0f} ns   x{:.2f}'.format('{} {}'.format(name, n), elapsed * 1e9, reference / elapsed))
+
+
+# The operator precedence parsers with their priorities compiled from their full matrix
+def bench_precedence(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    print('precedence: {} expressions'.format(len(corpus)))
+    for module in [operator_precedence, modified_operator_precedence]:
+        relations = module.cexp_parser().precedence_relations()
+        tables = [('precedence functions', precedence.compile_relations(relations)),
+                  ('packed matrix', precedence.PrecedenceMatrix(relations))]
+        print('   {}: {} symbols, {} matrix bytes'.format(module.__name__, len(tables[1][1].symbols),
+                                                       len(tables[1][1].bits)))
+        parsers = [('hand written priorities', module.cexp_parser())]
+        parsers += [(name, module.cexp_parser().load_precedence(table)) for name, table in tables]
+        reference = None
+        for name, parser in parsers:
+            elapsed = measure(lambda: [parser.parse(s) for s in corpus])
+            report(name, elapsed, reference)
+            reference = reference or elapsed
+
+
+# Reductions dispatched by handle signature against the evaluators alone, and the most frequent productions
+def bench_reductions(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    print('reductions: {} expressions'.format(len(corpus)))
+    for module in [operator_precedence, modified_operator_precedence]:
+        evaluators = module.cexp_parser()
+        evaluators.reduction_table = {}
+        dispatched = module.cexp_parser()
+        with contextlib.redirect_stdout(io.StringIO()):
+            reference = measure(lambda: [evaluators.parse(s) for s in corpus])
+            elapsed = measure(lambda: [dispatched.parse(s) for s in corpus])
+            counts = dispatched.count_reductions()
+            for s in corpus:
+                dispatched.parse(s)
+        report('{} evaluators'.format(module.__name__), reference)
+        report('{} dispatched'.format(module.__name__), elapsed, reference)
+        table = dispatched.reductions()
+        print('   {} of {} reductions dispatched; {}'.format(
+            sum(n for signature, n in counts.items() if signature in table), sum(counts.values()),
+            ', '.join('{} {}'.format(module.handle_pattern(signature), n)
+                      for signature, n in counts.most_common(5))))
+
+
+# Symbol descriptors allocated per token by pratt, by counting the calls of SymbolDesc, and its throughput
+def bench_pratt_symbols(scale):
+    corpus = cexp_corpus() * (40 * scale)
+    tokens = sum(len(list(lexer.tokenize(s))) for s in corpus)
+    print('pratt_symbols: {} expressions, {} tokens'.format(len(corpus), tokens))
+    parser = pratt.cexp_parser()
+    allocated = [0]
+    init = pratt.SymbolDesc.__init__
+
+    def counting_init(desc, *args):
+        allocated[0] += 1
+        init(desc, *args)
+
+    pratt.SymbolDesc.__init__ = counting_init
+    try:
+        for s in corpus:
+            parser.parse(s)
+    finally:
+        pratt.SymbolDesc.__init__ = init
+    print('   {:45} {:10.3f} per token'.format('SymbolDesc allocated', allocated[0] / tokens))
+    for module in [pratt, pratt_tdop_parser]:
+        parser = module.cexp_parser()
+        elapsed = measure(lambda: [parser.parse(s) for s in corpus])
+        print('   {:45} {:10.0f} ktokens/s'.format(module.__name__, tokens / elapsed / 1000))
+
+
+# The parser generated by pratt_generator against pratt, on strings and on tokens already lexed, and the time
+# to get the generated module the first time and from the cache
+def bench_generated(scale):
+    corpus = cexp_corpus() * (40 * scale)
+    long_expression = ' + '.join(['a * (b - c) / f(d, e[1])'] * (2000 * scale))
+    print('generated: {} expressions'.format(len(corpus)))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pratt_generator.loaded_modules.clear()
+        start = timeit.default_timer()
+        generated = pratt_generator.GeneratedParser(pratt.cexp_parser(), cache_dir)
+        report('generate and load', timeit.default_timer() - start)
+        pratt_generator.loaded_modules.clear()
+        start = timeit.default_timer()
+        generated = pratt_generator.GeneratedParser(pratt.cexp_parser(), cache_dir)
+        report('load from the cache', timeit.default_timer() - start)
+        interpreted = pratt.cexp_parser()
+        slices = lexer.tokenize_many(corpus)
+        buffer = lexer.tokenize_buffer(long_expression)
+        for name, fn in [('corpus', lambda parser: [parser.parse(s) for s in corpus]),
+                         ('lexed corpus', lambda parser: [parser.parse(tokens) for tokens in slices]),
+                         ('long expression', lambda parser: parser.parse(long_expression)),
+                         ('lexed long expression', lambda parser: parser.parse(buffer))]:
+            reference = measure(lambda: fn(interpreted))
+            report('pratt {}'.format(name), reference)
+            report('generated {}'.format(name), measure(lambda: fn(generated)), reference)
+
+
+# The explicit stack of parse_iterative against the recursion of parse, on the corpus and on nestings the
+# recursion limit allows, then parse_iterative alone on deeper nestings, in ns per level
+def bench_deep(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    shapes = [('nested', lambda n: '(' * n + 'a' + ')' * n),
+              ('right associative', lambda n: ' = '.join(['a'] * (n + 1)))]
+    print('deep: {} expressions, nestings of 200'.format(len(corpus)))
+    for module in [pratt, recursive_operator_precedence]:
+        print('   {}'.format(module.__name__))
+        parser = module.cexp_parser()
+        cases = [('corpus', lambda parse: [parse(s) for s in corpus])]
+        cases += [(name, lambda parse, s=shape(200): [parse(s) for _ in range(20 * scale)]) for name, shape in shapes]
+        for name, fn in cases:
+            reference = measure(lambda: fn(parser.parse))
+            report('{} parse'.format(name), reference)
+            report('{} parse_iterative'.format(name), measure(lambda: fn(parser.parse_iterative)), reference)
+    print('deep: parse_iterative, ns per level')
+    for module in [pratt, recursive_operator_precedence]:
+        print('   {}'.format(module.__name__))
+        parser = module.cexp_parser()
+        for name, shape in shapes:
+            for n in [10 ** k * scale for k in range(3, 6)]:
+                s = shape(n)
+                elapsed = measure(lambda: parser.parse_iterative(s), repeat=3) / n
+                print('   {:45} {:10.0f} ns'.format('{} {}'.format(name, n), elapsed * 1e9))
+
+
+# pratt_tdop_parser on the andychu cases, looking each token up while parsing or resolving the tokens first
+def bench_tdop(scale):
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    corpus = corpus * (40 * scale)
+    slices = lexer.tokenize_many(corpus)
+    print('tdop: {} andychu expressions'.format(len(corpus)))
+    parser = pratt_tdop_parser.cexp_parser()
+
+    def run(parse, inputs):
+        for s in inputs:
+            try:
+                parse(s)
+            except RuntimeError:
+                pass
+
+    for name, inputs in [('', corpus), (' lexed', slices)]:
+        reference = measure(lambda: run(parser.parse, inputs))
+        report('parse{}'.format(name), reference)
+        report('parse_compiled{}'.format(name), measure(lambda: run(parser.parse_compiled, inputs)), reference)
+
+
+# batch.parse_batch from 1 worker to the number of cores, as powers of two, against parsing in this process.
+# The efficiency is the time with one worker divided by the time with n workers times n.
+def bench_parallel(scale):
+    corpus = cexp_corpus() * (200 * scale)
+    cores = os.cpu_count() or 1
+    counts = sorted({2 ** k for k in range(cores.bit_length()) if 2 ** k <= cores} | {1, 2, cores})
+    print('parallel: {} expressions, {} cores'.format(len(corpus), cores))
+    for module in [shunting_yard, pratt]:
+        parser = module.cexp_parser()
+
+        def sequential():
+            trees = []
+            for s in corpus:
+                try:
+                    trees.append(parser.parse(s))
+                except Exception:
+                    trees.append(None)
+            return trees
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            reference = measure(sequential, 3)
+            trees = sequential()
+            result = batch.parse_batch(corpus, module.cexp_parser, 1)
+        print('   {}: {:.1f} kB of serialized trees, {:.1f} kB pickled'.format(
+            module.__name__, result.nbytes() / 1024, len(pickle.dumps(trees)) / 1024))
+        report('{} in this process'.format(module.__name__), reference)
+        single = None
+        for workers in counts:
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = measure(lambda: batch.parse_batch(corpus, module.cexp_parser, workers), 3)
+            if single is None:
+                single = elapsed
+            report('{} workers'.format(workers), elapsed, reference)
+            print('   {:45} {:10.2f}'.format('{} workers efficiency'.format(workers), single / (elapsed * workers)))
+
+
+cexp_modules = [operator_precedence, shunting_yard, modified_operator_precedence, recursive_operator_precedence,
+                pratt, pratt_tdop_parser]
+
+
+def bench_tokens(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    print('tokens: {} expressions'.format(len(corpus)))
+
+    def tokenize():
+        for s in corpus:
+            for tk in lexer.tokenize(s):
+                pass
+
+    def keep_tokens():
+        return [list(lexer.tokenize(s)) for s in corpus]
+
+    report('tokenize', measure(tokenize))
+    report_memory('tokens of the corpus', peak_memory(keep_tokens))
+    for module in cexp_modules:
+        parser = module.cexp_parser()
+
+        def parse():
+            for s in corpus:
+                try:
+                    parser.parse(s)
+                except RuntimeError:
+                    pass
+
+        report('{}.parse'.format(module.__name__), measure(parse))
+
+
+def bench_batch(scale):
+    corpus = cexp_corpus() * (20 * scale)
+    print('batch: {} expressions'.format(len(corpus)))
+
+    def one_by_one():
+        for s in corpus:
+            for tk in lexer.tokenize(s):
+                pass
+
+    def batch():
+        for tokens in lexer.tokenize_many(corpus):
+            for tk in tokens:
+                pass
+
+    reference = measure(one_by_one)
+    report('tokenize each expression', reference)
+    report('tokenize_many', measure(batch), reference)
+    valid = []
+    for s in corpus:
+        try:
+            pratt.cexp_parser().parse(s)
+            valid.append(s)
+        except RuntimeError:
+            pass
+    for module in [shunting_yard, pratt]:
+        parser = module.cexp_parser()
+
+        def parse():
+            for s in valid:
+                parser.parse(s)
+
+        reference = measure(parse)
+        report('{}.parse each expression'.format(module.__name__), reference)
+        report('{}.parse_many'.format(module.__name__), measure(lambda: parser.parse_many(valid)), reference)
+
+
+def bench_tree(scale):
+    terms = 250000 * scale
+    source = ' + '.join('a{} * {}'.format(i % 1000, i % 7) for i in range(terms))
+    print('tree: {} nodes'.format(4 * terms - 1))
+    parser = shunting_yard.cexp_parser()
+
+    def objects():
+        parser.factory = tree.node_factory
+        return parser.parse(source)
+
+    def arena():
+        parser.factory = tree.Arena()
+        return parser.parse(source)
+
+    reference = measure(objects, 3)
+    report('shunting_yard.parse to objects', reference)
+    report('shunting_yard.parse to an arena', measure(arena, 3), reference)
+    reference = retained_memory(objects)
+    report_memory('tree of objects', reference, what='retained')
+    report_memory('arena', retained_memory(arena), reference, what='retained')
+
+
+def bench_sharing(scale):
+    corpus = []
+    for s in cexp_corpus() * (20 * scale):
+        try:
+            pratt.cexp_parser().parse(s)
+            corpus.append(s)
+        except RuntimeError:
+            pass
+    print('sharing: {} expressions'.format(len(corpus)))
+    parser = pratt.cexp_parser()
+
+    def objects():
+        parser.factory = tree.node_factory
+        return [parser.parse(s) for s in corpus]
+
+    def hash_consing():
+        parser.factory = tree.HashConsingFactory()
+        return [parser.parse(s) for s in corpus]
+
+    reference = measure(objects)
+    report('pratt.parse to objects', reference)
+    report('pratt.parse with hash consing', measure(hash_consing), reference)
+    reference = retained_memory(objects)
+    report_memory('trees of objects', reference, what='retained')
+    report_memory('hash consed trees', retained_memory(hash_consing), reference, what='retained')
+    first = objects()
+    second = objects()
+
+    def structural_equality():
+        return sum(repr(a) == repr(b) for a, b in zip(first, second))
+
+    reference = measure(structural_equality)
+    report('equality of trees of objects', reference)
+    parser.factory = tree.HashConsingFactory()
+    first = [parser.parse(s) for s in corpus]
+    second = [parser.parse(s) for s in corpus]
+
+    def identity():
+        return sum(a is b for a, b in zip(first, second))
+
+    report('equality of hash consed trees', measure(identity), reference)
+
+
+# The former CompositeNode.__repr__
+def recursive_sexp(node):
+    if isinstance(node, tree.CompositeNode):
+        return '(' + node.token + ''.join([' ' + recursive_sexp(c) for c in node.children]) + ')'
+    return repr(node)
+
+
+def bench_sexp(scale):
+    parser = pratt.cexp_parser()
+    deep = parser.parse(' + '.join('a{}'.format(i) for i in range(400)))
+    trees = [deep] * (20 * scale)
+    print('sexp: {} trees of depth 400'.format(len(trees)))
+    reference = measure(lambda: [recursive_sexp(t) for t in trees])
+    report('recursive repr', reference)
+    report('tree.sexp', measure(lambda: [tree.sexp(t) for t in trees]), reference)
+    trees = []
+    for s in cexp_corpus():
+        try:
+            trees.append(parser.parse(s))
+        except RuntimeError:
+            pass
+    trees = trees * (20 * scale)
+    print('sexp: {} trees of the cexp corpus'.format(len(trees)))
+    reference = measure(lambda: [recursive_sexp(t) for t in trees])
+    report('recursive repr', reference)
+    report('tree.sexp', measure(lambda: [tree.sexp(t) for t in trees]), reference)
+    deep = parser.parse(' + '.join('a{}'.format(i) for i in range(200000 * scale)))
+    print('sexp: a tree of depth {}'.format(200000 * scale))
+    report('tree.sexp', measure(lambda: tree.sexp(deep), 3))
+    report('tree.write_sexp to a StringIO', measure(lambda: tree.write_sexp(deep, io.StringIO()), 3))
+
+
+
+# Checking parsed trees against golden S-expressions: formatting each tree and comparing strings, or
+# comparing each tree with the golden tree read once
+def bench_diff(scale):
+    parser = pratt.cexp_parser()
+    trees = []
+    for s in cexp_corpus():
+        try:
+            trees.append(parser.parse(s))
+        except RuntimeError:
+            pass
+    trees = trees * (20 * scale)
+    expected = [tree.sexp(t) for t in trees]
+    print('diff: {} trees of the cexp corpus'.format(len(trees)))
+    report('tree.read_sexp of the golden', measure(lambda: [tree.read_sexp(e) for e in expected]))
+    golden = [tree.read_sexp(e) for e in expected]
+    reference = measure(lambda: [tree.sexp(t) == e for t, e in zip(trees, expected)])
+    report('tree.sexp and compare', reference)
+    report('tree.sexp_diff', measure(lambda: [tree.sexp_diff(t, g) for t, g in zip(trees, golden)]), reference)
+    deep = parser.parse(' + '.join('a{}'.format(i) for i in range(2000)))
+    expected = tree.sexp(deep)
+    # the golden differs by the operator at the root
+    mismatch = '(-' + expected[2:]
+    golden = tree.read_sexp(mismatch)
+    deeps = [deep] * (20 * scale)
+    print('diff: {} trees of depth 2000 mismatching at the root'.format(len(deeps)))
+    reference = measure(lambda: [tree.sexp(t) == mismatch for t in deeps])
+    report('tree.sexp and compare', reference)
+    report('tree.sexp_diff', measure(lambda: [tree.sexp_diff(t, golden) for t in deeps]), reference)
+
+def bench_tree_file(scale):
+    parser = pratt.cexp_parser()
+    trees = []
+    # distinct trees, pickle would only store references to repeated ones
+    for s in cexp_corpus() * (100 * scale):
+        try:
+            trees.append(parser.parse(s))
+        except RuntimeError:
+            pass
+    print('tree file: {} trees'.format(len(trees)))
+    fd, pickle_path = tempfile.mkstemp()
+    os.close(fd)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+
+    def write_pickle():
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(trees, f, pickle.HIGHEST_PROTOCOL)
+
+    def load_pickle():
+        with open(pickle_path, 'rb') as f:
+            return pickle.load(f)
+
+    def load_one_pickle():
+        return load_pickle()[len(trees) // 2]
+
+    def load_all():
+        with tree_format.TreeFile(path) as loaded:
+            return list(loaded)
+
+    def load_one():
+        with tree_format.TreeFile(path) as loaded:
+            return loaded[len(trees) // 2]
+
+    try:
+        reference = measure(write_pickle, 3)
+        report('pickle.dump', reference)
+        report('tree_format.write_trees', measure(lambda: tree_format.write_trees(path, trees), 3), reference)
+        print('   {:45} {:10.1f} kB'.format('pickle size', os.path.getsize(pickle_path) / 1024))
+        print('   {:45} {:10.1f} kB'.format('tree file size', os.path.getsize(path) / 1024))
+        reference = measure(load_pickle, 3)
+        report('pickle.load', reference)
+        report('TreeFile, all trees', measure(load_all, 3), reference)
+        reference = measure(load_one_pickle, 3)
+        report('pickle.load, one tree', reference)
+        report('TreeFile, one tree', measure(load_one, 3), reference)
+    finally:
+        os.remove(pickle_path)
+        os.remove(path)
+
+
+benchmarks = {
+    'lexer': bench_lexer,
+    'mmap': bench_mmap,
+    'stream': bench_stream,
+    'operators': bench_operators,
+    'tokens': bench_tokens,
+    'batch': bench_batch,
+    'tree': bench_tree,
+    'sharing': bench_sharing,
+    'sexp': bench_sexp,
+    'diff': bench_diff,
+    'freeze': bench_freeze,
+    'threads': bench_threads,
+    'push': bench_push,
+    'evaluate': bench_evaluate,
+    'rpn': bench_rpn,
+    'op_scaling': bench_op_scaling,
+    'precedence': bench_precedence,
+    'reductions': bench_reductions,
+    'pratt_symbols': bench_pratt_symbols,
+    'generated': bench_generated,
+    'deep': bench_deep,
+    'tdop': bench_tdop,
+    'parallel': bench_parallel,
+    'tree_file': bench_tree_file,
+}
+
+
+def main(args):
+    scale = 1
+    names = []
+    for arg in args[1:]:
+        if arg.isdigit():
+            scale = int(arg)
+        else:
+            names.append(arg)
+    for name in names or benchmarks.keys():
+        benchmarks[name](scale)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
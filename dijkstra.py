@@ -3,7 +3,8 @@
 
 import sys
 import lexer
-from tree import Node, CompositeNode
+import rpn
+from tree import node_factory
 
 
 class OperatorDesc:
@@ -18,18 +19,19 @@ class OperatorDesc:
 
 def unary_evaluator(parser):
     oper = parser.operators_stack.pop()
-    parser.values_stack.append(CompositeNode(oper.oper, [parser.values_stack.pop()]))
+    parser.values_stack.append(parser.factory.composite(oper.oper, [parser.values_stack.pop()]))
 
 
 def binary_evaluator(parser):
     oper = parser.operators_stack.pop()
     val2 = parser.values_stack.pop()
     val1 = parser.values_stack.pop()
-    parser.values_stack.append(CompositeNode(oper.oper, [val1, val2]))
+    parser.values_stack.append(parser.factory.composite(oper.oper, [val1, val2]))
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.operators = {}
         self.register_infix_operator(['(', '['], 0)
         self.register_infix_operator([')', ']', ','], 1)
@@ -44,13 +46,6 @@ class Parser:
         self.register_infix_operator(['*', '/'], 10)
         self.register_unary_operator(['~'], 10)
         self.register_infix_operator('^', 11)
-        self.reset()
-
-    def reset(self):
-        self.coma_interpretation = 0
-        self.previous_coma_interpretation = []
-        self.values_stack = []
-        self.operators_stack = []
 
     def register_unary_operator(self, oper, prio, evaluator=None):
         if evaluator is None:
@@ -70,6 +65,25 @@ class Parser:
             for op in oper:
                 self.operators[op] = OperatorDesc(op, prio, evaluator)
 
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+    # The reverse Polish code of s, see rpn.py; run it with evaluation.algol_semantics
+    def compile(self, s):
+        return rpn.emit(ParseContext(self), s)
+
+
+# The stacks and the interpretation of comas of one parse.  Only the operator table is in the Parser, it
+# is not modified by parse and can be used by several threads at once.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.operators = parser.operators
+        self.coma_interpretation = 0
+        self.previous_coma_interpretation = []
+        self.values_stack = []
+        self.operators_stack = []
+
     def evaluate_operator(self):
         self.operators_stack[-1].evaluator(self)
 
@@ -79,11 +93,10 @@ class Parser:
         self.operators_stack.append(oper)
 
     def parse(self, s):
-        self.reset()
         previous_was_id = False
         for tk in lexer.tokenize(s):
-            if tk.kind == 'NUMBER' or tk.kind == 'ID':
-                self.values_stack.append(Node(tk))
+            if tk.kind == lexer.NUMBER or tk.kind == lexer.ID:
+                self.values_stack.append(self.factory.leaf(tk))
             elif tk.lexem == '(':
                 self.operators_stack.append(self.operators[tk.lexem])
                 self.previous_coma_interpretation.append(self.coma_interpretation)
@@ -103,18 +116,18 @@ class Parser:
                     if self.coma_interpretation == 2:
                         val2 = self.values_stack.pop()
                         val1 = self.values_stack.pop()
-                        self.values_stack.append(CompositeNode('call', [val1, val2]))
+                        self.values_stack.append(self.factory.composite('call', [val1, val2]))
                     self.coma_interpretation = self.previous_coma_interpretation.pop()
                 elif tk.lexem == ']':
                     self.operators_stack.pop()
                     self.operators_stack.pop()
                     val2 = self.values_stack.pop()
                     val1 = self.values_stack.pop()
-                    self.values_stack.append(CompositeNode('index', [val1, val2]))
+                    self.values_stack.append(self.factory.composite('index', [val1, val2]))
                     self.coma_interpretation = self.previous_coma_interpretation.pop()
             else:
                 raise RuntimeError('Syntax error at {}'.format(tk.lexem))
-            previous_was_id = tk.kind == 'ID'
+            previous_was_id = tk.kind == lexer.ID
         while len(self.operators_stack) > 0:
             self.evaluate_operator()
         if len(self.values_stack) != 1:
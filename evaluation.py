@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# Computing the value of expressions while parsing them, without building their tree.  The parsers build
+# their results through their node factory; ValueFactory returns values instead of nodes, so the evaluators
+# of the parsers combine values.  The leaves are numbers or identifiers, whose values are given by a
+# mapping, and each composite node is replaced by the result of the function associated to its label in a
+# semantics table, called with the values of the children.  All the operands are evaluated, && || and ?:
+# included.
+#
+# Coma lists are Arguments, used for the arguments of calls; between parenthesis or as a result a coma list
+# has the value of its last element, as in C.
+
+import math
+import operator
+import sys
+import lexer
+from tree import Node, CompositeNode
+
+
+class Arguments(tuple):
+    pass
+
+
+def value(result):
+    if isinstance(result, Arguments):
+        return result[-1]
+    return result
+
+
+class ValueFactory:
+    def __init__(self, bindings, semantics):
+        self.bindings = bindings
+        self.semantics = semantics
+
+    def leaf(self, token):
+        if token.kind == lexer.ID:
+            try:
+                return self.bindings[token.lexem]
+            except KeyError:
+                raise RuntimeError('{} is not bound'.format(token.lexem))
+        elif token.kind == lexer.NUMBER:
+            lexem = token.lexem
+            return float(lexem) if '.' in lexem else int(lexem)
+        raise RuntimeError('Can not evaluate {}'.format(token.lexem))
+
+    def composite(self, label, children):
+        function = self.semantics.get(label)
+        if function is None:
+            raise RuntimeError('Can not evaluate {}'.format(label))
+        return function(*children)
+
+    def append(self, node, child):
+        return self.composite(',', [node, child])
+
+    def parenthesized(self, node):
+        return value(node)
+
+
+def coma(*values):
+    if isinstance(values[0], Arguments):
+        return Arguments(values[0] + values[1:])
+    return Arguments(values)
+
+
+def call(function, *args):
+    if len(args) == 1 and isinstance(args[0], Arguments):
+        args = args[0]
+    return function(*args)
+
+
+def plus(a, b=None):
+    return +a if b is None else a + b
+
+
+def minus(a, b=None):
+    return -a if b is None else a - b
+
+
+# Python operators for the labels of C expressions
+c_semantics = {
+    ',': coma,
+    'call': call,
+    'get': operator.getitem,
+    '?': lambda condition, true_value, false_value: true_value if condition else false_value,
+    '||': lambda a, b: a or b,
+    '&&': lambda a, b: a and b,
+    '|': operator.or_,
+    '^': operator.xor,
+    '&': operator.and_,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '<<': operator.lshift,
+    '>>': operator.rshift,
+    '+': plus,
+    '-': minus,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '**': operator.pow,
+    '~': operator.invert,
+    '!': operator.not_,
+}
+
+
+# Python operators for the labels of the Algol expressions of dijkstra.py
+algol_semantics = {
+    ',': coma,
+    'call': call,
+    'index': lambda array, index: array[index] if not isinstance(index, Arguments) else array[tuple(index)],
+    '==': operator.eq,
+    '=>': lambda a, b: not a or b,
+    '&': lambda a, b: a and b,
+    '|': lambda a, b: a or b,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '~': operator.not_,
+    '^': operator.pow,
+}
+
+
+# The value of a tree, built by any parser, computed with the same semantics as ValueFactory
+def tree_value(node, bindings, semantics=c_semantics):
+    factory = ValueFactory(bindings, semantics)
+    values = []
+    # nodes to evaluate, composite nodes once more after their children
+    pending = [(node, False)]
+    while pending:
+        node, children_done = pending.pop()
+        if isinstance(node, CompositeNode):
+            if not children_done:
+                pending.append((node, True))
+                for child in reversed(node.children):
+                    pending.append((child, False))
+                continue
+            first = len(values) - len(node.children)
+            result = factory.composite(node.token, values[first:])
+            del values[first:]
+        elif isinstance(node, Node):
+            result = factory.leaf(node.token)
+        else:
+            raise RuntimeError('Can not evaluate {!r}'.format(node))
+        if node.parenthesis:
+            result = factory.parenthesized(result)
+        values.append(result)
+    return value(values[0])
+
+
+# Evaluate the arguments, with the functions and constants of the math module
+def main(args):
+    import pratt
+    parser = pratt.cexp_parser()
+    for s in args[1:]:
+        try:
+            print('{} -> {}'.format(s, parser.evaluate(s, vars(math))))
+        except RuntimeError as run_error:
+            print('Unable to evaluate {}: {}'.format(s, run_error))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
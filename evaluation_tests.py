@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import evaluation
+import andychu_cexp_tests
+import jmb_cexp_tests
+import shunting_yard
+import pratt
+
+
+# Value or type of the exception, the parsers dumping their stacks on some errors
+def result(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as error:
+        return type(error).__name__
+
+
+bindings = {name: i + 1 for i, name in enumerate('abcdefghijklmnopqrstuvwxyz')}
+bindings.update(f=lambda *args: sum(args), g=max, h=min, x=[3, 4, 5], y=[[6, 7], [8, 9]])
+
+
+def check(parser, s, expected):
+    with contextlib.redirect_stdout(io.StringIO()):
+        got = result(parser.evaluate, s, bindings)
+    if got != expected:
+        print('Failed {} evaluate: {} => {} != {}'.format(type(parser).__module__, s, got, expected))
+
+
+def check_evaluation(s, expected):
+    for parser in [shunting_yard.cexp_parser(), pratt.cexp_parser()]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            walked = result(lambda: evaluation.tree_value(parser.parse(s), bindings))
+            fused = result(parser.evaluate, s, bindings)
+        if fused != walked:
+            print('Failed {} evaluate: {} => {} != {}'.format(type(parser).__module__, s, fused, walked))
+
+
+def evaluation_tests():
+    for parser in [shunting_yard.cexp_parser(), pratt.cexp_parser(), shunting_yard.cexp_parser().freeze()]:
+        check(parser, '1 + 2 * 3 - 4', 3)
+        check(parser, '2 ** 3 ** 2', 512)
+        check(parser, '-a * (b + c) / 2.0', -2.5)
+        check(parser, 'a < b && c == 3 ? 10 : 20', 10)
+        check(parser, '~a | 8 ^ b << 2', -2 | (8 ^ 8))
+        check(parser, 'f(a, b, c) + f() + g(a, (b, c))', 6 + 0 + 3)
+        check(parser, 'x[1] + y[a][0]', 4 + 8)
+        check(parser, 'a, b, c', 3)
+        check(parser, 'unbound + 1', 'RuntimeError')
+        check(parser, 'a +', 'RuntimeError')
+        check(parser, 'a++', 'RuntimeError')
+        check(parser, 'a / 0', 'ZeroDivisionError')
+    parser = pratt.cexp_parser()
+    semantics = dict(evaluation.c_semantics)
+    semantics['+'] = lambda a, b: '({}+{})'.format(a, b)
+    if parser.evaluate('a + b + c', {'a': 'a', 'b': 'b', 'c': 'c'}, semantics) != '((a+b)+c)':
+        print('Failed evaluate with semantics: {}'.format(parser.evaluate('a + b + c', {}, semantics)))
+
+
+evaluation_tests()
+andychu_cexp_tests.all(check_evaluation)
+jmb_cexp_tests.all_tests(check_evaluation)
@@ -1,5 +1,7 @@
 # Some additional tests, coming mainly from regressions and related examples
 
+from tree import sexp
+
 
 def reg_tests(t_parse):
     t_parse('a()', '(call a)')
@@ -58,7 +60,7 @@ def all_tests(t_parse):
 def check_parsing(parser, s, expected):
     try:
         tree = parser.parse(s)
-        sexpr = repr(tree)
+        sexpr = sexp(tree)
         if sexpr != expected:
             if expected == '':
                 print('Failing to parse: {} => {}'.format(s, sexpr))
@@ -69,3 +71,12 @@ def check_parsing(parser, s, expected):
             print('Exception while parsing {} => {}'.format(s, error))
         else:
             print('UNEXPECTED exception while parsing: {} => {}, expected {}'.format(s, error, expected))
+
+
+# Inputs nested far deeper than the recursion limit, for the parse functions using an explicit stack
+def deep_tests(parse, n=1000000):
+    for s, expected in [('(' * n + 'a' + ')' * n, 'a'),
+                        (' = '.join(['a'] * n), '(= a ' * (n - 1) + 'a' + ')' * (n - 1))]:
+        sexpr = sexp(parse(s))
+        if sexpr != expected:
+            print('Failed deep parse: {}... => {}...'.format(s[:20], sexpr[:40]))
@@ -5,7 +5,7 @@
 
 import sys
 import lexer
-from tree import Node, CompositeNode
+from tree import node_factory
 
 
 class OperatorDesc:
@@ -21,18 +21,19 @@ class OperatorDesc:
 def unary_evaluator(parser):
     val = parser.stack.pop()
     oper = parser.stack.pop()
-    parser.stack.append(CompositeNode(oper.oper, [val]))
+    parser.stack.append(parser.factory.composite(oper.oper, [val]))
 
 
 def binary_evaluator(parser):
     val2 = parser.stack.pop()
     oper = parser.stack.pop()
     val1 = parser.stack.pop()
-    parser.stack.append(CompositeNode(oper.oper, [val1, val2]))
+    parser.stack.append(parser.factory.composite(oper.oper, [val1, val2]))
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.binary_operators = {}
         self.unary_operators = {}
         self.register_binary_operator(['@', ')'], 0)
@@ -44,10 +45,6 @@ class Parser:
         self.register_binary_operator(['*', '/'], 2)
         self.register_binary_operator('^', 3)
         self.register_unary_operator(['ABS', 'SQRT', 'COS'], 4)
-        self.reset()
-
-    def reset(self):
-        self.stack = [self.binary_operators['@']]
 
     def register_unary_operator(self, oper, prio, evaluator=None):
         if evaluator is None:
@@ -67,13 +64,25 @@ class Parser:
             for op in oper:
                 self.binary_operators[op] = OperatorDesc(op, prio, evaluator)
 
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+
+# The stack of one parse, kept apart from the operator tables so that threads can share a Parser.  The
+# evaluators get the context as their parser.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.binary_operators = parser.binary_operators
+        self.unary_operators = parser.unary_operators
+        self.stack = [self.binary_operators['@']]
+
     def tokenize(self, s):
         for tk in lexer.tokenize(s):
             yield tk
-        yield lexer.Token('OPER', '@')
+        yield lexer.Token(lexer.OPER, '@')
 
     def parse(self, s):
-        self.reset()
         for tk in self.tokenize(s):
             if tk.lexem in self.binary_operators:
                 S = self.binary_operators[tk.lexem]
@@ -95,7 +104,7 @@ class Parser:
             elif tk.lexem in self.unary_operators:
                 S = self.unary_operators[tk.lexem]
             else:
-                S = Node(tk)
+                S = self.factory.leaf(tk)
             self.stack.append(S)
 
     def dump(self):
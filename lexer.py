@@ -1,35 +1,505 @@
 # A lexer used by all the parsers
 # A simple lexer for C like expressions.  The major difference with C is that consecutive operators have
-# to be separated with white spaces.
+# to be separated with white spaces.  Token kinds are small integers (Kind) and lexems are interned.
+# Tokens record their start and end offsets in the source, in characters for a str and in bytes otherwise.
 
+import mmap
+import os
 import re
+import sys
+from array import array
+from collections import defaultdict
+from bisect import bisect_right
+from enum import IntEnum
 
 
+# Kind of the tokens.  The lexer produces only the first four, the others are used for tokens
+# synthesized by the parsers.  The kind is also the code stored in token buffers.
+class Kind(IntEnum):
+    NUMBER = 0
+    ID = 1
+    OPER = 2
+    SYNT = 3
+    ERROR = 4
+    EOF = 5
+
+
+# Tokens hold the plain int codes, comparing them is faster than comparing Kind members.
+NUMBER, ID, OPER, SYNT, ERROR, EOF = range(len(Kind))
+
+
+# Synthesized tokens have no position, their offsets are -1.
 class Token:
-    def __init__(self, kind, lexem):
+    __slots__ = ('kind', 'lexem', 'start', 'end')
+
+    def __init__(self, kind, lexem, start=-1, end=-1):
         self.kind = kind
         self.lexem = lexem
+        self.start = start
+        self.end = end
 
     def __repr__(self):
-        return '<Token {} \'{}\'>'.format(self.kind, self.lexem)
+        return '<Token {} \'{}\'>'.format(Kind(self.kind).name, self.lexem)
 
 
-def tokenize(code):
-    token_specification = [
-        ('NUMBER',   r'\d+(\.\d*)?'),
-        ('ID',       r'[A-Za-z_][A-Za-z0-9_]*'),
-        ('OPER',     r'[-~+*/%=<>?!:|&^@]+'),
-        ('SYNT',     r'[][(),.]'),
-        ('SKIP',     r'[ \t\n]+'),
-        ('MISMATCH', r'.'),
-    ]
-    tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
-    for mo in re.finditer(tok_regex, code):
-        kind = mo.lastgroup
-        value = mo.group(kind)
-        if kind == 'SKIP':
-            pass
-        elif kind == 'MISMATCH':
+# A token read from a bytes-like source (bytes, memoryview, mmap) which keeps only its span in the source:
+# the lexem is decoded when it is read.
+class SpanToken(Token):
+    __slots__ = ('source',)
+
+    def __init__(self, kind, source, start, end):
+        self.kind = kind
+        self.source = source
+        self.start = start
+        self.end = end
+
+    @property
+    def lexem(self):
+        return str(self.source[self.start:self.end], 'ascii')
+
+
+token_specification = [
+    ('NUMBER',   r'[0-9]+(?:\.[0-9]*)?'),
+    ('ID',       r'[A-Za-z_][A-Za-z0-9_]*'),
+    ('OPER',     r'[-~+*/%=<>?!:|&^@]+'),
+    ('SYNT',     r'[][(),.]'),
+    ('SKIP',     r'[ \t\n]+'),
+    ('MISMATCH', r'.'),
+]
+
+token_regex = re.compile('|'.join('(?P<%s>%s)' % pair for pair in token_specification))
+bytes_token_regex = re.compile(token_regex.pattern.encode('ascii'))
+word_regex = re.compile(dict(token_specification)['ID'])
+
+
+# Whether an operator is lexed as an identifier, like the keyword operator 'and'
+def is_word(lexem):
+    return word_regex.fullmatch(lexem) is not None
+
+# Codes for the regex groups which do not produce tokens
+SKIP = len(Kind)
+MISMATCH = SKIP + 1
+
+# kind code indexed by the regex group number reported by match.lastindex
+group_codes = [None] * (token_regex.groups + 1)
+for name, group in token_regex.groupindex.items():
+    if name == 'SKIP':
+        group_codes[group] = SKIP
+    elif name == 'MISMATCH':
+        group_codes[group] = MISMATCH
+    else:
+        group_codes[group] = int(Kind[name])
+
+# A compact token stream: parallel arrays of kind codes and of start/end offsets in the source.
+# Parsers accept it in place of a string.  A frozen shunting_yard parser reads the arrays and builds tokens only
+# for the operands; the other parsers iterate over it, which builds a token per lexeme, because their evaluators
+# and error nodes read the current token.  The source is either a str or a bytes-like object,
+# in the latter case operands are SpanToken referencing the source.
+class TokenBuffer:
+    def __init__(self, source, kinds, starts, ends):
+        self.source = source
+        self.kinds = array('B', kinds)
+        self.starts = array('I', starts)
+        self.ends = array('I', ends)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def lexem(self, i):
+        lexem = self.source[self.starts[i]:self.ends[i]]
+        if isinstance(lexem, str):
+            return lexem
+        return str(lexem, 'ascii')
+
+    def token(self, i):
+        kind = self.kinds[i]
+        if kind > ID or isinstance(self.source, str):
+            return Token(kind, sys.intern(self.lexem(i)), self.starts[i], self.ends[i])
+        else:
+            return SpanToken(kind, self.source, self.starts[i], self.ends[i])
+
+    def __iter__(self):
+        source = self.source
+        if isinstance(source, str):
+            for kind, start, end in zip(self.kinds, self.starts, self.ends):
+                yield Token(kind, sys.intern(source[start:end]), start, end)
+        else:
+            for kind, start, end in zip(self.kinds, self.starts, self.ends):
+                if kind <= ID:
+                    yield SpanToken(kind, source, start, end)
+                else:
+                    yield Token(kind, sys.intern(str(source[start:end], 'ascii')), start, end)
+
+    def __repr__(self):
+        return '<TokenBuffer {} tokens>'.format(len(self.kinds))
+
+
+def tokenize_buffer(code):
+    kinds = []
+    starts = []
+    ends = []
+    regex = token_regex if isinstance(code, str) else bytes_token_regex
+    for mo in regex.finditer(code):
+        kind = group_codes[mo.lastindex]
+        if kind < SKIP:
+            kinds.append(kind)
+            starts.append(mo.start())
+            ends.append(mo.end())
+        elif kind == MISMATCH:
+            value = mo.group()
+            if not isinstance(value, str):
+                value = value.decode('latin-1')
             raise RuntimeError('{} unexpected'.format(value))
+    return TokenBuffer(code, kinds, starts, ends)
+
+
+# Lexing a batch.  The token patterns cover any input, so the pieces returned by findall on their plain
+# alternation are consecutive: their offsets are the running sum of their lengths, and their kind is given by
+# their first character.  This avoids a match object per token.
+piece_regex = re.compile('|'.join(pattern for name, pattern in token_specification))
+assert piece_regex.groups == 0
+
+# kind code of a piece indexed by its first character.  The patterns accept only ASCII characters, the others
+# are mismatches.
+piece_kinds = defaultdict(lambda: MISMATCH)
+for code in range(128):
+    mo = token_regex.match(chr(code))
+    if mo is not None:
+        piece_kinds[chr(code)] = group_codes[mo.lastindex]
+
+
+# The tokens of one expression of a batch: the range [first, last) of the token list shared by the batch.
+# Token offsets are relative to the expression.  When the expression has an unexpected character, an ERROR
+# token, the RuntimeError is raised when the slice is read up to it.
+class TokenSlice:
+    __slots__ = ('tokens', 'first', 'last', 'error')
+
+    def __init__(self, tokens, first, last, error=False):
+        self.tokens = tokens
+        self.first = first
+        self.last = last
+        self.error = error
+
+    def __len__(self):
+        return self.last - self.first
+
+    def kind(self, i):
+        return self.tokens[self.first + i].kind
+
+    def lexem(self, i):
+        return self.tokens[self.first + i].lexem
+
+    def token(self, i):
+        return self.tokens[self.first + i]
+
+    def __iter__(self):
+        if not self.error:
+            return iter(self.tokens[self.first:self.last])
+        return self.tokens_until_error()
+
+    def tokens_until_error(self):
+        for tk in self.tokens[self.first:self.last]:
+            if tk.kind == ERROR:
+                raise RuntimeError('{} unexpected'.format(tk.lexem))
+            yield tk
+
+    def __repr__(self):
+        return '<TokenSlice {} tokens>'.format(len(self))
+
+
+# Tokenize a list of expressions, all str or all bytes-like, in a single pass over their concatenation and
+# return a TokenSlice per expression.  The expressions are joined with newlines, which the lexer skips, and
+# split by their offsets.  Bytes are decoded as latin-1, which keeps the offsets.  An unexpected character is
+# kept as an ERROR token.
+def tokenize_many(expressions):
+    if expressions and not isinstance(expressions[0], str):
+        pieces = piece_regex.findall(str(b'\n'.join(expressions), 'latin-1'))
+    else:
+        pieces = piece_regex.findall('\n'.join(expressions))
+    tokens = []
+    append = tokens.append
+    intern = sys.intern
+    kinds = piece_kinds
+    # the expressions are numbered from 0, the current one starts at offset base and ends at limit
+    firsts = []
+    errors = set()
+    expression = -1
+    base = 0
+    limit = -1
+    offset = 0
+    for piece in pieces:
+        end = offset + len(piece)
+        kind = kinds[piece[0]]
+        if kind != SKIP:
+            while offset > limit:
+                expression += 1
+                firsts.append(len(tokens))
+                base = limit + 1
+                limit = base + len(expressions[expression])
+            if kind == MISMATCH:
+                kind = ERROR
+                errors.add(expression)
+            append(Token(kind, intern(piece), offset - base, end - base))
+        offset = end
+    firsts.extend([len(tokens)] * (len(expressions) - len(firsts)))
+    firsts.append(len(tokens))
+    return [TokenSlice(tokens, firsts[i], firsts[i + 1], i in errors) for i in range(len(expressions))]
+
+
+def tokenize_string(code):
+    for mo in token_regex.finditer(code):
+        kind = group_codes[mo.lastindex]
+        if kind < SKIP:
+            yield Token(kind, sys.intern(mo.group()), mo.start(), mo.end())
+        elif kind == MISMATCH:
+            raise RuntimeError('{} unexpected'.format(mo.group()))
+
+
+# Tokenize the content of a file-like object, read in chunks of chunk_size characters (or bytes).  A token
+# reaching the end of a chunk is kept pending until the next chunk shows where it ends, so the memory used
+# is bounded by the chunk size and the longest token.  offset is the position of text in the stream.
+def tokenize_stream(stream, chunk_size=65536):
+    pending = None
+    offset = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if pending is None:
+            text = chunk
         else:
-            yield Token(kind, value)
+            text = pending + chunk
+            offset -= len(pending)
+        pending = None
+        regex = token_regex if isinstance(text, str) else bytes_token_regex
+        for mo in regex.finditer(text):
+            if chunk and mo.end() == len(text):
+                pending = text[mo.start():]
+                break
+            kind = group_codes[mo.lastindex]
+            if kind == SKIP:
+                continue
+            value = mo.group()
+            if not isinstance(value, str):
+                value = value.decode('latin-1')
+            if kind < SKIP:
+                yield Token(kind, sys.intern(value), offset + mo.start(), offset + mo.end())
+            else:
+                raise RuntimeError('{} unexpected'.format(value))
+        if not chunk:
+            return
+        offset += len(text)
+
+
+def tokenize(code):
+    if isinstance(code, str):
+        return tokenize_string(code)
+    elif isinstance(code, (TokenBuffer, TokenSlice)):
+        return iter(code)
+    elif hasattr(code, 'read') and not isinstance(code, mmap.mmap):
+        return tokenize_stream(code)
+    else:
+        return iter(tokenize_buffer(code))
+
+
+# Map the file at path and yield a memoryview on each of its newline separated expressions, empty lines
+# are skipped.  Nothing is copied: the views, and the tokens and trees built from them, keep the mapping
+# alive.
+def map_expressions(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapping)
+    start = 0
+    size = len(mapping)
+    while start < size:
+        end = mapping.find(b'\n', start)
+        if end < 0:
+            end = size
+        if end > start:
+            yield view[start:end]
+        start = end + 1
+
+
+# Parse each expression of the file at path with parser, yielding the expression span and its tree.
+def parse_expressions(parser, path):
+    for span in map_expressions(path):
+        yield span, parser.parse(span)
+
+
+# Lexer generated from the set of operators registered on a parser.  Instead of grabbing whole runs of
+# operator characters, it recognizes the longest registered operator (so a-+b is a - +b) and reports its
+# index in operators, the lexer's operator id.  The operators are arranged in a trie which is compiled into
+# the regular expression: each accepting node ends with an empty group, the last group matched is then the
+# one of the recognized operator.  Runs of operator characters which are not registered are still reported
+# as OPER tokens with no id.
+#
+# pratt and frozen shunting_yard parsers look the operators with an id up in lists built by resolve.  The other
+# parsers still use their dicts keyed by lexem, the lexems of the operator tokens being interned strings whose
+# hash is cached.
+
+# The tables in which the parsers register their operators
+operator_tables = ['prefix_actions', 'prefix_operators', 'infix_operators', 'postfix_actions', 'postfix_operators',
+                   'presymbols', 'postsymbols', 'symbols', 'operators', 'unary_operators', 'binary_operators',
+                   'null_lookup', 'left_lookup']
+oper_chars = '-~+*/%=<>?!:|&^@'
+synt_chars = '[](),.'
+
+
+def operator_set(parser):
+    result = set()
+    for name in operator_tables:
+        for oper in getattr(parser, name, {}):
+            if isinstance(oper, str) and oper and all(c in oper_chars or c in synt_chars for c in oper):
+                result.add(oper)
+    return result
+
+
+class OperatorToken(Token):
+    __slots__ = ('oper',)
+
+    def __init__(self, kind, lexem, oper, start=-1, end=-1):
+        Token.__init__(self, kind, lexem, start, end)
+        self.oper = oper
+
+
+# The buffer of an OperatorLexer, opers giving the operator id of each token, -1 for those without one.  The
+# kind and interned lexem of the tokens with an id are taken from the tokens of the lexer.
+class OperatorTokenBuffer(TokenBuffer):
+    def __init__(self, source, kinds, starts, ends, opers, operator_lexer):
+        TokenBuffer.__init__(self, source, kinds, starts, ends)
+        self.opers = array('h', opers)
+        self.operator_lexer = operator_lexer
+        self.operator_tokens = operator_lexer.tokens
+
+    def token(self, i):
+        oper = self.opers[i]
+        if oper >= 0:
+            tk = self.operator_tokens[oper]
+            return OperatorToken(tk.kind, tk.lexem, oper, self.starts[i], self.ends[i])
+        return TokenBuffer.token(self, i)
+
+    def __iter__(self):
+        source = self.source
+        operator_tokens = self.operator_tokens
+        for kind, start, end, oper in zip(self.kinds, self.starts, self.ends, self.opers):
+            if oper >= 0:
+                tk = operator_tokens[oper]
+                yield OperatorToken(tk.kind, tk.lexem, oper, start, end)
+            elif isinstance(source, str):
+                yield Token(kind, sys.intern(source[start:end]), start, end)
+            elif kind <= ID:
+                yield SpanToken(kind, source, start, end)
+            else:
+                yield Token(kind, sys.intern(str(source[start:end], 'ascii')), start, end)
+
+
+# Pattern recognizing the operators of the trie rooted at node, the ids of the accepting nodes are appended
+# to accepting in the order of their group.
+def trie_pattern(node, accepting):
+    alternatives = []
+    for c in sorted(node):
+        if c != '':
+            alternatives.append(re.escape(c) + trie_pattern(node[c], accepting))
+    if '' in node:
+        accepting.append(node[''])
+        alternatives.append('()')
+    if not alternatives:
+        return '(?!)'
+    elif len(alternatives) == 1 and alternatives[0] == '()':
+        return '()'
+    return '(?:' + '|'.join(alternatives) + ')'
+
+
+class OperatorLexer:
+    def __init__(self, operators):
+        self.operators = sorted(operators)
+        self.tokens = []
+        self.resolved = {}  # (table, list) by id of the table, see resolve
+        trie = {}
+        for oper, lexem in enumerate(self.operators):
+            kind = SYNT if lexem in synt_chars else OPER
+            self.tokens.append(OperatorToken(kind, sys.intern(lexem), oper))
+            node = trie
+            for c in lexem:
+                node = node.setdefault(c, {})
+            node[''] = oper
+        # blanks are tested before the trie, they are more frequent than any operator
+        head = '|'.join('(?P<%s>%s)' % pair for pair in token_specification if pair[0] in ['NUMBER', 'ID', 'SKIP'])
+        tail = '|'.join('(?P<%s>%s)' % pair for pair in token_specification if pair[0] in ['OPER', 'SYNT', 'MISMATCH'])
+        # operator ids in the order of their empty group in the pattern
+        accepting = []
+        pattern = head + '|' + trie_pattern(trie, accepting) + '|' + tail
+        self.regex = re.compile(pattern)
+        self.bytes_regex = re.compile(pattern.encode('ascii'))
+        first = re.compile(head).groups + 1
+        self.group_kinds = [None] * (self.regex.groups + 1)
+        self.group_opers = [-1] * (self.regex.groups + 1)
+        for name, group in self.regex.groupindex.items():
+            self.group_kinds[group] = group_codes[token_regex.groupindex[name]]
+        for group, oper in enumerate(accepting, first):
+            self.group_kinds[group] = self.tokens[oper].kind
+            self.group_opers[group] = oper
+
+    def tokenize_buffer(self, code):
+        kinds = []
+        starts = []
+        ends = []
+        opers = []
+        group_kinds = self.group_kinds
+        group_opers = self.group_opers
+        regex = self.regex if isinstance(code, str) else self.bytes_regex
+        for mo in regex.finditer(code):
+            group = mo.lastindex
+            kind = group_kinds[group]
+            if kind < SKIP:
+                kinds.append(kind)
+                starts.append(mo.start())
+                ends.append(mo.end())
+                opers.append(group_opers[group])
+            elif kind == MISMATCH:
+                value = mo.group()
+                if not isinstance(value, str):
+                    value = value.decode('latin-1')
+                raise RuntimeError('{} unexpected'.format(value))
+        return OperatorTokenBuffer(code, kinds, starts, ends, opers, self)
+
+    def tokenize(self, code):
+        return iter(self.tokenize_buffer(code))
+
+    # The entries of a table keyed by lexem, indexed by operator id, which the parsers use in place of the table
+    # for the tokens with an id.  The lexer is a snapshot of the operators of a parser, the list of a table is
+    # built the first time it is asked for and kept with the table.
+    def resolve(self, table):
+        entry = self.resolved.get(id(table))
+        if entry is None or entry[0] is not table:
+            entry = self.resolved[id(table)] = (table, [table.get(lexem) for lexem in self.operators])
+        return entry[1]
+
+
+def operator_lexer(parser):
+    return OperatorLexer(operator_set(parser))
+
+
+newline_regex = re.compile('\n')
+bytes_newline_regex = re.compile(b'\n')
+
+
+# Line and column of offsets in a source.  The offsets of the line starts are only searched the first time
+# a position is asked for; lines and columns are counted from 1.
+class LineIndex:
+    def __init__(self, source):
+        self.source = source
+        self.line_starts = None
+
+    def position(self, offset):
+        if self.line_starts is None:
+            regex = newline_regex if isinstance(self.source, str) else bytes_newline_regex
+            self.line_starts = [0]
+            self.line_starts.extend(mo.end() for mo in regex.finditer(self.source))
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def format(self, offset):
+        if offset < 0:
+            return '?'
+        return '{}:{}'.format(*self.position(offset))
@@ -0,0 +1,282 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import os
+import tempfile
+import lexer
+from tree import sexp
+import andychu_cexp_tests
+import jmb_cexp_tests
+import dijkstra
+import knuth
+import operator_precedence
+import shunting_yard
+import modified_operator_precedence
+import recursive_operator_precedence
+import pratt
+import pratt_tdop_parser
+
+
+def tokens(code):
+    return [(tk.kind, tk.lexem) for tk in lexer.tokenize(code)]
+
+
+def check_bytes(s):
+    expected = tokens(s)
+    for source in [s.encode('ascii'), memoryview(s.encode('ascii')), bytearray(s.encode('ascii'))]:
+        got = tokens(source)
+        if got != expected:
+            print('Failed {}: {} => {} != {}'.format(type(source).__name__, s, got, expected))
+
+
+def check_stream(s):
+    expected = tokens(s)
+    for chunk_size in [1, 2, 3, 7, 64]:
+        got = [(tk.kind, tk.lexem) for tk in lexer.tokenize_stream(io.StringIO(s), chunk_size)]
+        if got != expected:
+            print('Failed stream by {}: {} => {} != {}'.format(chunk_size, s, got, expected))
+        got = [(tk.kind, tk.lexem) for tk in lexer.tokenize_stream(io.BytesIO(s.encode('ascii')), chunk_size)]
+        if got != expected:
+            print('Failed bytes stream by {}: {} => {} != {}'.format(chunk_size, s, got, expected))
+
+
+def check_buffer(s):
+    check_bytes(s)
+    check_stream(s)
+    expected = tokens(s)
+    buffer = lexer.tokenize_buffer(s)
+    got = [(buffer.kinds[i], buffer.lexem(i)) for i in range(len(buffer))]
+    if got != expected:
+        print('Failed buffer: {} => {} != {}'.format(s, got, expected))
+    got = tokens(buffer)
+    if got != expected:
+        print('Failed buffer iteration: {} => {} != {}'.format(s, got, expected))
+
+
+# The stacks dumped by shunting_yard on errors are not printed
+def parse(parser, code):
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sexp(parser.parse(code))
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+def check_parsers(s, expected):
+    check_buffer(s)
+    for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                   recursive_operator_precedence, pratt, pratt_tdop_parser]:
+        from_string = parse(module.cexp_parser(), s)
+        from_buffer = parse(module.cexp_parser(), lexer.tokenize_buffer(s))
+        if from_string != from_buffer:
+            print('Failed {}: {} => {} != {}'.format(module.__name__, s, from_buffer, from_string))
+        parser = module.cexp_parser()
+        from_operators = parse(parser, lexer.operator_lexer(parser).tokenize_buffer(s))
+        if from_string != from_operators:
+            print('Failed {} with operator lexer: {} => {} != {}'.format(module.__name__, s, from_operators,
+                                                                          from_string))
+        from_stream = parse(module.cexp_parser(), io.StringIO(s))
+        if from_string != from_stream:
+            print('Failed {} on stream: {} => {} != {}'.format(module.__name__, s, from_stream, from_string))
+        from_bytes = parse(module.cexp_parser(), memoryview(s.encode('ascii')))
+        if from_string != from_bytes:
+            print('Failed {} on bytes: {} => {} != {}'.format(module.__name__, s, from_bytes, from_string))
+    # the parsers reading the arrays of the buffers, from str and bytes sources, and looking the operators up
+    # by id
+    for parser in [shunting_yard.cexp_parser().freeze(), pratt.cexp_parser()]:
+        from_string = parse(parser, s)
+        for code in [s, s.encode('ascii')]:
+            for buffer in [lexer.tokenize_buffer(code), lexer.operator_lexer(parser).tokenize_buffer(code)]:
+                from_buffer = parse(parser, buffer)
+                if from_string != from_buffer:
+                    print('Failed {} on {}: {!r} => {} != {}'.format(type(parser).__module__, type(buffer).__name__,
+                                                                     code, from_buffer, from_string))
+
+
+def check_algol(s):
+    for parser in [dijkstra.algol_exp_parser(), knuth.Parser()]:
+        from_string = parse(parser, s)
+        from_buffer = parse(parser, lexer.tokenize_buffer(s))
+        if from_string != from_buffer:
+            print('Failed {}: {} => {} != {}'.format(type(parser).__module__, s, from_buffer, from_string))
+
+
+def positions(tokens):
+    return [(tk.lexem, tk.start, tk.end) for tk in tokens]
+
+
+def check_positions(s, expected):
+    parser = shunting_yard.cexp_parser()
+    for name, got in [('string', lexer.tokenize(s)), ('buffer', lexer.tokenize_buffer(s)),
+                      ('bytes', lexer.tokenize(s.encode('ascii'))),
+                      ('stream', lexer.tokenize_stream(io.StringIO(s), 2)),
+                      ('bytes stream', lexer.tokenize_stream(io.BytesIO(s.encode('ascii')), 3)),
+                      ('operator lexer', lexer.operator_lexer(parser).tokenize(s))]:
+        got = positions(got)
+        if got != expected:
+            print('Failed {} positions: {} => {} != {}'.format(name, s, got, expected))
+
+
+def position_tests():
+    check_positions('a + 12', [('a', 0, 1), ('+', 2, 3), ('12', 4, 6)])
+    check_positions(' f(x)\n  <<= y', [('f', 1, 2), ('(', 2, 3), ('x', 3, 4), (')', 4, 5), ('<<=', 8, 11),
+                                       ('y', 12, 13)])
+    s = 'a = b\n  * (c + d)'
+    for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                   recursive_operator_precedence, pratt, pratt_tdop_parser]:
+        tree = module.cexp_parser().parse(s)
+        if tree.span() != (0, 16) or tree.children[1].children[1].span() != (11, 16):
+            print('Failed {} span: {} => {} {}'.format(module.__name__, s, tree.span(),
+                                                       tree.children[1].children[1].span()))
+    index = lexer.LineIndex(s)
+    got = [index.format(offset) for offset in [0, 4, 5, 6, 8, 16, -1]]
+    if got != ['1:1', '1:5', '1:6', '2:1', '2:3', '2:11', '?']:
+        print('Failed line index: {}'.format(got))
+    if lexer.LineIndex(memoryview(s.encode('ascii'))).position(8) != (2, 3):
+        print('Failed line index on bytes')
+    tree = pratt.cexp_parser().parse(' + '.join(['a'] * 100000))
+    if tree.span() != (0, 399997):
+        print('Failed span of a deep tree: {}'.format(tree.span()))
+
+
+def batch_tests():
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    jmb_cexp_tests.reg_tests(lambda s, expected: corpus.append(s))
+    corpus += ['', '  ', 'a\nb', 'x $ y', 'f(1)']
+    for expressions in [corpus, [s.encode('ascii') for s in corpus]]:
+        slices = lexer.tokenize_many(expressions)
+        if len(slices) != len(corpus):
+            print('Failed tokenize_many: {} slices for {} expressions'.format(len(slices), len(corpus)))
+        for s, tokens in zip(corpus, slices):
+            try:
+                expected = positions(lexer.tokenize(s))
+            except RuntimeError as error:
+                expected = str(error)
+            try:
+                got = positions(tokens)
+            except RuntimeError as error:
+                got = str(error)
+            if got != expected:
+                print('Failed tokenize_many: {} => {} != {}'.format(s, got, expected))
+    # the characters which are not ASCII are unexpected, digits included
+    for s in ['x\u0663', '\u0663', 'a + \xe9', 'b \uff12 c', '1\u00b2']:
+        try:
+            expected = positions(lexer.tokenize(s))
+        except RuntimeError as error:
+            expected = str(error)
+        try:
+            got = positions(lexer.tokenize_many([s])[0])
+        except RuntimeError as error:
+            got = str(error)
+        if got != expected or not got.endswith('unexpected'):
+            print('Failed tokenize_many: {!r} => {} != {}'.format(s, got, expected))
+    if lexer.tokenize_many([]) != []:
+        print('Failed tokenize_many on no expression')
+    expressions = ['a + b * c', 'f(x, y)', 'x = -y', 'a ? b : c']
+    for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                   recursive_operator_precedence, pratt, pratt_tdop_parser]:
+        expected = [parse(module.cexp_parser(), s) for s in expressions]
+        try:
+            got = [repr(tree) for tree in module.cexp_parser().parse_many(expressions)]
+        except Exception as error:
+            got = '{}: {}'.format(type(error).__name__, error)
+        if got != expected:
+            print('Failed {} parse_many: {} != {}'.format(module.__name__, got, expected))
+
+
+def buffer_tests():
+    check_buffer('')
+    check_buffer('  ')
+    check_buffer('a+b')
+    check_buffer('1.5 * x_1 >>= (f[2], .)')
+    check_buffer('12.25 <<= abc_def   ')
+    try:
+        list(lexer.tokenize_stream(io.StringIO('a + b $ c'), 2))
+        print('Failed stream: a + b $ c accepted')
+    except RuntimeError:
+        pass
+    check_algol('a*(b+c)')
+    check_algol('COS a')
+    try:
+        lexer.tokenize_buffer('a $ b')
+        print('Failed buffer: a $ b accepted')
+    except RuntimeError:
+        pass
+
+
+def span_tests():
+    tk = lexer.tokenize_buffer(b'a + 12').token(2)
+    if type(tk) != lexer.SpanToken or tk.start != 4 or tk.end != 6 or tk.lexem != '12':
+        print('Failed span token: {}'.format(tk))
+
+
+def mmap_tests():
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append((s, expected)))
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write('\n\n'.join(s for s, expected in corpus).encode('ascii'))
+        parsed = [(str(span, 'ascii'), repr(tree))
+                  for span, tree in lexer.parse_expressions(pratt.cexp_parser(), path)]
+        if parsed != corpus:
+            print('Failed parse_expressions: {} != {}'.format(parsed, corpus))
+    finally:
+        os.remove(path)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        if list(lexer.map_expressions(path)) != []:
+            print('Failed map_expressions on empty file')
+    finally:
+        os.remove(path)
+
+
+def check_operators(parser, s, expected, expected_tree=None):
+    ops = lexer.operator_lexer(parser)
+    got = [(lexer.Kind(tk.kind).name, tk.lexem) for tk in ops.tokenize(s)]
+    if got != expected:
+        print('Failed operator lexer: {} => {} != {}'.format(s, got, expected))
+    for tk in ops.tokenize(s):
+        if hasattr(tk, 'oper') and ops.operators[tk.oper] != tk.lexem:
+            print('Failed operator lexer: {} => {} has id {}'.format(s, tk, tk.oper))
+    if expected_tree is not None:
+        tree = parse(parser, ops.tokenize_buffer(s))
+        if tree != expected_tree:
+            print('Failed operator lexer: {} => {} != {}'.format(s, tree, expected_tree))
+
+
+def operator_lexer_tests():
+    parser = shunting_yard.cexp_parser()
+    check_operators(parser, 'a-+b', [('ID', 'a'), ('OPER', '-'), ('OPER', '+'), ('ID', 'b')], '(- a (+ b))')
+    check_operators(parser, 'x<<=-y', [('ID', 'x'), ('OPER', '<<='), ('OPER', '-'), ('ID', 'y')], '(<<= x (- y))')
+    check_operators(parser, 'a--b', [('ID', 'a'), ('OPER', '--'), ('ID', 'b')])
+    check_operators(parser, 'a+@b', [('ID', 'a'), ('OPER', '+'), ('OPER', '@'), ('ID', 'b')])
+    check_operators(parser, 'f(-a)', [('ID', 'f'), ('SYNT', '('), ('OPER', '-'), ('ID', 'a'), ('SYNT', ')')],
+                    '(call f (- a))')
+    check_operators(pratt.cexp_parser(), 'x=-~y', [('ID', 'x'), ('OPER', '='), ('OPER', '-'), ('OPER', '~'),
+                                                   ('ID', 'y')], '(= x (- (~ y)))')
+    check_operators(knuth.Parser(), 'U:=-1', [('ID', 'U'), ('OPER', ':='), ('OPER', '-'), ('NUMBER', '1')])
+    ops = lexer.OperatorLexer([])
+    if [tk.lexem for tk in ops.tokenize('a+b')] != ['a', '+', 'b']:
+        print('Failed operator lexer without operators')
+    ops = lexer.operator_lexer(parser)
+    if ops.resolve(parser.infix_operators)[ops.operators.index('*')] is not parser.infix_operators['*']:
+        print('Failed operator lexer resolve')
+    if ops.resolve(parser.infix_operators) is not ops.resolve(parser.infix_operators):
+        print('Failed operator lexer resolve: table resolved again')
+    # the parsers looking the operators up by id
+    check_operators(shunting_yard.cexp_parser().freeze(), 'a-+b*(c)', [('ID', 'a'), ('OPER', '-'), ('OPER', '+'),
+                    ('ID', 'b'), ('OPER', '*'), ('SYNT', '('), ('ID', 'c'), ('SYNT', ')')], '(- a (* (+ b) c))')
+
+
+buffer_tests()
+operator_lexer_tests()
+span_tests()
+position_tests()
+batch_tests()
+mmap_tests()
+andychu_cexp_tests.all(check_parsers)
+jmb_cexp_tests.all_tests(check_parsers)
@@ -1,13 +1,18 @@
 #! /usr/bin/env python3
 
 import sys
+from collections import Counter
 import lexer
-from tree import Node, CompositeNode
+import precedence
+from tree import CompositeNode, node_factory
 
 
+# name is the symbol in the signatures of the handles and in precedence matrices: presymbols are prefixed by
+# pre, identifiers and numbers are $id$
 class SymbolDesc:
-    def __init__(self, symbol, lprio, rprio, evaluator):
+    def __init__(self, symbol, lprio, rprio, evaluator, name=None):
         self.symbol = symbol
+        self.name = symbol if name is None else name
         self.lprio = lprio
         self.rprio = rprio
         self.evaluator = evaluator
@@ -16,76 +21,164 @@ class SymbolDesc:
         return '<Symbol {} {}/{}>'.format(self.symbol, self.lprio, self.rprio)
 
 
-def identity_evaluator(args):
+def identity_evaluator(parser, args):
     if len(args) == 1 and type(args[0]) == SymbolDesc:
-        return Node(args[0].symbol)
+        return parser.factory.leaf(args[0].symbol)
     else:
-        return CompositeNode('ID ERROR', args)
+        return parser.factory.composite('ID ERROR', args)
 
 
-def binary_evaluator(args):
+def binary_evaluator(parser, args):
     if len(args) != 3 or type(args[0]) == SymbolDesc or type(args[1]) != SymbolDesc or type(args[2]) == SymbolDesc:
-        return CompositeNode('BINARY ERROR', args)
-    return CompositeNode(args[1].symbol, [args[0], args[2]])
+        return parser.factory.composite('BINARY ERROR', args)
+    return parser.factory.composite(args[1].symbol, [args[0], args[2]])
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.presymbols = {}
-        self.presymbols['$soi$'] = SymbolDesc('$soi$', 0, 0, None)
+        self.presymbols['$soi$'] = SymbolDesc('$soi$', 0, 0, None, 'pre$soi$')
         self.postsymbols = {}
         self.postsymbols['$soi$'] = SymbolDesc('$soi$', 0, 0, None)
+        self.id_lprio = 999
+        self.id_rprio = 1000
+        self.reduction_table = None
+        self.reduction_counts = None
 
     def register_presymbol(self, oper, lprio, rprio, evaluator=None):
         if evaluator is None:
             evaluator = unary_evaluator
+        self.reduction_table = None
         if type(oper) is str:
-            self.presymbols[oper] = SymbolDesc(oper, lprio, rprio, evaluator)
+            self.presymbols[oper] = SymbolDesc(oper, lprio, rprio, evaluator, 'pre' + oper)
         else:
             for op in oper:
-                self.presymbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
+                self.presymbols[op] = SymbolDesc(op, lprio, rprio, evaluator, 'pre' + op)
 
     def register_postsymbol(self, oper, lprio, rprio, evaluator=None):
         if evaluator is None:
             evaluator = binary_evaluator
+        self.reduction_table = None
         if type(oper) is str:
             self.postsymbols[oper] = SymbolDesc(oper, lprio, rprio, evaluator)
         else:
             for op in oper:
                 self.postsymbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
 
+    # The symbols by name, without the identifiers
+    def named_symbols(self):
+        symbols = {desc.name: desc for desc in self.presymbols.values()}
+        symbols.update((desc.name, desc) for desc in self.postsymbols.values())
+        return symbols
+
+    # The priorities as a full precedence matrix, see precedence.py
+    def precedence_relations(self):
+        priorities = {symbol: (desc.lprio, desc.rprio) for symbol, desc in self.named_symbols().items()}
+        priorities['$id$'] = (self.id_lprio, self.id_rprio)
+        return precedence.priority_relations(priorities)
+
+    # Take the priorities of the symbols from table, compiled by precedence.compile_relations
+    def load_precedence(self, table):
+        symbols = self.named_symbols()
+        for symbol in list(symbols) + ['$id$']:
+            if symbol not in table:
+                raise RuntimeError('No priority for {}'.format(symbol))
+        for symbol, desc in symbols.items():
+            desc.lprio = table.lprio(symbol)
+            desc.rprio = table.rprio(symbol)
+        self.id_lprio = table.lprio('$id$')
+        self.id_rprio = table.rprio('$id$')
+        return self
+
+    # The builders of the productions of the evaluators of the symbols, by handle signature.  A production is
+    # only used for the symbol starting it, the one whose evaluator would be called for its handle.
+    def reductions(self):
+        if self.reduction_table is None:
+            table = {handle_signature(('$id$',)): build_leaf}
+            for name, desc in self.named_symbols().items():
+                for pattern, builder in productions.get(desc.evaluator, []):
+                    pattern = tuple(name if x == OPER else x for x in pattern)
+                    if [x for x in pattern if x is not None][0] == name:
+                        table[handle_signature(pattern)] = builder
+            self.reduction_table = table
+        return self.reduction_table
+
+    # Count the reductions of the following parses by handle signature, see handle_pattern
+    def count_reductions(self):
+        self.reduction_counts = Counter()
+        return self.reduction_counts
+
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+    # Incremental parsing: feed the tokens one by one to the returned context, then call its finish
+    def start(self):
+        return PushContext(self)
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+
+# The lexer, current token and stack of one parse, which would otherwise be on the Parser: with them kept
+# out of it, several threads can parse with the same Parser.  The evaluators get the context as their parser.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.presymbols = parser.presymbols
+        self.postsymbols = parser.postsymbols
+        self.id_lprio = parser.id_lprio
+        self.id_rprio = parser.id_rprio
+        self.reductions = parser.reductions()
+        self.reduction_counts = parser.reduction_counts
+        self.lexer = None
+        self.cur_token = None
+        self.stack = [self.presymbols['$soi$']]
+
     def advance(self):
         try:
             self.cur_token = self.lexer.__next__()
         except StopIteration:
             self.cur_token = None
 
-    def reset(self, s):
-        self.lexer = lexer.tokenize(s)
-        self.advance()
-        self.stack = [self.presymbols['$soi$']]
-
     def id_symbol(self, id):
-        return SymbolDesc(id, 999, 1000, identity_evaluator)
+        return SymbolDesc(id, self.id_lprio, self.id_rprio, identity_evaluator, '$id$')
 
     def evaluate_handle(self, args):
         for i in args:
             if type(i) == SymbolDesc:
-                return i.evaluator(args)
+                return i.evaluator(self, args)
         raise RuntimeError('Internal error: no evaluator found in {}'.format(args))
 
+    # The handle is searched from the top of the stack, noting the positions of its symbols, from which its
+    # signature is computed.  The signature selects the builder of its production; the evaluator of its first
+    # symbol handles the others, errors included.
     def evaluate(self):
-        idx = len(self.stack)-1
-        if type(self.stack[idx]) != SymbolDesc:
+        stack = self.stack
+        idx = len(stack)-1
+        if type(stack[idx]) != SymbolDesc:
             idx -= 1
-        curprio = self.stack[idx].lprio
-        while type(self.stack[idx-1]) != SymbolDesc or self.stack[idx-1].rprio == curprio:
+        symbols = [idx]
+        curprio = stack[idx].lprio
+        while type(stack[idx-1]) != SymbolDesc or stack[idx-1].rprio == curprio:
             idx -= 1
-            if type(self.stack[idx]) == SymbolDesc:
-                curprio = self.stack[idx].lprio
-        args = self.stack[idx:]
-        self.stack[idx:] = []
-        self.stack.append(self.evaluate_handle(args))
+            if type(stack[idx]) == SymbolDesc:
+                symbols.append(idx)
+                curprio = stack[idx].lprio
+        mask = 1 << (len(stack) - idx)
+        for i in symbols:
+            mask |= 1 << (i - idx)
+        signature = (tuple([stack[i].name for i in reversed(symbols)]), mask)
+        args = stack[idx:]
+        stack[idx:] = []
+        if self.reduction_counts is not None:
+            self.reduction_counts[signature] += 1
+        builder = self.reductions.get(signature)
+        if builder is not None:
+            stack.append(builder(self, args))
+        else:
+            stack.append(self.evaluate_handle(args))
 
     def tos_symbol(self):
         idx = len(self.stack)-1
@@ -96,9 +189,9 @@ class Parser:
     def cur_sym(self, allow_presymbol):
         if self.cur_token is None:
             return None
-        elif self.cur_token.kind == 'ID':
+        elif self.cur_token.kind == lexer.ID:
             return self.id_symbol(self.cur_token)
-        elif self.cur_token.kind == 'NUMBER':
+        elif self.cur_token.kind == lexer.NUMBER:
             return self.id_symbol(self.cur_token)
         elif allow_presymbol and self.cur_token.lexem in self.presymbols:
             return self.presymbols[self.cur_token.lexem]
@@ -107,17 +200,28 @@ class Parser:
         else:
             return None
 
+    # Shift the current token, after the reductions it triggers, and advance.  False when the token can not
+    # be shifted, the parse stops there.
+    def shift_token(self):
+        sym = self.cur_sym(type(self.stack[-1]) == SymbolDesc)
+        if sym is None:
+            return False
+        while self.tos_symbol().rprio > sym.lprio:
+            self.evaluate()
+            sym = self.cur_sym(False)
+        self.stack.append(sym)
+        self.advance()
+        return True
+
     def parse(self, s):
-        self.reset(s)
-        while True:
-            sym = self.cur_sym(type(self.stack[-1]) == SymbolDesc)
-            if sym is None:
-                break
-            while self.tos_symbol().rprio > sym.lprio:
-                self.evaluate()
-                sym = self.cur_sym(False)
-            self.stack.append(sym)
-            self.advance()
+        self.lexer = lexer.tokenize(s)
+        self.advance()
+        while self.shift_token():
+            pass
+        return self.finish()
+
+    # Reduce what is left on the stack at the end of the input
+    def finish(self):
         while len(self.stack) > 2 or (len(self.stack) == 2 and type(self.stack[-1]) == SymbolDesc):
             self.evaluate()
         if len(self.stack) == 1:
@@ -125,11 +229,37 @@ class Parser:
         elif len(self.stack) == 2:
             res = self.stack[1]
         if self.cur_token is not None:
-            res = CompositeNode('REMAINING INPUT', [res, self.cur_token])
+            res = self.factory.composite('REMAINING INPUT', [res, self.cur_token])
         return res
 
 
-def open_parenthesis_evaluator(args):
+# A parse context fed with the tokens one at a time, from Parser.start.  feed shifts a token as soon as it
+# arrives, doing the reductions it allows, and returns the composite subtrees they built, so only the
+# reductions at the end of the input wait for finish, which returns the tree.  Once a token can not be
+# shifted, the following ones are ignored and finish reports it as REMAINING INPUT, as parse does.
+class PushContext(ParseContext):
+    def __init__(self, parser):
+        ParseContext.__init__(self, parser)
+        self.reduced = []
+
+    def advance(self):
+        self.cur_token = None
+
+    def evaluate(self):
+        ParseContext.evaluate(self)
+        if isinstance(self.stack[-1], CompositeNode):
+            self.reduced.append(self.stack[-1])
+
+    def feed(self, tk):
+        if self.cur_token is None:
+            self.cur_token = tk
+            self.shift_token()
+        reduced = self.reduced
+        self.reduced = []
+        return reduced
+
+
+def open_parenthesis_evaluator(parser, args):
     if (len(args) == 3
             and type(args[0]) == SymbolDesc and args[0].symbol == '('
             and type(args[1]) != SymbolDesc
@@ -139,87 +269,158 @@ def open_parenthesis_evaluator(args):
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) == SymbolDesc and args[2].symbol == ')'):
-        return CompositeNode('call', [args[0]])
+        return parser.factory.composite('call', [args[0]])
     elif (len(args) == 4
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) != SymbolDesc
             and type(args[3]) == SymbolDesc and args[3].symbol == ')'):
         if args[2].token == ',':
-            callargs = args[2].children
+            callargs = [args[0]] + args[2].children
         else:
-            callargs = [args[2]]
-        callargs.insert(0, args[0])
-        return CompositeNode('call', callargs)
+            callargs = [args[0], args[2]]
+        return parser.factory.composite('call', callargs)
     else:
-        return CompositeNode('( ERROR', args)
+        return parser.factory.composite('( ERROR', args)
 
 
-def close_parenthesis_evaluator(args):
-    return CompositeNode(') ERROR', args)
+def close_parenthesis_evaluator(parser, args):
+    return parser.factory.composite(') ERROR', args)
 
 
-def open_bracket_evaluator(args):
+def open_bracket_evaluator(parser, args):
     if (len(args) == 4
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '['
             and type(args[2]) != SymbolDesc
             and type(args[3]) == SymbolDesc and args[3].symbol == ']'):
-        return CompositeNode('get', [args[0], args[2]])
+        return parser.factory.composite('get', [args[0], args[2]])
     else:
-        return CompositeNode('[ ERROR', args)
+        return parser.factory.composite('[ ERROR', args)
 
 
-def close_bracket_evaluator(args):
-    return CompositeNode('] ERROR', args)
+def close_bracket_evaluator(parser, args):
+    return parser.factory.composite('] ERROR', args)
 
 
-def coma_evaluator(args):
-    return CompositeNode(',', [x for x in args if type(x) != SymbolDesc])
+def coma_evaluator(parser, args):
+    return parser.factory.composite(',', [x for x in args if type(x) != SymbolDesc])
 
 
-def unary_evaluator(args):
+def unary_evaluator(parser, args):
     if len(args) != 2:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
     if type(args[0]) == SymbolDesc and type(args[1]) != SymbolDesc:
-        return CompositeNode(args[0].symbol, [args[1]])
+        return parser.factory.composite(args[0].symbol, [args[1]])
     elif type(args[0]) != SymbolDesc and type(args[1]) == SymbolDesc:
-        return CompositeNode('post'+args[1].symbol, [args[0]])
+        return parser.factory.composite('post'+args[1].symbol, [args[0]])
     else:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
 
 
-def unary_or_binary_evaluator(args):
+def unary_or_binary_evaluator(parser, args):
     if (len(args) == 2
             and type(args[0]) == SymbolDesc
             and type(args[1]) != SymbolDesc):
-        return CompositeNode(args[0].symbol, [args[1]])
+        return parser.factory.composite(args[0].symbol, [args[1]])
     elif (len(args) == 2
           and type(args[0]) != SymbolDesc
           and type(args[1]) == SymbolDesc):
-        return CompositeNode('post'+args[1].symbol, [args[0]])
+        return parser.factory.composite('post'+args[1].symbol, [args[0]])
     elif (len(args) == 3
           and type(args[0]) != SymbolDesc
           and type(args[1]) == SymbolDesc
           and type(args[2]) != SymbolDesc):
-        return CompositeNode(args[1].symbol, [args[0], args[2]])
+        return parser.factory.composite(args[1].symbol, [args[0], args[2]])
     else:
-        return CompositeNode('1,2-ARY ERROR', args)
+        return parser.factory.composite('1,2-ARY ERROR', args)
 
 
-def question_evaluator(args):
+def question_evaluator(parser, args):
     if (len(args) != 5
             or type(args[0]) == SymbolDesc
             or type(args[1]) != SymbolDesc or args[1].symbol != '?'
             or type(args[2]) == SymbolDesc
             or type(args[3]) != SymbolDesc or args[3].symbol != ':'
             or type(args[4]) == SymbolDesc):
-        return CompositeNode('? ERROR', args)
-    return CompositeNode('?', [args[0], args[2], args[4]])
+        return parser.factory.composite('? ERROR', args)
+    return parser.factory.composite('?', [args[0], args[2], args[4]])
+
+
+def colon_evaluator(parser, args):
+    return parser.factory.composite(': ERROR', args)
+
+
+# The signature of a handle, given as a pattern listing the names of its symbols and None for its values: the
+# names of the symbols, and a mask with a bit set for the position of each symbol, above a bit for the length.
+def handle_signature(pattern):
+    mask = 1 << len(pattern)
+    for i, x in enumerate(pattern):
+        if x is not None:
+            mask |= 1 << i
+    return tuple([x for x in pattern if x is not None]), mask
+
+
+# The pattern of a signature as text, E standing for the values
+def handle_pattern(signature):
+    names, mask = signature
+    names = iter(names)
+    return ' '.join(next(names) if mask >> i & 1 else 'E' for i in range(mask.bit_length() - 1))
+
+
+def build_leaf(parser, args):
+    return parser.factory.leaf(args[0].symbol)
+
+
+def build_binary(parser, args):
+    return parser.factory.composite(args[1].symbol, [args[0], args[2]])
+
+
+def build_prefix(parser, args):
+    return parser.factory.composite(args[0].symbol, [args[1]])
+
+
+def build_postfix(parser, args):
+    return parser.factory.composite('post'+args[1].symbol, [args[0]])
+
+
+def build_parenthesis(parser, args):
+    return args[1]
+
+
+def build_empty_call(parser, args):
+    return parser.factory.composite('call', [args[0]])
+
+
+def build_call(parser, args):
+    if args[2].token == ',':
+        return parser.factory.composite('call', [args[0]] + args[2].children)
+    return parser.factory.composite('call', [args[0], args[2]])
+
+
+def build_get(parser, args):
+    return parser.factory.composite('get', [args[0], args[2]])
+
+
+def build_question(parser, args):
+    return parser.factory.composite('?', [args[0], args[2], args[4]])
 
 
-def colon_evaluator(args):
-    return CompositeNode(': ERROR', args)
+# The productions of the evaluators: the pattern of their handle, OPER standing for the symbol of the
+# evaluator, and the builder of their node, which does what the evaluator does for that handle
+OPER = '$oper$'
+productions = {
+    binary_evaluator: [((None, OPER, None), build_binary)],
+    open_parenthesis_evaluator: [(('(', None, ')'), build_parenthesis),
+                                 ((None, '(', ')'), build_empty_call),
+                                 ((None, '(', None, ')'), build_call)],
+    open_bracket_evaluator: [((None, '[', None, ']'), build_get)],
+    coma_evaluator: [((None, ',', None), build_binary)],
+    unary_evaluator: [((OPER, None), build_prefix), ((None, OPER), build_postfix)],
+    unary_or_binary_evaluator: [((OPER, None), build_prefix), ((None, OPER), build_postfix),
+                                ((None, OPER, None), build_binary)],
+    question_evaluator: [((None, '?', None, ':', None), build_question)],
+}
 
 
 def cexp_parser():
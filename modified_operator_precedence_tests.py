@@ -1,5 +1,6 @@
 #! /usr/bin/env python3
 
+import lexer
 import modified_operator_precedence
 import andychu_cexp_tests
 import jmb_cexp_tests
@@ -9,5 +10,60 @@ def check_parsing(s, expected):
     jmb_cexp_tests.check_parsing(modified_operator_precedence.cexp_parser(), s, expected)
 
 
+def parse(parser, s):
+    try:
+        return repr(parser.parse(s))
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+def push_parse(parser, s):
+    context = parser.start()
+    try:
+        for tk in lexer.tokenize(s):
+            context.feed(tk)
+        return repr(context.finish())
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+# Feeding the tokens one by one gives the result of parse, errors included
+def check_push_parsing(s, expected):
+    parser = modified_operator_precedence.cexp_parser()
+    pushed = push_parse(parser, s)
+    parsed = parse(parser, s)
+    if pushed != parsed:
+        print('Failed push parsing: {} => {} != {}'.format(s, pushed, parsed))
+
+
+def push_tests():
+    context = modified_operator_precedence.cexp_parser().start()
+    reduced = [[repr(node) for node in context.feed(tk)] for tk in lexer.tokenize('a * b + c * d - e')]
+    if reduced != [[], [], [], ['(* a b)'], [], [], [], ['(* c d)', '(+ (* a b) (* c d))'], []]:
+        print('Failed push parsing reductions: {}'.format(reduced))
+    if repr(context.finish()) != '(- (+ (* a b) (* c d)) e)':
+        print('Failed push parsing finish')
+
+
+# The reductions are dispatched by handle signature, and counted by pattern
+def reduction_tests():
+    parser = modified_operator_precedence.cexp_parser()
+    counts = parser.count_reductions()
+    parser.parse('f(a, b) * -(c) ? x[1] : y ++')
+    patterns = {modified_operator_precedence.handle_pattern(signature): n for signature, n in counts.items()}
+    expected = {'$id$': 7, 'E , E': 1, 'E ( E )': 1, '( E )': 1,
+                'pre- E': 1, 'E * E': 1, 'E [ E ]': 1, 'E ++': 1, 'E ? E : E': 1}
+    if patterns != expected:
+        print('Failed reduction counts: {}'.format(patterns))
+    # registering a symbol replaces the productions of the previous one
+    parser.register_postsymbol('+', 24, 25, lambda parser, args: parser.factory.composite('plus', args[0::2]))
+    if repr(parser.parse('a + b')) != '(plus a b)':
+        print('Failed reductions after register: {}'.format(parser.parse('a + b')))
+
+
+push_tests()
+reduction_tests()
+andychu_cexp_tests.all(check_push_parsing)
+jmb_cexp_tests.all_tests(check_push_parsing)
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
@@ -1,13 +1,17 @@
 #! /usr/bin/env python3
 
 import sys
+from collections import Counter
 import lexer
-from tree import Node, CompositeNode
+import precedence
+from tree import node_factory
 
 
+# name is the symbol in the signatures of the handles, $id$ for identifiers and numbers
 class SymbolDesc:
-    def __init__(self, symbol, lprio, rprio, evaluator):
+    def __init__(self, symbol, lprio, rprio, evaluator, name=None):
         self.symbol = symbol
+        self.name = symbol if name is None else name
         self.lprio = lprio
         self.rprio = rprio
         self.evaluator = evaluator
@@ -17,81 +21,158 @@ class SymbolDesc:
         return '<Symbol {} {}/{}: {}>'.format(self.symbol, self.lprio, self.rprio, self.value)
 
 
-def identity_evaluator(args):
+def identity_evaluator(parser, args):
     if len(args) == 1 and type(args[0]) == SymbolDesc:
-        return Node(args[0].symbol)
+        return parser.factory.leaf(args[0].symbol)
     else:
-        return CompositeNode('ID ERROR', args)
+        return parser.factory.composite('ID ERROR', args)
 
 
-def binary_evaluator(args):
+def binary_evaluator(parser, args):
     if len(args) != 3 or type(args[0]) == SymbolDesc or type(args[1]) != SymbolDesc or type(args[2]) == SymbolDesc:
-        return CompositeNode('BINARY ERROR', args)
-    return CompositeNode(args[1].symbol, [args[0], args[2]])
+        return parser.factory.composite('BINARY ERROR', args)
+    return parser.factory.composite(args[1].symbol, [args[0], args[2]])
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.symbols = {}
         self.symbols['$soi$'] = SymbolDesc('$soi$', 0, 0, None)
         self.symbols['$eoi$'] = SymbolDesc('$eoi$', 0, 0, None)
-        self.reset()
+        self.words = set()  # the symbols lexed as identifiers
+        self.id_lprio = 1000
+        self.id_rprio = 1000
+        self.reduction_table = None
+        self.reduction_counts = None
 
     def register_symbol(self, oper, lprio, rprio, evaluator=None):
         if evaluator is None:
             evaluator = binary_evaluator
-        if type(oper) is str:
-            self.symbols[oper] = SymbolDesc(oper, lprio, rprio, evaluator)
-        else:
-            for op in oper:
-                self.symbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
+        self.reduction_table = None
+        for op in [oper] if type(oper) is str else oper:
+            self.symbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
+            if lexer.is_word(op):
+                self.words.add(op)
+
+    # The priorities as a full precedence matrix, see precedence.py; identifiers and numbers are $id$
+    def precedence_relations(self):
+        priorities = {symbol: (desc.lprio, desc.rprio) for symbol, desc in self.symbols.items()}
+        priorities['$id$'] = (self.id_lprio, self.id_rprio)
+        return precedence.priority_relations(priorities)
+
+    # Take the priorities of the symbols from table, compiled by precedence.compile_relations
+    def load_precedence(self, table):
+        for symbol in list(self.symbols) + ['$id$']:
+            if symbol not in table:
+                raise RuntimeError('No priority for {}'.format(symbol))
+        for symbol, desc in self.symbols.items():
+            desc.lprio = table.lprio(symbol)
+            desc.rprio = table.rprio(symbol)
+        self.id_lprio = table.lprio('$id$')
+        self.id_rprio = table.rprio('$id$')
+        return self
+
+    # The builders of the productions of the evaluators of the symbols, by handle signature.  A production is
+    # only used for the symbol starting it, the one whose evaluator would be called for its handle.
+    def reductions(self):
+        if self.reduction_table is None:
+            table = {handle_signature(('$id$',)): build_leaf}
+            for symbol, desc in self.symbols.items():
+                for pattern, builder in productions.get(desc.evaluator, []):
+                    pattern = tuple(symbol if x == OPER else x for x in pattern)
+                    if [x for x in pattern if x is not None][0] == symbol:
+                        table[handle_signature(pattern)] = builder
+            self.reduction_table = table
+        return self.reduction_table
+
+    # Count the reductions of the following parses by handle signature, see handle_pattern
+    def count_reductions(self):
+        self.reduction_counts = Counter()
+        return self.reduction_counts
 
-    def reset(self):
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+
+# The stack of one parse.  The Parser only holds the symbol table, which parsing does not modify, so it can
+# be shared between threads; the evaluators are given the context as their parser.
+#
+# terminals holds the indexes in stack of its symbols, so the top symbol and the start of the handle are
+# found without looking at the values, and a reduction only touches the handle: the cost of a parse is
+# linear in the number of tokens, even when the stack grows as deep as the input.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.symbols = parser.symbols
+        self.words = parser.words
+        self.id_lprio = parser.id_lprio
+        self.id_rprio = parser.id_rprio
+        self.reductions = parser.reductions()
+        self.reduction_counts = parser.reduction_counts
         self.stack = [self.symbols['$soi$']]
+        self.terminals = [0]
 
     def id_symbol(self, id):
-        return SymbolDesc(id, 1000, 1000, identity_evaluator)
+        return SymbolDesc(id, self.id_lprio, self.id_rprio, identity_evaluator, '$id$')
 
+    # The handle starts after the last symbol whose right priority differs from the left priority of the
+    # next one.  Its signature is computed from the positions of its symbols and selects the builder of its
+    # production; the evaluator of its first symbol handles the others, errors included.
     def evaluate(self):
-        idx = len(self.stack)-1
-        if type(self.stack[idx]) != SymbolDesc:
-            idx -= 1
-        curprio = self.stack[idx].lprio
-        while type(self.stack[idx-1]) != SymbolDesc or self.stack[idx-1].rprio == curprio:
-            idx -= 1
-            if type(self.stack[idx]) == SymbolDesc:
-                curprio = self.stack[idx].lprio
-        args = self.stack[idx:]
-        self.stack = self.stack[:idx]
+        stack = self.stack
+        terminals = self.terminals
+        top = len(terminals) - 1
+        curprio = stack[terminals[top]].lprio
+        while top > 1 and stack[terminals[top-1]].rprio == curprio:
+            top -= 1
+            curprio = stack[terminals[top]].lprio
+        idx = terminals[top-1] + 1
+        mask = 1 << (len(stack) - idx)
+        for i in terminals[top:]:
+            mask |= 1 << (i - idx)
+        signature = (tuple([stack[i].name for i in terminals[top:]]), mask)
+        args = stack[idx:]
+        del stack[idx:]
+        del terminals[top:]
+        if self.reduction_counts is not None:
+            self.reduction_counts[signature] += 1
+        builder = self.reductions.get(signature)
+        if builder is not None:
+            stack.append(builder(self, args))
+            return
         for i in args:
             if type(i) == SymbolDesc:
-                self.stack.append(i.evaluator(args))
+                stack.append(i.evaluator(self, args))
                 return
         raise RuntimeError('Internal error: no evaluator found in {}'.format(args))
 
     def tos_symbol(self):
-        idx = len(self.stack)-1
-        if type(self.stack[idx]) != SymbolDesc:
-            idx -= 1
-        return self.stack[idx]
+        return self.stack[self.terminals[-1]]
 
     def shift(self, sym):
-        while self.tos_symbol().rprio > sym.lprio:
+        while self.stack[self.terminals[-1]].rprio > sym.lprio:
             self.evaluate()
+        self.terminals.append(len(self.stack))
         self.stack.append(sym)
 
     def push_eoi(self):
         self.shift(self.symbols['$eoi$'])
 
     def parse(self, s):
-        self.reset()
+        # the identifiers are operands unless the grammar has words such as 'and' and they are one, the lexem
+        # of the other operands is not read
         for tk in lexer.tokenize(s):
-            if tk.lexem in self.symbols:
-                self.shift(self.symbols[tk.lexem])
-            elif tk.kind == 'ID':
+            if tk.kind == lexer.ID and not (self.words and tk.lexem in self.words):
                 self.shift(self.id_symbol(tk))
-            elif tk.kind == 'NUMBER':
+            elif tk.kind == lexer.NUMBER:
                 self.shift(self.id_symbol(tk))
+            elif tk.lexem in self.symbols:
+                self.shift(self.symbols[tk.lexem])
             else:
                 raise RuntimeError('Unexpected symbol: {}'.format(tk))
         self.push_eoi()
@@ -105,7 +186,7 @@ class Parser:
             print('   {}'.format(oper))
 
 
-def open_parenthesis_evaluator(args):
+def open_parenthesis_evaluator(parser, args):
     if (len(args) == 3
             and type(args[0]) == SymbolDesc and args[0].symbol == '('
             and type(args[1]) != SymbolDesc
@@ -115,80 +196,151 @@ def open_parenthesis_evaluator(args):
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) == SymbolDesc and args[2].symbol == ')'):
-        return CompositeNode('call', [args[0]])
+        return parser.factory.composite('call', [args[0]])
     elif (len(args) == 4
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) != SymbolDesc
             and type(args[3]) == SymbolDesc and args[3].symbol == ')'):
         if args[2].token == ',':
-            callargs = args[2].children
+            callargs = [args[0]] + args[2].children
         else:
-            callargs = [args[2]]
-        callargs.insert(0, args[0])
-        return CompositeNode('call', callargs)
+            callargs = [args[0], args[2]]
+        return parser.factory.composite('call', callargs)
     else:
-        return CompositeNode('( ERROR', args)
+        return parser.factory.composite('( ERROR', args)
 
 
-def close_parenthesis_evaluator(args):
-    return CompositeNode(') ERROR', args)
+def close_parenthesis_evaluator(parser, args):
+    return parser.factory.composite(') ERROR', args)
 
 
-def open_bracket_evaluator(args):
-    return CompositeNode('get', [args[0], args[2]])
+def open_bracket_evaluator(parser, args):
+    return parser.factory.composite('get', [args[0], args[2]])
 
 
-def close_bracket_evaluator(args):
-    return CompositeNode('] ERROR', args)
+def close_bracket_evaluator(parser, args):
+    return parser.factory.composite('] ERROR', args)
 
 
-def coma_evaluator(args):
-    return CompositeNode(',', [x for x in args if type(x) != SymbolDesc])
+def coma_evaluator(parser, args):
+    return parser.factory.composite(',', [x for x in args if type(x) != SymbolDesc])
 
 
-def unary_evaluator(args):
+def unary_evaluator(parser, args):
     if len(args) != 2:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
     if type(args[0]) == SymbolDesc and type(args[1]) != SymbolDesc:
-        return CompositeNode(args[0].symbol, [args[1]])
+        return parser.factory.composite(args[0].symbol, [args[1]])
     elif type(args[0]) != SymbolDesc and type(args[1]) == SymbolDesc:
-        return CompositeNode('post'+args[1].symbol, [args[0]])
+        return parser.factory.composite('post'+args[1].symbol, [args[0]])
     else:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
 
 
-def unary_or_binary_evaluator(args):
+def unary_or_binary_evaluator(parser, args):
     if (len(args) == 2
             and type(args[0]) == SymbolDesc
             and type(args[1]) != SymbolDesc):
-        return CompositeNode(args[0].symbol, [args[1]])
+        return parser.factory.composite(args[0].symbol, [args[1]])
     elif (len(args) == 2
           and type(args[0]) != SymbolDesc
           and type(args[1]) == SymbolDesc):
-        return CompositeNode('post'+args[1].symbol, [args[0]])
+        return parser.factory.composite('post'+args[1].symbol, [args[0]])
     elif (len(args) == 3
           and type(args[0]) != SymbolDesc
           and type(args[1]) == SymbolDesc
           and type(args[2]) != SymbolDesc):
-        return CompositeNode(args[1].symbol, [args[0], args[2]])
+        return parser.factory.composite(args[1].symbol, [args[0], args[2]])
     else:
-        return CompositeNode('1,2-ARY ERROR', args)
+        return parser.factory.composite('1,2-ARY ERROR', args)
 
 
-def question_evaluator(args):
+def question_evaluator(parser, args):
     if (len(args) != 5
             or type(args[0]) == SymbolDesc
             or type(args[1]) != SymbolDesc or args[1].symbol != '?'
             or type(args[2]) == SymbolDesc
             or type(args[3]) != SymbolDesc or args[3].symbol != ':'
             or type(args[4]) == SymbolDesc):
-        return CompositeNode('? ERROR', args)
-    return CompositeNode('?', [args[0], args[2], args[4]])
+        return parser.factory.composite('? ERROR', args)
+    return parser.factory.composite('?', [args[0], args[2], args[4]])
+
+
+def colon_evaluator(parser, args):
+    return parser.factory.composite(': ERROR', args)
+
+
+# The signature of a handle, given as a pattern listing the names of its symbols and None for its values: the
+# names of the symbols, and a mask with a bit set for the position of each symbol, above a bit for the length.
+def handle_signature(pattern):
+    mask = 1 << len(pattern)
+    for i, x in enumerate(pattern):
+        if x is not None:
+            mask |= 1 << i
+    return tuple([x for x in pattern if x is not None]), mask
+
+
+# The pattern of a signature as text, E standing for the values
+def handle_pattern(signature):
+    names, mask = signature
+    names = iter(names)
+    return ' '.join(next(names) if mask >> i & 1 else 'E' for i in range(mask.bit_length() - 1))
+
+
+def build_leaf(parser, args):
+    return parser.factory.leaf(args[0].symbol)
+
+
+def build_binary(parser, args):
+    return parser.factory.composite(args[1].symbol, [args[0], args[2]])
+
+
+def build_prefix(parser, args):
+    return parser.factory.composite(args[0].symbol, [args[1]])
+
+
+def build_postfix(parser, args):
+    return parser.factory.composite('post'+args[1].symbol, [args[0]])
+
+
+def build_parenthesis(parser, args):
+    return args[1]
+
+
+def build_empty_call(parser, args):
+    return parser.factory.composite('call', [args[0]])
+
+
+def build_call(parser, args):
+    if args[2].token == ',':
+        return parser.factory.composite('call', [args[0]] + args[2].children)
+    return parser.factory.composite('call', [args[0], args[2]])
+
+
+def build_get(parser, args):
+    return parser.factory.composite('get', [args[0], args[2]])
+
+
+def build_question(parser, args):
+    return parser.factory.composite('?', [args[0], args[2], args[4]])
 
 
-def colon_evaluator(args):
-    return CompositeNode(': ERROR', args)
+# The productions of the evaluators: the pattern of their handle, OPER standing for the symbol of the
+# evaluator, and the builder of their node, which does what the evaluator does for that handle
+OPER = '$oper$'
+productions = {
+    binary_evaluator: [((None, OPER, None), build_binary)],
+    open_parenthesis_evaluator: [(('(', None, ')'), build_parenthesis),
+                                 ((None, '(', ')'), build_empty_call),
+                                 ((None, '(', None, ')'), build_call)],
+    open_bracket_evaluator: [((None, '[', None, ']'), build_get)],
+    coma_evaluator: [((None, ',', None), build_binary)],
+    unary_evaluator: [((OPER, None), build_prefix), ((None, OPER), build_postfix)],
+    unary_or_binary_evaluator: [((OPER, None), build_prefix), ((None, OPER), build_postfix),
+                                ((None, OPER, None), build_binary)],
+    question_evaluator: [((None, '?', None, ':', None), build_question)],
+}
 
 
 def cexp_parser():
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 
 import operator_precedence
+import tree
 import andychu_cexp_tests
 import jmb_cexp_tests
 
@@ -9,5 +10,44 @@ def check_parsing(s, expected):
     jmb_cexp_tests.check_parsing(operator_precedence.cexp_parser(), s, expected)
 
 
+# Inputs making the stack as deep as the input, reduced handle by handle at the end
+def deep_tests(n=100000):
+    parser = operator_precedence.cexp_parser()
+    for s, expected in [(' = '.join(['a'] * n), '(= a ' * (n - 1) + 'a' + ')' * (n - 1)),
+                        ('(' * n + 'a' + ')' * n, 'a'),
+                        ('a ** ' * n + '(b, c)', '(** a ' * n + '(, b c)' + ')' * n)]:
+        sexpr = tree.sexp(parser.parse(s))
+        if sexpr != expected:
+            print('Failed deep parse: {}... => {}...'.format(s[:20], sexpr[:40]))
+
+
+# The reductions are dispatched by handle signature, and counted by pattern
+def reduction_tests():
+    parser = operator_precedence.cexp_parser()
+    counts = parser.count_reductions()
+    parser.parse('f(a, b) * (c) ? x[1] : y ++')
+    patterns = {operator_precedence.handle_pattern(signature): n for signature, n in counts.items()}
+    expected = {'$id$': 7, 'E , E': 1, 'E ( E )': 1,
+                '( E )': 1, 'E * E': 1, 'E [ E ]': 1, 'E ++': 1, 'E ? E : E': 1}
+    if patterns != expected:
+        print('Failed reduction counts: {}'.format(patterns))
+    # registering a symbol replaces the productions of the previous one
+    parser.register_symbol('+', 24, 25, lambda parser, args: parser.factory.composite('plus', args[0::2]))
+    if repr(parser.parse('a + b')) != '(plus a b)':
+        print('Failed reductions after register: {}'.format(parser.parse('a + b')))
+
+
+# Symbols spelled like identifiers are symbols, not operands
+def word_tests():
+    parser = operator_precedence.cexp_parser()
+    parser.register_symbol('and', 8, 9)
+    for s, expected in [('a and b', '(and a b)'), ('a + b and c * d', '(and (+ a b) (* c d))')]:
+        if repr(parser.parse(s)) != expected:
+            print('Failed word symbol: {} => {} != {}'.format(s, parser.parse(s), expected))
+
+
+deep_tests()
+reduction_tests()
+word_tests()
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
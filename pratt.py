@@ -1,8 +1,10 @@
 #! /usr/bin/env python3
 
 import sys
+import types
 import lexer
-from tree import Node, CompositeNode
+import evaluation
+from tree import CompositeNode, node_factory
 
 
 class SymbolDesc:
@@ -16,194 +18,378 @@ class SymbolDesc:
         return '<Symbol {} {}/{}>'.format(self.token.lexem, self.lprio, self.rprio)
 
 
+# The evaluators parsing operands are generators, run by steps_evaluator or IterativeParseContext: they yield
+# the priority given to parse_to and receive the tree it returns, their return value being the tree of the
+# evaluator.  evaluator_steps gives the generator of each evaluator defined with steps_evaluator.
+evaluator_steps = {}
+
+
+# The evaluator running steps with parse_to, each operand being parsed by a recursive call
+def steps_evaluator(steps):
+    def evaluator(parser, *args):
+        run = steps(parser, *args)
+        tree = None
+        try:
+            while True:
+                tree = parser.parse_to(run.send(tree))
+        except StopIteration as stop:
+            return stop.value
+    evaluator.__name__ = steps.__name__.replace('_steps', '_evaluator')
+    evaluator_steps[evaluator] = steps
+    return evaluator
+
+
+# The literals share their symbol, the token is the one just consumed
 def identity_evaluator(parser, sym):
-    result = Node(sym.token)
+    result = parser.factory.leaf(parser.prev_token)
     return result
 
 
-def unary_prefix_evaluator(parser, sym):
-    arg = parser.parse_to(sym.rprio)
+def unary_prefix_steps(parser, sym):
+    arg = yield sym.rprio
     if arg is None:
-        return CompositeNode(sym.token, [Node(lexer.Token('ERROR', 'MISSING VALUE'))])
+        return parser.factory.composite(sym.token, [parser.factory.leaf(lexer.Token(lexer.ERROR, 'MISSING VALUE'))])
     else:
-        return CompositeNode(sym.token, [arg])
+        return parser.factory.composite(sym.token, [arg])
 
 
-def binary_evaluator(parser, left_arg, sym):
-    right_arg = parser.parse_to(sym.rprio)
+unary_prefix_evaluator = steps_evaluator(unary_prefix_steps)
+
+
+def binary_steps(parser, left_arg, sym):
+    right_arg = yield sym.rprio
     if right_arg is None:
-        return CompositeNode(sym.token, [left_arg, Node(lexer.Token('ERROR', 'MISSING VALUE'))])
+        missing = parser.factory.leaf(lexer.Token(lexer.ERROR, 'MISSING VALUE'))
+        return parser.factory.composite(sym.token, [left_arg, missing])
     else:
-        return CompositeNode(sym.token, [left_arg, right_arg])
+        return parser.factory.composite(sym.token, [left_arg, right_arg])
+
+
+binary_evaluator = steps_evaluator(binary_steps)
 
 
 def unary_postfix_evaluator(parser, left_arg, sym):
-    return CompositeNode('post' + sym.token, [left_arg])
+    return parser.factory.composite('post' + sym.token, [left_arg])
+
+
+# The symbols of identifiers and numbers, by token kind, and of juxtaposed values.  They do not depend on the
+# token, so they are allocated once.
+literal_symbols = {lexer.ID: SymbolDesc('ID', None, None, identity_evaluator),
+                   lexer.NUMBER: SymbolDesc('NUMBER', None, None, identity_evaluator)}
+missing_operator = SymbolDesc('MISSING OPERATOR', 1000, 1000, binary_evaluator)
 
 
 class Parser:
     def __init__(self):
-        self.lexer = None
-        self.cur_token = None
+        self.factory = node_factory
         self.presymbols = {}
         self.postsymbols = {}
+        self.words = set()  # the symbols lexed as identifiers
 
     def register_presymbol(self, oper, rprio, evaluator=unary_prefix_evaluator):
-        if type(oper) is str:
-            self.presymbols[oper] = SymbolDesc(oper, None, rprio, evaluator)
-        else:
-            for op in oper:
-                self.presymbols[op] = SymbolDesc(op, None, rprio, evaluator)
+        for op in [oper] if type(oper) is str else oper:
+            self.presymbols[op] = SymbolDesc(op, None, rprio, evaluator)
+            if lexer.is_word(op):
+                self.words.add(op)
 
     def register_postsymbol(self, oper, lprio, rprio, evaluator=binary_evaluator):
-        if type(oper) is str:
-            self.postsymbols[oper] = SymbolDesc(oper, lprio, rprio, evaluator)
-        else:
-            for op in oper:
-                self.postsymbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
+        for op in [oper] if type(oper) is str else oper:
+            self.postsymbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
+            if lexer.is_word(op):
+                self.words.add(op)
 
-    def reset(self, s):
-        self.lexer = lexer.tokenize(s)
-        self.advance()
+    def parse(self, s):
+        if isinstance(s, lexer.OperatorTokenBuffer):
+            return OperatorParseContext(self, s.operator_lexer).parse(s)
+        return ParseContext(self).parse(s)
+
+    # Compute the value of s while parsing it, without building its tree, see evaluation.py: bindings gives the
+    # values of the identifiers and semantics the function computing each operator.
+    def evaluate(self, s, bindings, semantics=evaluation.c_semantics):
+        context = ParseContext(self)
+        context.factory = evaluation.ValueFactory(bindings, semantics)
+        return evaluation.value(context.parse(s))
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+    # Parse s with the explicit stack of IterativeParseContext, whatever its nesting depth; the tree is the
+    # one of parse
+    def parse_iterative(self, s):
+        return IterativeParseContext(self).parse(s)
+
+
+# Lexer and current token of one parse.  They used to be attributes of the Parser, which made it unusable
+# from several threads at once; the Parser is now only read while parsing.  Evaluators get the context
+# as their parser, with parse_to and advance.
+#
+# advance looks the new token up once, as prefix and as postfix symbol; prev_token is the token it consumed.
+# Identifiers are operands, and postfix symbols when the grammar has words such as 'and' and they are one.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.presymbols = parser.presymbols
+        self.postsymbols = parser.postsymbols
+        self.words = parser.words
+        self.lexer = None
+        self.cur_token = None
+        self.prev_token = None
+        self.cur_prefix = None
+        self.cur_postfix = None
 
     def advance(self):
+        self.prev_token = self.cur_token
         try:
-            self.cur_token = self.lexer.__next__()
+            tk = self.lexer.__next__()
         except StopIteration:
             self.cur_token = None
+            self.cur_prefix = None
+            self.cur_postfix = None
+            return
+        self.cur_token = tk
+        # only the operators and words are looked up by lexem, the lexem of other operands is not read
+        kind = tk.kind
+        if kind == lexer.OPER or kind == lexer.SYNT:
+            lexem = tk.lexem
+            self.cur_prefix = self.presymbols.get(lexem)
+            self.cur_postfix = self.postsymbols.get(lexem)
+        elif kind == lexer.ID and self.words and tk.lexem in self.words:
+            self.cur_prefix = literal_symbols[kind]
+            self.cur_postfix = self.postsymbols.get(tk.lexem)
+        else:
+            self.cur_prefix = literal_symbols.get(kind)
+            self.cur_postfix = None
 
     def prefix_sym(self):
-        if self.cur_token is None:
-            return None
-        elif self.cur_token.kind == 'ID':
-            return SymbolDesc(self.cur_token, None, None, identity_evaluator)
-        elif self.cur_token.kind == 'NUMBER':
-            return SymbolDesc(self.cur_token, None, None, identity_evaluator)
-        elif self.cur_token.lexem in self.presymbols:
-            return self.presymbols[self.cur_token.lexem]
-        else:
-            return None
+        return self.cur_prefix
 
     def postfix_sym(self):
-        if self.cur_token is None:
-            return None
-        elif self.cur_token.lexem in self.postsymbols:
-            return self.postsymbols[self.cur_token.lexem]
-        else:
-            return None
+        return self.cur_postfix
 
     def parse_to(self, prio):
-        sym = self.prefix_sym()
+        sym = self.cur_prefix
         if sym is None:
-            sym = self.postfix_sym()
-            if sym is None:
+            if self.cur_postfix is None:
                 return None
-            node = Node(lexer.Token('ERROR', 'MISSING VALUE'))
+            node = self.factory.leaf(lexer.Token(lexer.ERROR, 'MISSING VALUE'))
         else:
             self.advance()
             node = sym.evaluator(self, sym)
         while True:
-            sym = self.postfix_sym()
-            if sym is None or prio >= sym.lprio:
-                if sym is None:
-                    sym = self.prefix_sym()
-                    if sym is not None:
-                        sym = SymbolDesc('MISSING OPERATOR', 1000, 1000, binary_evaluator)
-                if sym is None or prio >= sym.lprio:
+            sym = self.cur_postfix
+            if sym is None:
+                if self.cur_prefix is None or prio >= 1000:
                     break
+                sym = missing_operator
+            elif prio >= sym.lprio:
+                break
             else:
                 self.advance()
             node = sym.evaluator(self, node, sym)
         return node
 
     def parse(self, s):
-        self.reset(s)
+        self.lexer = lexer.tokenize(s)
+        self.advance()
         res = self.parse_to(0)
         if self.cur_token is not None:
-            res = CompositeNode('REMAINING INPUT', [res, self.cur_token])
+            res = self.factory.composite('REMAINING INPUT', [res, self.cur_token])
         return res
 
 
-def prefix_open_parenthesis_evaluator(parser, sym):
-    result = parser.parse_to(sym.rprio)
+# A ParseContext for the buffers of an operator lexer, see lexer.operator_lexer: the symbols of the tokens with
+# an operator id are taken by id from the symbol tables resolved by the lexer, the others are looked up as in
+# ParseContext.
+class OperatorParseContext(ParseContext):
+    def __init__(self, parser, operator_lexer):
+        ParseContext.__init__(self, parser)
+        self.presymbol_ids = operator_lexer.resolve(parser.presymbols)
+        self.postsymbol_ids = operator_lexer.resolve(parser.postsymbols)
+
+    def advance(self):
+        self.prev_token = self.cur_token
+        try:
+            tk = self.lexer.__next__()
+        except StopIteration:
+            self.cur_token = None
+            self.cur_prefix = None
+            self.cur_postfix = None
+            return
+        self.cur_token = tk
+        kind = tk.kind
+        if type(tk) is lexer.OperatorToken:
+            self.cur_prefix = self.presymbol_ids[tk.oper]
+            self.cur_postfix = self.postsymbol_ids[tk.oper]
+        elif kind == lexer.OPER or kind == lexer.SYNT:
+            lexem = tk.lexem
+            self.cur_prefix = self.presymbols.get(lexem)
+            self.cur_postfix = self.postsymbols.get(lexem)
+        elif kind == lexer.ID and self.words and tk.lexem in self.words:
+            self.cur_prefix = literal_symbols[kind]
+            self.cur_postfix = self.postsymbols.get(tk.lexem)
+        else:
+            self.cur_prefix = literal_symbols.get(kind)
+            self.cur_postfix = None
+
+
+# Whether the current token is the syntax token lexem; the lexem of an operand is not read
+def at_synt(parser, lexem):
+    tk = parser.cur_token
+    return tk is not None and tk.kind == lexer.SYNT and tk.lexem == lexem
+
+
+def prefix_open_parenthesis_steps(parser, sym):
+    result = yield sym.rprio
     if parser.cur_token is not None:
-        if parser.cur_token.lexem == ')':
+        if at_synt(parser, ')'):
             parser.advance()
-            return result
-        elif parser.cur_token.lexem == ']':
+            return parser.factory.parenthesized(result)
+        elif at_synt(parser, ']'):
             parser.advance()
-            return CompositeNode('(] ERROR', [result])
+            return parser.factory.composite('(] ERROR', [result])
     else:
-        return CompositeNode('( ERROR', [result])
+        return parser.factory.composite('( ERROR', [result])
+
 
+prefix_open_parenthesis_evaluator = steps_evaluator(prefix_open_parenthesis_steps)
 
-def postfix_open_parenthesis_evaluator(parser, left_arg, sym):
-    if parser.cur_token is not None and parser.cur_token.lexem == ')':
+
+def postfix_open_parenthesis_steps(parser, left_arg, sym):
+    if at_synt(parser, ')'):
         parser.advance()
-        return CompositeNode('call '+str(left_arg), [])
+        return parser.factory.composite('call', [left_arg])
     else:
-        result = parser.parse_to(sym.rprio)
+        result = yield sym.rprio
         if parser.cur_token is not None:
-            if parser.cur_token.lexem == ')':
+            if isinstance(result, CompositeNode) and result.token == ',':
+                args = [left_arg] + result.children
+            else:
+                args = [left_arg, result]
+            if at_synt(parser, ')'):
                 parser.advance()
-                if result.token == ',':
-                    return CompositeNode('call ' + str(left_arg), result.children)
-                else:
-                    return CompositeNode('call ' + str(left_arg), [result])
-            elif parser.cur_token.lexem == ']':
+                return parser.factory.composite('call', args)
+            elif at_synt(parser, ']'):
                 parser.advance()
-                if result.token == ',':
-                    return CompositeNode('call (] ' + str(left_arg), result.children)
-                else:
-                    return CompositeNode('call (] ' + str(left_arg), [result])
+                return parser.factory.composite('call (]', args)
+
+        return parser.factory.composite('( ERROR', [result])
+
 
-        return CompositeNode('( ERROR', [result])
+postfix_open_parenthesis_evaluator = steps_evaluator(postfix_open_parenthesis_steps)
 
 
 def postfix_close_parenthesis_evaluator(parser, left_arg, sym):
-    return CompositeNode(') ERROR', [left_arg])
+    return parser.factory.composite(') ERROR', [left_arg])
 
 
-def postfix_open_bracket_evaluator(parser, left_arg, sym):
-    result = parser.parse_to(sym.rprio)
+def postfix_open_bracket_steps(parser, left_arg, sym):
+    result = yield sym.rprio
     if parser.cur_token is not None:
-        if parser.cur_token.lexem == ']':
+        if at_synt(parser, ']'):
             parser.advance()
-            return CompositeNode('get ' + str(left_arg), [result])
-        elif parser.cur_token.lexem == ')':
+            return parser.factory.composite('get', [left_arg, result])
+        elif at_synt(parser, ')'):
             parser.advance()
-            return CompositeNode('get [) ' + str(left_arg), [result])
-    return CompositeNode('[ ERROR', [left_arg, result])
+            return parser.factory.composite('get [)', [left_arg, result])
+    return parser.factory.composite('[ ERROR', [left_arg, result])
+
+
+postfix_open_bracket_evaluator = steps_evaluator(postfix_open_bracket_steps)
 
 
 def postfix_close_bracket_evaluator(parser, left_arg, sym):
-    return CompositeNode('] ERROR', [left_arg])
+    return parser.factory.composite('] ERROR', [left_arg])
 
 
-def coma_evaluator(parser, left_arg, sym):
+def coma_steps(parser, left_arg, sym):
     args = [left_arg]
     while True:
-        args.append(parser.parse_to(sym.rprio))
+        args.append((yield sym.rprio))
         sym = parser.postfix_sym()
         if sym is None or sym.token != ',':
             break
         parser.advance()
-    return CompositeNode(',', args)
+    return parser.factory.composite(',', args)
+
+
+coma_evaluator = steps_evaluator(coma_steps)
 
 
-def question_evaluator(parser, left_arg, sym):
-    true_exp = parser.parse_to(sym.rprio)
+def question_steps(parser, left_arg, sym):
+    true_exp = yield sym.rprio
     sym = parser.postfix_sym()
     if sym is not None and sym.token == ':':
         parser.advance()
-        false_exp = parser.parse_to(sym.rprio)
-        return CompositeNode('?', [left_arg, true_exp, false_exp])
+        false_exp = yield sym.rprio
+        return parser.factory.composite('?', [left_arg, true_exp, false_exp])
     else:
-        return CompositeNode('? ERROR', [left_arg, true_exp])
+        return parser.factory.composite('? ERROR', [left_arg, true_exp])
+
+
+question_evaluator = steps_evaluator(question_steps)
 
 
 def colon_evaluator(parser, left_arg, sym):
-    return CompositeNode(': ERROR', [left_arg])
+    return parser.factory.composite(': ERROR', [left_arg])
+
+
+# A ParseContext whose parse_to does not recurse, so that the nesting of the input is limited by the memory
+# and not by the recursion limit.  The loop of parse_to is a generator, parse_steps, yielding the priority of
+# each operand to parse as the generators of evaluator_steps do; parse_to runs it, keeping the suspended
+# generators on a list, each one waiting for the tree of a parse_steps started above it.  The evaluators
+# without steps are called as they are, their own calls to parse_to having a stack of their own.
+class IterativeParseContext(ParseContext):
+    def parse_steps(self, prio):
+        sym = self.cur_prefix
+        if sym is None:
+            if self.cur_postfix is None:
+                return None
+            node = self.factory.leaf(lexer.Token(lexer.ERROR, 'MISSING VALUE'))
+        else:
+            self.advance()
+            steps = evaluator_steps.get(sym.evaluator)
+            if steps is None:
+                node = sym.evaluator(self, sym)
+            else:
+                node = yield steps(self, sym)
+        while True:
+            sym = self.cur_postfix
+            if sym is None:
+                if self.cur_prefix is None or prio >= 1000:
+                    break
+                sym = missing_operator
+            elif prio >= sym.lprio:
+                break
+            else:
+                self.advance()
+            steps = evaluator_steps.get(sym.evaluator)
+            if steps is None:
+                node = sym.evaluator(self, node, sym)
+            else:
+                node = yield steps(self, node, sym)
+        return node
+
+    # The generators yield either the priority of an operand or, for parse_steps, the generator of an evaluator
+    def parse_to(self, prio):
+        stack = []
+        steps = self.parse_steps(prio)
+        value = None
+        while True:
+            try:
+                request = steps.send(value)
+            except StopIteration as stop:
+                if not stack:
+                    return stop.value
+                steps = stack.pop()
+                value = stop.value
+                continue
+            stack.append(steps)
+            if type(request) is types.GeneratorType:
+                steps = request
+            else:
+                steps = self.parse_steps(request)
+            value = None
 
 
 def cexp_parser():
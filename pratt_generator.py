@@ -0,0 +1,248 @@
+#! /usr/bin/env python3
+# Generation of a Python module specialized for the grammar of a pratt.Parser.  The generated parse_to
+# dispatches with a dict giving the group of each symbol and a tree of tests on the group number, with
+# the binding powers as constants, and inlines the usual evaluators of pratt.py: identifiers and numbers,
+# prefix, binary and postfix operators.  The other evaluators are called as by pratt.ParseContext, the
+# generated context having the same interface.
+#
+# The source depends only on the priorities and on which symbols have their evaluator inlined, whose hash
+# names the module in a cache directory: a grammar is generated once and then imported.  The directory is
+# private to the user, and a cached module is imported only when it is the source generated for the grammar,
+# so that a file planted or modified by someone else is never executed.
+
+import hashlib
+import importlib.util
+import os
+import stat
+import sys
+import tempfile
+import evaluation
+import pratt
+
+VERSION = 1
+
+# advance inlined, tk being the current token
+ADVANCE = ['self.prev_token = tk', 'self.cur_token = next(self.lexer, None)']
+
+# The evaluators inlined by the generated code, by kind
+inlined_evaluators = {
+    pratt.unary_prefix_evaluator: 'prefix',
+    pratt.binary_evaluator: 'binary',
+    pratt.unary_postfix_evaluator: 'postfix',
+}
+
+# Modules loaded by this process, by hash
+loaded_modules = {}
+
+
+# The groups of symbols with the same code: (kind, lprio, rprio) and the list of their lexems.  Symbols whose
+# evaluator is not inlined only share their group with those having the same lprio.
+def symbol_groups(symbols):
+    groups = {}
+    for lexem, desc in sorted(symbols.items()):
+        kind = inlined_evaluators.get(desc.evaluator, 'evaluator')
+        key = (kind, desc.lprio, desc.rprio if kind != 'evaluator' else None)
+        groups.setdefault(key, []).append(lexem)
+    return sorted(groups.items(), key=lambda group: (group[0][1] or 0, repr(group[0])))
+
+
+def grammar_hash(parser):
+    description = repr((VERSION, symbol_groups(parser.presymbols), symbol_groups(parser.postsymbols)))
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+# Lines testing g against the groups first to last, as a balanced tree of comparisons, each group being
+# given by the lines of its code
+def dispatch_tree(codes, first, last, indent):
+    if first == last:
+        return [indent + line for line in codes[first]]
+    middle = (first + last + 1) // 2
+    return ([indent + 'if g < {}:'.format(middle)]
+            + dispatch_tree(codes, first, middle - 1, indent + '    ')
+            + [indent + 'else:']
+            + dispatch_tree(codes, middle, last, indent + '    '))
+
+
+def prefix_code(group):
+    (kind, lprio, rprio), lexems = group
+    if kind == 'prefix':
+        return ['# {}'.format(' '.join(lexems)),
+                *ADVANCE,
+                'arg = self.parse_to({!r})'.format(rprio),
+                'if arg is None:',
+                '    arg = factory.leaf(Token(ERROR, \'MISSING VALUE\'))',
+                'node = factory.composite(tk.lexem, [arg])']
+    return ['# {}'.format(' '.join(lexems)),
+            *ADVANCE,
+            'sym = self.presymbols[tk.lexem]',
+            'node = sym.evaluator(self, sym)']
+
+
+def postfix_code(group):
+    (kind, lprio, rprio), lexems = group
+    code = ['# {}'.format(' '.join(lexems)),
+            'if prio >= {!r}:'.format(lprio),
+            '    break',
+            *ADVANCE]
+    if kind == 'binary':
+        code += ['right = self.parse_to({!r})'.format(rprio),
+                 'if right is None:',
+                 '    right = factory.leaf(Token(ERROR, \'MISSING VALUE\'))',
+                 'node = factory.composite(tk.lexem, [node, right])']
+    elif kind == 'postfix':
+        code += ['node = factory.composite(\'post\' + tk.lexem, [node])']
+    else:
+        code += ['sym = self.postsymbols[tk.lexem]',
+                 'node = sym.evaluator(self, node, sym)']
+    return code
+
+
+def generate_source(parser):
+    prefix_groups = symbol_groups(parser.presymbols)
+    postfix_groups = symbol_groups(parser.postsymbols)
+    prefix_numbers = {lexem: i for i, (key, lexems) in enumerate(prefix_groups) for lexem in lexems}
+    postfix_numbers = {lexem: i for i, (key, lexems) in enumerate(postfix_groups) for lexem in lexems}
+    lines = ['# Generated by pratt_generator.py for the grammar {}, do not edit.'.format(grammar_hash(parser)),
+             '',
+             'import lexer',
+             'import pratt',
+             'from lexer import Token, ID, NUMBER, ERROR',
+             '',
+             'prefix_groups = {!r}'.format(prefix_numbers),
+             'postfix_groups = {!r}'.format(postfix_numbers),
+             '',
+             '',
+             'class ParseContext(pratt.ParseContext):',
+             '    def advance(self):',
+             '        self.prev_token = self.cur_token',
+             '        self.cur_token = next(self.lexer, None)',
+             '',
+             '    def prefix_sym(self):',
+             '        tk = self.cur_token',
+             '        if tk is None:',
+             '            return None',
+             '        return pratt.literal_symbols.get(tk.kind) or self.presymbols.get(tk.lexem)',
+             '',
+             '    def postfix_sym(self):',
+             '        tk = self.cur_token',
+             '        if tk is None:',
+             '            return None',
+             '        return self.postsymbols.get(tk.lexem)',
+             '',
+             '    def parse_to(self, prio):',
+             '        factory = self.factory',
+             '        tk = self.cur_token',
+             '        if tk is None:',
+             '            return None',
+             '        if tk.kind == ID or tk.kind == NUMBER:',
+             '            ' + ADVANCE[0],
+             '            ' + ADVANCE[1],
+             '            node = factory.leaf(tk)',
+             '        else:',
+             '            g = prefix_groups.get(tk.lexem, -1)',
+             '            if g < 0:',
+             '                if tk.lexem not in postfix_groups:',
+             '                    return None',
+             '                node = factory.leaf(Token(ERROR, \'MISSING VALUE\'))']
+    if prefix_groups:
+        lines += ['            else:']
+        lines += dispatch_tree([prefix_code(group) for group in prefix_groups], 0, len(prefix_groups) - 1,
+                               ' ' * 16)
+    lines += ['        while True:',
+              '            tk = self.cur_token',
+              '            if tk is None:',
+              '                break',
+              '            g = postfix_groups.get(tk.lexem, -1)',
+              '            if g < 0:',
+              '                # juxtaposed values',
+              '                if prio >= 1000:',
+              '                    break',
+              '                if tk.kind != ID and tk.kind != NUMBER and tk.lexem not in prefix_groups:',
+              '                    break',
+              '                right = self.parse_to(1000)',
+              '                if right is None:',
+              '                    right = factory.leaf(Token(ERROR, \'MISSING VALUE\'))',
+              '                node = factory.composite(\'MISSING OPERATOR\', [node, right])']
+    if postfix_groups:
+        lines += ['            else:']
+        lines += dispatch_tree([postfix_code(group) for group in postfix_groups], 0, len(postfix_groups) - 1,
+                               ' ' * 16)
+    lines += ['        return node', '']
+    return '\n'.join(lines)
+
+
+# One directory per user in the temporary directory, which is usually shared
+def default_cache_dir():
+    user = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+    return os.path.join(tempfile.gettempdir(), 'pratt_generated-{}'.format(user))
+
+
+# Create the cache directory, only accessible to its owner, or check that it is one
+def check_cache_dir(cache_dir):
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    info = os.lstat(cache_dir)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError('Cache directory {} is not a directory'.format(cache_dir))
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise RuntimeError('Cache directory {} must be owned by the user and private to them'.format(cache_dir))
+
+
+def read_cached(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+# The generated module for the grammar of parser, from the cache when it holds its source
+def generated_module(parser, cache_dir=None):
+    digest = grammar_hash(parser)
+    module = loaded_modules.get(digest)
+    if module is not None:
+        return module
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    check_cache_dir(cache_dir)
+    name = 'pratt_{}'.format(digest[:24])
+    path = os.path.join(cache_dir, name + '.py')
+    source = generate_source(parser)
+    if read_cached(path) != source:
+        # written under another name then renamed, so that other processes never see a partial module
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(source)
+        os.replace(temporary, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    loaded_modules[digest] = module
+    return module
+
+
+# A parser using the generated module for the grammar of a pratt.Parser, with the symbol tables and factory
+# of that parser as they are when it is created
+class GeneratedParser:
+    def __init__(self, parser, cache_dir=None):
+        self.factory = parser.factory
+        self.presymbols = dict(parser.presymbols)
+        self.postsymbols = dict(parser.postsymbols)
+        self.words = set(parser.words)
+        self.module = generated_module(parser, cache_dir)
+
+    def parse(self, s):
+        return self.module.ParseContext(self).parse(s)
+
+    def evaluate(self, s, bindings, semantics=evaluation.c_semantics):
+        context = self.module.ParseContext(self)
+        context.factory = evaluation.ValueFactory(bindings, semantics)
+        return evaluation.value(context.parse(s))
+
+
+# Print the module generated for the C expressions grammar of pratt.py
+def main(args):
+    print(generate_source(pratt.cexp_parser()))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
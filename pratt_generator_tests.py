@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+import os
+import tempfile
+import tree
+import pratt
+import pratt_generator
+import andychu_cexp_tests
+import jmb_cexp_tests
+
+
+def parse(parser, s):
+    try:
+        return tree.sexp(parser.parse(s))
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+# The generated parser gives the trees of the interpreted one, errors included
+def check_parsing(s, expected):
+    got = parse(generated, s)
+    wanted = parse(interpreted, s)
+    if got != wanted:
+        print('Failed generated parsing: {} => {} != {}'.format(s, got, wanted))
+
+
+def cache_tests(cache_dir):
+    files = os.listdir(cache_dir)
+    if [name for name in files if name.endswith('.py')] != [generated.module.__name__ + '.py']:
+        print('Failed generated module cache: {}'.format(files))
+    # the module is imported from the cache in another process, generated once otherwise
+    pratt_generator.loaded_modules.clear()
+    path = os.path.join(cache_dir, generated.module.__name__ + '.py')
+    written = os.stat(path)
+    reloaded = pratt_generator.GeneratedParser(pratt.cexp_parser(), cache_dir)
+    if os.stat(path).st_mtime_ns != written.st_mtime_ns or parse(reloaded, 'a + b * c') != '(+ a (* b c))':
+        print('Failed generated module reloaded from the cache')
+    if pratt_generator.GeneratedParser(pratt.cexp_parser(), cache_dir).module is not reloaded.module:
+        print('Failed generated module loaded once')
+    # other priorities are another grammar
+    parser = pratt.cexp_parser()
+    parser.register_postsymbol(['+', '-'], 28, 29)
+    other = pratt_generator.GeneratedParser(parser, cache_dir)
+    if other.module is reloaded.module or parse(other, 'a * b + c') != '(* a (+ b c))':
+        print('Failed generated module for other priorities: {}'.format(parse(other, 'a * b + c')))
+    # a cached module which is not the generated source is replaced, not imported
+    pratt_generator.loaded_modules.clear()
+    with open(path, 'a') as f:
+        f.write('from_cache = True\n')
+    replaced = pratt_generator.GeneratedParser(pratt.cexp_parser(), cache_dir)
+    if hasattr(replaced.module, 'from_cache') or parse(replaced, 'a + b * c') != '(+ a (* b c))':
+        print('Failed modified generated module imported from the cache')
+
+
+# The cache directory is private to the user
+def cache_dir_tests(cache_dir):
+    private = os.path.join(cache_dir, 'private')
+    pratt_generator.check_cache_dir(private)
+    if os.stat(private).st_mode & 0o777 != 0o700:
+        print('Failed cache directory mode: {:o}'.format(os.stat(private).st_mode))
+    os.chmod(private, 0o755)
+    try:
+        pratt_generator.check_cache_dir(private)
+        print('Failed cache directory readable by others accepted')
+    except RuntimeError:
+        pass
+    if str(os.getuid()) not in pratt_generator.default_cache_dir():
+        print('Failed default cache directory: {}'.format(pratt_generator.default_cache_dir()))
+
+
+# Operators spelled like identifiers give the trees of the interpreted parser
+def word_tests(cache_dir):
+    interpreted = pratt.cexp_parser()
+    interpreted.register_postsymbol('and', 8, 9)
+    interpreted.register_presymbol('not', 30)
+    generated = pratt_generator.GeneratedParser(interpreted, cache_dir)
+    for s in ['a and b', 'a and not b + c and d', 'and', 'a and']:
+        if parse(generated, s) != parse(interpreted, s):
+            print('Failed generated words: {} => {} != {}'.format(s, parse(generated, s), parse(interpreted, s)))
+
+
+def evaluator_tests(cache_dir):
+    parser = pratt.cexp_parser()
+    parser.register_postsymbol('@', 26, 27, lambda parser, left, sym: parser.factory.composite(
+        'at', [left, parser.parse_to(sym.rprio)]))
+    parser.register_presymbol('!', 30, lambda parser, sym: parser.factory.composite('not', [parser.parse_to(30)]))
+    parser = pratt_generator.GeneratedParser(parser, cache_dir)
+    for s, expected in [('a @ ! b + c', '(+ (at a (not b)) c)'),
+                        ('f(a, b)[c] ? d : e', '(? (get (call f a b) c) d e)')]:
+        if parse(parser, s) != expected:
+            print('Failed generated parser with evaluators: {} => {} != {}'.format(s, parse(parser, s), expected))
+    if generated.evaluate('a * (b + 2)', {'a': 3, 'b': 4}) != 18:
+        print('Failed generated evaluate: {}'.format(generated.evaluate('a * (b + 2)', {'a': 3, 'b': 4})))
+
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    interpreted = pratt.cexp_parser()
+    generated = pratt_generator.GeneratedParser(interpreted, cache_dir)
+    cache_tests(cache_dir)
+    cache_dir_tests(cache_dir)
+    evaluator_tests(cache_dir)
+    word_tests(cache_dir)
+    andychu_cexp_tests.all(check_parsing)
+    jmb_cexp_tests.all_tests(check_parsing)
@@ -4,9 +4,10 @@ pratt_tdop_parser.py: Parse shell-like and C-like arithmetic.
 """
 
 import sys
+import types
 import lexer
 from lexer import Token
-from tree import Node, CompositeNode
+from tree import node_factory
 
 #
 # Default parsing functions give errors
@@ -26,6 +27,9 @@ def LeftError(p, token, rbp, left):
 # Parser definition
 #
 
+# token returned once the input is exhausted
+EOF_TOKEN = Token(lexer.EOF, 'eof')
+
 # min and max binding powers
 MIN_BP = 0
 MAX_BP = 10000
@@ -48,29 +52,12 @@ class Parser(object):
     """Recursive TDOP parser."""
 
     def __init__(self):
-        self.lexer = None  # iterable
-        self.token = None  # current token
+        self.factory = node_factory  # builds the nodes of the tree
         self.null_lookup = {}
         self.left_lookup = {}
 
     """Specification for a TDOP parser."""
     
-    def LookupNull(self, token):
-        """Get the parsing function and precedence for a null position token."""
-        try:
-            null_info = self.null_lookup[token]
-        except KeyError:
-            raise ParseError('Unexpected token %r' % token)
-        return null_info
-
-    def LookupLeft(self, token):
-        """Get the parsing function and precedence for a left position token."""
-        try:
-            left_info = self.left_lookup[token]
-        except KeyError:
-            raise ParseError('Unexpected token %r' % token)
-        return left_info
-
     def _RegisterNud(self, lbp, rbp, nbp, nud, tokens):
         if type(tokens) is str:
             self.null_lookup[tokens] = NullInfo(
@@ -115,19 +102,63 @@ class Parser(object):
     def infixN(self, bp, led, tokens):
             self._RegisterLed(bp, bp, bp, led, tokens)
 
+    def parse(self, s):
+        """Parse s in a new context, the parser itself is not modified and can be shared by threads."""
+        return ParseContext(self).parse(s)
+
+    def parse_compiled(self, s):
+        """Parse s on its tokens resolved beforehand, see CompiledParseContext; the tree is the one of parse."""
+        return CompiledParseContext(self).parse(s)
+
+    def parse_iterative(self, s):
+        """Parse s with the explicit stack of IterativeParseContext, whatever its nesting depth."""
+        return IterativeParseContext(self).parse(s)
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+class ParseContext(object):
+    """State of one parse: the lexer and the current token.  Nud and led functions get it as p."""
+
+    def __init__(self, parser):
+        self.lexer = None  # iterable
+        self.token = None  # current token
+        self.key = None  # lookup key of the current token
+        self.factory = parser.factory
+        self.null_lookup = parser.null_lookup
+        self.left_lookup = parser.left_lookup
+
+    def LookupNull(self, token):
+        """Get the parsing function and precedence for a null position token."""
+        null_info = self.null_lookup.get(token)
+        if null_info is None:
+            raise ParseError('Unexpected token %r' % token)
+        return null_info
+
+    def LookupLeft(self, token):
+        """Get the parsing function and precedence for a left position token."""
+        left_info = self.left_lookup.get(token)
+        if left_info is None:
+            raise ParseError('Unexpected token %r' % token)
+        return left_info
+
     def AtToken(self, token_type):
         """Test if we are looking at a token."""
-        return self.token.kind == token_type
+        return self.key == token_type
 
     def Next(self):
         """Move to the next token."""
         try:
             t = self.lexer.__next__()
-            if t.kind in ['OPER', 'SYNT']:
-                t.kind = t.lexem
         except StopIteration:
-            t = Token('eof', 'eof')
+            t = EOF_TOKEN
         self.token = t
+        # operators are looked up by lexem, the other tokens by kind
+        if t.kind == lexer.OPER or t.kind == lexer.SYNT:
+            self.key = t.lexem
+        else:
+            self.key = t.kind
 
     def Eat(self, val):
         """Assert the value of the current token, then move to the next token."""
@@ -141,66 +172,276 @@ class Parser(object):
     # If we see 1**2**, rbp = 26 and lbp = 27, so keep going.
     def ParseUntil(self, rbp):
         """ Parse to the right, eating tokens until we encounter a token with binding power LESS THAN OR EQUAL TO rbp. """
-        if self.AtToken('eof'):
+        if self.AtToken(lexer.EOF):
             raise ParseError('Unexpected end of input')
         if rbp < MIN_BP:
             raise ParseError(
                 'rbp=%r must be greater equal than MIN_BP=%r.' %
                 (rbp, MIN_BP))
         t = self.token
+        key = self.key
         self.Next()
-        null_info = self.LookupNull(t.kind)
+        null_info = self.LookupNull(key)
         node = null_info.nud(self, t, null_info.rbp)
         nbp = null_info.nbp  # next bp
-        lbp = self.LookupLeft(self.token.kind).lbp
+        # the info giving lbp is the one of the led, the token is looked up once
+        left_info = self.LookupLeft(self.key)
+        lbp = left_info.lbp
         while rbp < lbp and lbp < nbp:
             t = self.token
             self.Next()
-            left_info = self.LookupLeft(t.kind)
             node = left_info.led(self, t, left_info.rbp, node)
             nbp = left_info.nbp  # next bp
-            lbp = self.LookupLeft(self.token.kind).lbp
+            left_info = self.LookupLeft(self.key)
+            lbp = left_info.lbp
         return node
 
     def parse(self, s):
         self.lexer = lexer.tokenize(s)
         self.Next()
         r = self.ParseUntil(0)
-        if not self.AtToken('eof'):
+        if not self.AtToken(lexer.EOF):
             raise ParseError('There are unparsed tokens: %r' % self.token)
         return r
 
+class CompiledParseContext(ParseContext):
+    """Parse on the token stream resolved once, before parsing, into lists of keys, NullInfo and LeftInfo.
+
+    ParseUntil then indexes those lists at the current position instead of looking the token up, and keeps
+    the binding powers in local variables.  Tokens which are not in the tables are resolved to None, the
+    error being raised when the parse reaches them, as ParseContext does.  The nud and led functions see
+    the same token, key, Next and Eat as with ParseContext.
+
+    Operators are resolved by lexem, once per parse, and the other tokens by kind, without reading their
+    lexem; the parser is not modified.
+    """
+
+    def __init__(self, parser):
+        ParseContext.__init__(self, parser)
+        self.resolved = {}  # entries of the operators by lexem
+        self.tokens = None
+        self.entries = None
+        self.pos = 0
+        self.last = 0
+
+    def Entry(self, key):
+        """Get the (key, NullInfo, LeftInfo) entry of a key, None standing for an unknown key."""
+        return (key, self.null_lookup.get(key), self.left_lookup.get(key))
+
+    def Resolve(self, tokens):
+        """Set the lists of the tokens, ended by EOF_TOKEN, and of their entries, and move to the first token."""
+        resolved = self.resolved
+        kind_entries = {}
+        self.tokens = tokens = list(tokens)
+        self.entries = entries = []
+        for t in tokens:
+            kind = t.kind
+            if kind == lexer.OPER or kind == lexer.SYNT:
+                lexem = t.lexem
+                entry = resolved.get(lexem)
+                if entry is None:
+                    entry = resolved[lexem] = self.Entry(lexem)
+            else:
+                entry = kind_entries.get(kind)
+                if entry is None:
+                    entry = kind_entries[kind] = self.Entry(kind)
+            entries.append(entry)
+        tokens.append(EOF_TOKEN)
+        entries.append(self.Entry(lexer.EOF))
+        self.pos = 0
+        self.last = len(tokens) - 1
+        self.token = tokens[0]
+        self.key = self.entries[0][0]
+
+    def Next(self):
+        """Move to the next token, staying on EOF_TOKEN at the end."""
+        pos = self.pos
+        if pos < self.last:
+            self.pos = pos = pos + 1
+            self.token = self.tokens[pos]
+            self.key = self.entries[pos][0]
+
+    def ParseUntil(self, rbp):
+        """ParseContext.ParseUntil on the resolved tokens."""
+        if self.key == lexer.EOF:
+            raise ParseError('Unexpected end of input')
+        if rbp < MIN_BP:
+            raise ParseError(
+                'rbp=%r must be greater equal than MIN_BP=%r.' %
+                (rbp, MIN_BP))
+        # Next is inlined, the token consumed is never EOF_TOKEN
+        tokens = self.tokens
+        entries = self.entries
+        t = self.token
+        pos = self.pos + 1
+        key, null_info, _ = entries[pos - 1]
+        self.pos = pos
+        self.token = tokens[pos]
+        self.key = entries[pos][0]
+        if null_info is None:
+            raise ParseError('Unexpected token %r' % key)
+        node = null_info.nud(self, t, null_info.rbp)
+        nbp = null_info.nbp
+        key, _, left_info = entries[self.pos]
+        if left_info is None:
+            raise ParseError('Unexpected token %r' % key)
+        lbp = left_info.lbp
+        while rbp < lbp and lbp < nbp:
+            t = self.token
+            pos = self.pos + 1
+            self.pos = pos
+            self.token = tokens[pos]
+            self.key = entries[pos][0]
+            node = left_info.led(self, t, left_info.rbp, node)
+            nbp = left_info.nbp
+            key, _, left_info = entries[self.pos]
+            if left_info is None:
+                raise ParseError('Unexpected token %r' % key)
+            lbp = left_info.lbp
+        return node
+
+    def parse(self, s):
+        self.Resolve(lexer.tokenize(s))
+        r = self.ParseUntil(0)
+        if not self.AtToken(lexer.EOF):
+            raise ParseError('There are unparsed tokens: %r' % self.token)
+        return r
+
+class IterativeParseContext(CompiledParseContext):
+    """CompiledParseContext whose ParseUntil does not recurse, the nesting of the input being limited by the memory.
+
+    The loop of ParseUntil is a generator, ParseSteps, yielding the generators of the nud and led functions
+    made by Steps, which themselves yield the rbp of their operands.  ParseUntil runs them, keeping the
+    suspended generators on a list, each one waiting for the node of the generator started above it.  The
+    nud and led functions without steps are called as they are, their own calls to ParseUntil having a
+    stack of their own.  The tree and errors are the ones of parse.
+    """
+
+    def ParseSteps(self, rbp):
+        """CompiledParseContext.ParseUntil yielding the generators of the nud and led functions it calls."""
+        if self.key == lexer.EOF:
+            raise ParseError('Unexpected end of input')
+        if rbp < MIN_BP:
+            raise ParseError(
+                'rbp=%r must be greater equal than MIN_BP=%r.' %
+                (rbp, MIN_BP))
+        tokens = self.tokens
+        entries = self.entries
+        t = self.token
+        pos = self.pos + 1
+        key, null_info, _ = entries[pos - 1]
+        self.pos = pos
+        self.token = tokens[pos]
+        self.key = entries[pos][0]
+        if null_info is None:
+            raise ParseError('Unexpected token %r' % key)
+        steps = steps_lookup.get(null_info.nud)
+        if steps is None:
+            node = null_info.nud(self, t, null_info.rbp)
+        else:
+            node = yield steps(self, t, null_info.rbp)
+        nbp = null_info.nbp
+        key, _, left_info = entries[self.pos]
+        if left_info is None:
+            raise ParseError('Unexpected token %r' % key)
+        lbp = left_info.lbp
+        while rbp < lbp and lbp < nbp:
+            t = self.token
+            pos = self.pos + 1
+            self.pos = pos
+            self.token = tokens[pos]
+            self.key = entries[pos][0]
+            steps = steps_lookup.get(left_info.led)
+            if steps is None:
+                node = left_info.led(self, t, left_info.rbp, node)
+            else:
+                node = yield steps(self, t, left_info.rbp, node)
+            nbp = left_info.nbp
+            key, _, left_info = entries[self.pos]
+            if left_info is None:
+                raise ParseError('Unexpected token %r' % key)
+            lbp = left_info.lbp
+        return node
+
+    def ParseUntil(self, rbp):
+        """Run ParseSteps(rbp) and the generators it starts on an explicit stack."""
+        stack = []
+        steps = self.ParseSteps(rbp)
+        value = None
+        while True:
+            try:
+                request = steps.send(value)
+            except StopIteration as stop:
+                if not stack:
+                    return stop.value
+                steps = stack.pop()
+                value = stop.value
+                continue
+            stack.append(steps)
+            if type(request) is types.GeneratorType:
+                steps = request
+            else:
+                steps = self.ParseSteps(request)
+            value = None
+
+#
+# Nud and led functions parsing operands are generators: they yield the rbp given to ParseUntil and receive
+# the node it returns, their return value being the node of the function.  Steps makes the function running
+# them with p.ParseUntil and steps_lookup gives the generator of each function made that way.
+#
+
+steps_lookup = {}
+
+def Steps(steps):
+    """Make the nud or led function of the generator steps, each operand being parsed by a call to ParseUntil."""
+    def function(p, *args):
+        run = steps(p, *args)
+        node = None
+        try:
+            while True:
+                node = p.ParseUntil(run.send(node))
+        except StopIteration as stop:
+            return stop.value
+    function.__name__ = steps.__name__[:-len('Steps')]
+    steps_lookup[function] = steps
+    return function
+
 #
 # Null Denotations -- tokens that take nothing on the left
 #
 def NullLiteral(p, token, rbp):
     """ Name or number """
-    return Node(token)
+    return p.factory.leaf(token)
 
-def NullParen(p, token, rbp):
+def NullParenSteps(p, token, rbp):
     """ Arithmetic grouping """
-    r = p.ParseUntil(rbp)
+    r = yield rbp
     p.Eat(')')
-    r.parenthesis = True
-    return r
+    return p.factory.parenthesized(r)
+
+NullParen = Steps(NullParenSteps)
 
-def NullPrefixOp(p, token, rbp):
+def NullPrefixOpSteps(p, token, rbp):
     """Prefix operator
     Low precedence:  return, raise, etc.
       return x+y is return (x+y), not (return x) + y
     High precedence: logical negation, bitwise complement, etc.
       !x && y is (!x) && y, not !(x && y)
     """
-    r = p.ParseUntil(rbp)
-    return CompositeNode(token.kind, [r])
+    r = yield rbp
+    return p.factory.composite(token.lexem, [r])
 
-def NullIncDec(p, token, rbp):
+NullPrefixOp = Steps(NullPrefixOpSteps)
+
+def NullIncDecSteps(p, token, rbp):
     """ ++x or ++x[1] """
-    right = p.ParseUntil(rbp)
+    right = yield rbp
     if right.token not in ('ID', 'get') and (
-            right.token is Token and right.token.kind not in ('ID', 'get')):
+            right.token is Token and right.token.kind not in (lexer.ID, 'get')):
         raise ParseError("Can't assign to %r (%s)" % (right, right.token))
-    return CompositeNode(token.kind, [right])
+    return p.factory.composite(token.lexem, [right])
+
+NullIncDec = Steps(NullIncDecSteps)
 
 #
 # Left Denotations -- tokens that take an expression on the left
@@ -210,24 +451,23 @@ def LeftIncDec(p, token, rbp, left):
     """ i++ and i-- """
     # if left.token.kind not in ('ID', 'get'):
     #  raise tdop.ParseError("Can't assign to %r (%s)" % (left, left.token))
-    token.kind = 'post' + token.kind
-    return CompositeNode(token.kind, [left])
+    return p.factory.composite('post' + token.lexem, [left])
 
 def LeftFactorial(p, token, rbp, left):
     """ 2! """
-    token.kind = 'post' + token.kind
-    return CompositeNode(token.kind, [left])
+    return p.factory.composite('post' + token.lexem, [left])
 
-def LeftIndex(p, token, unused_rbp, left):
+def LeftIndexSteps(p, token, unused_rbp, left):
     """ index f[x+1] or f[x][y] """
-    if left.token.kind not in ('ID', 'get'):
+    if left.token.kind not in (lexer.ID, 'get'):
         raise ParseError("%s can't be indexed" % left)
-    index = p.ParseUntil(0)
+    index = yield 0
     p.Eat("]")
-    token.kind = 'get'
-    return CompositeNode(token.kind, [left, index])
+    return p.factory.composite('get', [left, index])
+
+LeftIndex = Steps(LeftIndexSteps)
 
-def LeftTernaryOp(p, token, rbp, left):
+def LeftTernaryOpSteps(p, token, rbp, left):
     """ e.g. a > 1 ? x : y """
     # 0 binding power since any operators allowed until ':'.  See:
     #
@@ -236,36 +476,45 @@ def LeftTernaryOp(p, token, rbp, left):
     # "The expression in the middle of the conditional operator (between ?  and
     # :) is parsed as if parenthesized: its precedence relative to ?: is
     # ignored."
-    true_expr = p.ParseUntil(0)
+    true_expr = yield 0
     p.Eat(':')
-    false_expr = p.ParseUntil(rbp)
+    false_expr = yield rbp
     children = [left, true_expr, false_expr]
-    return CompositeNode(token.kind, children)
+    return p.factory.composite(token.lexem, children)
 
-def LeftBinaryOp(p, token, rbp, left):
+LeftTernaryOp = Steps(LeftTernaryOpSteps)
+
+def LeftBinaryOpSteps(p, token, rbp, left):
     """ Normal binary operator like 1+2 or 2*3, etc. """
-    return CompositeNode(token.kind, [left, p.ParseUntil(rbp)])
+    right = yield rbp
+    return p.factory.composite(token.lexem, [left, right])
+
+LeftBinaryOp = Steps(LeftBinaryOpSteps)
 
-def LeftAssignOp(p, token, rbp, left):
+def LeftAssignOpSteps(p, token, rbp, left):
     """ Binary assignment operator like x += 1, or a[i] += 1 """
     if left.token not in (
-            'ID', 'get') and left.token.kind not in ('ID', 'get'):
+            'ID', 'get') and left.token.kind not in (lexer.ID, 'get'):
         raise ParseError("Can't assign to %r (%s)" % (left, left.token))
-    return CompositeNode(token.kind, [left, p.ParseUntil(rbp)])
+    right = yield rbp
+    return p.factory.composite(token.lexem, [left, right])
+
+LeftAssignOp = Steps(LeftAssignOpSteps)
 
-def LeftComma(p, token, rbp, left):
+def LeftCommaSteps(p, token, rbp, left):
     """ foo, bar, baz - Could be sequencing operator, or tuple without parens """
-    r = p.ParseUntil(rbp)
+    r = yield rbp
     if not left.parenthesis and left.token == ',':  # Keep adding more children
-        left.children.append(r)
-        return left
+        return p.factory.append(left, r)
     children = [left, r]
-    return CompositeNode(token.kind, children)
+    return p.factory.composite(token.lexem, children)
+
+LeftComma = Steps(LeftCommaSteps)
 
 # For overloading of , inside function calls
 COMMA_PREC = 10
 
-def LeftFuncCall(p, token, unused_rbp, left):
+def LeftFuncCallSteps(p, token, unused_rbp, left):
     """ Function call f(a, b). """
     children = [left]
     # f(x) or f[i](x)
@@ -273,12 +522,13 @@ def LeftFuncCall(p, token, unused_rbp, left):
     #  raise tdop.ParseError("%s can't be called" % left)
     while not p.AtToken(')'):
         # We don't want to grab the comma, e.g. it is NOT a sequence operator.
-        children.append(p.ParseUntil(COMMA_PREC))
+        children.append((yield COMMA_PREC))
         if p.AtToken(','):
             p.Next()
     p.Eat(")")
-    token.kind = 'call'
-    return CompositeNode(token.kind, children)
+    return p.factory.composite('call', children)
+
+LeftFuncCall = Steps(LeftFuncCallSteps)
 
 def cexp_parser():
     parser = Parser()
@@ -325,8 +575,8 @@ def cexp_parser():
     parser.prefix(0, NullParen, '(')  # for grouping
 
     # 0 precedence -- never used
-    parser.nilfix(0, NullLiteral, ['ID', 'NUMBER'])
-    parser.nilfix(0, NullError, [')', ']', ':', 'eof'])
+    parser.nilfix(0, NullLiteral, [lexer.ID, lexer.NUMBER])
+    parser.nilfix(0, NullError, [')', ']', ':', lexer.EOF])
     return parser
 
 
@@ -1,13 +1,50 @@
 #! /usr/bin/env python3
 
 import pratt_tdop_parser
+from tree import sexp
 import andychu_cexp_tests
 import jmb_cexp_tests
 
 
+def result(parse, s):
+    try:
+        return sexp(parse(s))
+    except RuntimeError as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+# The compiled and iterative modes give the trees and errors of parse
+def check_compiled(parser, s):
+    compiled = result(parser.parse_compiled, s)
+    if compiled != result(parser.parse, s):
+        print('Failed compiled: {} => {} != {}'.format(s, compiled, result(parser.parse, s)))
+    iterative = result(parser.parse_iterative, s)
+    if iterative != result(parser.parse, s):
+        print('Failed iterative: {} => {} != {}'.format(s, iterative, result(parser.parse, s)))
+
+
 def check_parsing(s, expected):
-    jmb_cexp_tests.check_parsing(pratt_tdop_parser.cexp_parser(), s, expected)
+    parser = pratt_tdop_parser.cexp_parser()
+    jmb_cexp_tests.check_parsing(parser, s, expected)
+    check_compiled(parser, s)
+
 
+def compiled_tests():
+    parser = pratt_tdop_parser.cexp_parser()
+    for s in ['eof + eof', 'a @ b', 'f(a,', '(a', ')', 'a b']:
+        check_compiled(parser, s)
+    # the tokens are resolved for each parse, with the tables as they are
+    result(parser.parse_compiled, 'a ! b')
+    parser.infixL(300, pratt_tdop_parser.LeftBinaryOp, '!')
+    if result(parser.parse_compiled, 'a ! b') != '(! a b)':
+        print('Failed compiled after register: {}'.format(result(parser.parse_compiled, 'a ! b')))
+    # the parser is not modified by parse_compiled
+    before = {name: len(value) for name, value in vars(parser).items() if hasattr(value, '__len__')}
+    parser.parse_compiled('a + b * (c - d) + f(x1, x2) + g[1] ? h : 2')
+    if {name: len(value) for name, value in vars(parser).items() if hasattr(value, '__len__')} != before:
+        print('Failed compiled: parser modified')
 
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
+compiled_tests()
+jmb_cexp_tests.deep_tests(pratt_tdop_parser.cexp_parser().parse_iterative)
@@ -1,6 +1,8 @@
 #! /usr/bin/env python3
 
 import pratt
+import lexer
+from tree import sexp
 import andychu_cexp_tests
 import jmb_cexp_tests
 
@@ -8,10 +10,44 @@ import jmb_cexp_tests
 def check_parsing(s, expected):
     p = pratt.cexp_parser()
     tree = p.parse(s)
-    sexpr = repr(tree)
+    sexpr = sexp(tree)
     if sexpr != expected:
         print('Failed: {} => {} != {}'.format(s, sexpr, expected))
+    iterative = sexp(p.parse_iterative(s))
+    if iterative != sexpr:
+        print('Failed iterative: {} => {} != {}'.format(s, iterative, sexpr))
+
+
+# The operands read from bytes are not decoded while parsing, only the operators are looked up by lexem
+def operand_tests():
+    decoded = []
+    span_lexem = lexer.SpanToken.lexem
+    lexer.SpanToken.lexem = property(lambda token: decoded.append(token.kind) or span_lexem.fget(token))
+    try:
+        tree = pratt.cexp_parser().parse(b'a + b * (c - 12) + f(x1, x2)')
+    finally:
+        lexer.SpanToken.lexem = span_lexem
+    if [kind for kind in decoded if kind not in (lexer.OPER, lexer.SYNT)]:
+        print('Failed operands: {} decoded'.format(decoded))
+    if sexp(tree) != '(+ (+ a (* b (- c 12))) (call f x1 x2))':
+        print('Failed operands: {}'.format(sexp(tree)))
+
+
+# Operators spelled like identifiers are still found, by every context
+def word_tests():
+    parser = pratt.cexp_parser()
+    parser.register_postsymbol('and', 8, 9)
+    parser.register_postsymbol('or', 6, 7)
+    s = 'a and b or c and d + e'
+    expected = '(or (and a b) (and c (+ d e)))'
+    for name, parse, code in [('parse', parser.parse, s), ('parse_iterative', parser.parse_iterative, s),
+                              ('operator lexer', parser.parse, lexer.operator_lexer(parser).tokenize_buffer(s))]:
+        if sexp(parse(code)) != expected:
+            print('Failed words with {}: {} => {} != {}'.format(name, s, sexp(parse(code)), expected))
 
 
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
+operand_tests()
+word_tests()
+jmb_cexp_tests.deep_tests(pratt.cexp_parser().parse_iterative)
@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+# Compiling a full operator precedence matrix into the priorities used by operator_precedence.py and
+# modified_operator_precedence.py.
+#
+# The matrix gives, for a symbol on the stack followed by an incoming symbol, one of the relations
+#   YIELDS  the incoming symbol has priority, it is shifted,
+#   EQUAL   both are part of a distfix construct,
+#   TAKES   the symbol on the stack has priority, the handle it ends is reduced,
+# and a pair absent from the matrix is an error: the symbols can not be consecutive.
+#
+# When they exist, Floyd's precedence functions f and g, with f(a) > g(b) when a TAKES b, f(a) = g(b) when
+# a EQUAL b and f(a) < g(b) when a YIELDS b, are the right and left priorities of the parsers: two numbers
+# per symbol instead of a matrix.  They are computed on the graph whose nodes are the f(a) and g(b), the
+# nodes of EQUAL pairs merged, with an edge from the greater to the smaller of each other pair; they exist
+# when the graph has no cycle and are then the lengths of the longest paths.  Functions do not keep the
+# error entries.  When there is a cycle, or when the errors must be kept, the matrix is packed with two
+# bits per pair and the priorities are objects comparing themselves by looking it up.
+
+import sys
+
+YIELDS = '<'
+EQUAL = '='
+TAKES = '>'
+
+# The codes of the relations in a packed matrix, 0 being an error
+relation_codes = {YIELDS: 1, EQUAL: 2, TAKES: 3}
+code_relations = [None, YIELDS, EQUAL, TAKES]
+
+
+def matrix_symbols(relations):
+    symbols = {}
+    for left, right in relations:
+        symbols[left] = None
+        symbols[right] = None
+    return list(symbols)
+
+
+# The full matrix equivalent to a table of priorities, a dict from symbols to (lprio, rprio) pairs
+def priority_relations(priorities):
+    relations = {}
+    for left, (_, rprio) in priorities.items():
+        for right, (lprio, _) in priorities.items():
+            if rprio > lprio:
+                relations[(left, right)] = TAKES
+            elif rprio == lprio:
+                relations[(left, right)] = EQUAL
+            else:
+                relations[(left, right)] = YIELDS
+    return relations
+
+
+class PrecedenceFunctions:
+    def __init__(self, f, g):
+        self.f = f
+        self.g = g
+
+    def __contains__(self, symbol):
+        return symbol in self.f
+
+    def lprio(self, symbol):
+        return self.g[symbol]
+
+    def rprio(self, symbol):
+        return self.f[symbol]
+
+    def relation(self, left, right):
+        f = self.f[left]
+        g = self.g[right]
+        return TAKES if f > g else EQUAL if f == g else YIELDS
+
+
+class PrecedenceMatrix:
+    # cycle, when not None, is the cycle of the graph which prevented the use of precedence functions
+    def __init__(self, relations, cycle=None):
+        self.symbols = matrix_symbols(relations)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.size = len(self.symbols)
+        self.bits = bytearray((self.size * self.size + 3) // 4)
+        self.cycle = cycle
+        for (left, right), relation in relations.items():
+            if relation not in relation_codes:
+                raise RuntimeError('Unknown relation {} between {} and {}'.format(relation, left, right))
+            pos = self.index[left] * self.size + self.index[right]
+            self.bits[pos >> 2] |= relation_codes[relation] << ((pos & 3) << 1)
+
+    def code(self, left_index, right_index):
+        pos = left_index * self.size + right_index
+        return (self.bits[pos >> 2] >> ((pos & 3) << 1)) & 3
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def lprio(self, symbol):
+        return MatrixPriority(self, self.index[symbol], False)
+
+    def rprio(self, symbol):
+        return MatrixPriority(self, self.index[symbol], True)
+
+    def relation(self, left, right):
+        return code_relations[self.code(self.index[left], self.index[right])]
+
+
+# The priority of a symbol in a matrix, on the side it is compared: the parsers compare the rprio of a
+# symbol on the stack with the lprio of the following one, with > to know if the handle is complete and with
+# == to know if they are in the same handle.  An error entry stops the parse when compared with >.
+class MatrixPriority:
+    def __init__(self, matrix, index, on_stack):
+        self.matrix = matrix
+        self.index = index
+        self.on_stack = on_stack
+
+    def __repr__(self):
+        return '{}{}'.format('f' if self.on_stack else 'g', self.index)
+
+    def __gt__(self, incoming):
+        code = self.matrix.code(self.index, incoming.index)
+        if code == 0:
+            raise RuntimeError('Syntax error: {} can not be followed by {}'.format(
+                self.matrix.symbols[self.index], self.matrix.symbols[incoming.index]))
+        return code == 3
+
+    def __eq__(self, incoming):
+        return self.matrix.code(self.index, incoming.index) == 2
+
+    __hash__ = None
+
+
+def find_root(parents, node):
+    root = node
+    while parents[root] != root:
+        root = parents[root]
+    while parents[node] != root:
+        parents[node], node = root, parents[node]
+    return root
+
+
+# Floyd's precedence functions as a (f, g, None) triple, or (None, None, cycle) when they do not exist, cycle
+# being a list of nodes ('f', symbol) or ('g', symbol) of the graph, each one greater than the next; merged
+# nodes are represented by one of them.
+def precedence_functions(relations):
+    symbols = matrix_symbols(relations)
+    nodes = [('f', symbol) for symbol in symbols] + [('g', symbol) for symbol in symbols]
+    parents = {node: node for node in nodes}
+    for (left, right), relation in relations.items():
+        if relation == EQUAL:
+            parents[find_root(parents, ('f', left))] = find_root(parents, ('g', right))
+    edges = {node: [] for node in nodes if find_root(parents, node) == node}
+    for (left, right), relation in relations.items():
+        if relation == TAKES:
+            edges[find_root(parents, ('f', left))].append(find_root(parents, ('g', right)))
+        elif relation == YIELDS:
+            edges[find_root(parents, ('g', right))].append(find_root(parents, ('f', left)))
+    # longest path from each node, by an iterative depth first search; a node on the path being explored
+    # has no length yet
+    lengths = {}
+    path = []
+    for start in edges:
+        if start in lengths:
+            continue
+        lengths[start] = None
+        path.append((start, iter(edges[start])))
+        while path:
+            node, successors = path[-1]
+            for successor in successors:
+                if successor not in lengths:
+                    lengths[successor] = None
+                    path.append((successor, iter(edges[successor])))
+                    break
+                elif lengths[successor] is None:
+                    cycle = [n for n, _ in path]
+                    cycle = cycle[cycle.index(successor):]
+                    return None, None, cycle
+            else:
+                path.pop()
+                lengths[node] = max([lengths[successor] + 1 for successor in edges[node]], default=0)
+    f = {symbol: lengths[find_root(parents, ('f', symbol))] for symbol in symbols}
+    g = {symbol: lengths[find_root(parents, ('g', symbol))] for symbol in symbols}
+    return f, g, None
+
+
+def describe_cycle(cycle):
+    return ' > '.join('{}({})'.format(side, symbol) for side, symbol in cycle + cycle[:1])
+
+
+# The priorities of the symbols of relations, precedence functions when they exist, otherwise a packed
+# matrix.  With keep_errors, the matrix is also used when some pairs are errors.
+def compile_relations(relations, keep_errors=False):
+    if keep_errors and len(relations) < len(matrix_symbols(relations)) ** 2:
+        return PrecedenceMatrix(relations)
+    f, g, cycle = precedence_functions(relations)
+    if cycle is not None:
+        return PrecedenceMatrix(relations, cycle)
+    return PrecedenceFunctions(f, g)
+
+
+# Compile the priorities of the C expression parsers back from their matrix
+def main(args):
+    import operator_precedence
+    import modified_operator_precedence
+    for module in [operator_precedence, modified_operator_precedence]:
+        relations = module.cexp_parser().precedence_relations()
+        table = compile_relations(relations)
+        if isinstance(table, PrecedenceMatrix):
+            print('{}: no precedence functions, cycle {}'.format(module.__name__, describe_cycle(table.cycle)))
+        else:
+            print('{}: {} symbols'.format(module.__name__, len(table.f)))
+            for symbol in sorted(table.f, key=lambda symbol: (table.g[symbol], table.f[symbol])):
+                print('   {:10} {:3} {:3}'.format(symbol, table.g[symbol], table.f[symbol]))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
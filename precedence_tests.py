@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+import re
+import tree
+import precedence
+import andychu_cexp_tests
+import jmb_cexp_tests
+import operator_precedence
+import modified_operator_precedence
+
+YIELDS = precedence.YIELDS
+EQUAL = precedence.EQUAL
+TAKES = precedence.TAKES
+
+
+# The trees of errors keep the symbols, whose priorities are removed from the result
+def parse(parser, s):
+    try:
+        return re.sub(r'(<Symbol .*?) [^ <>]+/[^ <>]+', r'\1', tree.sexp(parser.parse(s)))
+    except RuntimeError as error:
+        return 'RuntimeError: {}'.format(error)
+
+
+# The parsers give the same trees with their priorities compiled back from their matrix, as functions or
+# as a packed matrix
+def check_compiled(module):
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    jmb_cexp_tests.all_tests(lambda s, expected: corpus.append(s))
+    expected = [parse(module.cexp_parser(), s) for s in corpus]
+    relations = module.cexp_parser().precedence_relations()
+    table = precedence.compile_relations(relations)
+    if not isinstance(table, precedence.PrecedenceFunctions):
+        print('Failed {} compile: no precedence functions'.format(module.__name__))
+    for table in [table, precedence.PrecedenceMatrix(relations)]:
+        for pair, relation in relations.items():
+            if table.relation(*pair) != relation:
+                print('Failed {} {} relation: {} {} != {}'.format(
+                    module.__name__, type(table).__name__, pair, table.relation(*pair), relation))
+        parser = module.cexp_parser().load_precedence(table)
+        for s, wanted in zip(corpus, expected):
+            got = parse(parser, s)
+            if got != wanted:
+                print('Failed {} {}: {} => {} != {}'.format(module.__name__, type(table).__name__, s, got, wanted))
+
+
+def cycle_tests():
+    relations = {('x', 'x'): YIELDS, ('x', 'y'): TAKES, ('y', 'x'): TAKES, ('y', 'y'): YIELDS}
+    f, g, cycle = precedence.precedence_functions(relations)
+    if cycle is None or len(cycle) != 4:
+        print('Failed cycle detection: {} {} {}'.format(f, g, cycle))
+    table = precedence.compile_relations(relations)
+    if not isinstance(table, precedence.PrecedenceMatrix) or table.cycle != cycle:
+        print('Failed compile with cycle: {}'.format(table))
+    description = precedence.describe_cycle(cycle)
+    if description != 'f(x) > g(y) > f(y) > g(x) > f(x)':
+        print('Failed describe_cycle: {}'.format(description))
+    # a distfix pair also greater than its own symbol
+    relations = {('(', '('): YIELDS, ('(', ')'): EQUAL, (')', '('): TAKES, (')', ')'): TAKES}
+    if precedence.precedence_functions(relations)[2] is not None:
+        print('Failed functions with EQUAL pairs')
+    relations = {('a', 'a'): TAKES, ('a', 'b'): EQUAL, ('b', 'a'): EQUAL, ('b', 'b'): TAKES}
+    if precedence.precedence_functions(relations)[2] is None:
+        print('Failed cycle through merged nodes')
+
+
+# Sums and products with parenthesis, every pair of symbols which can not follow each other being an error
+def arithmetic_relations():
+    relations = {}
+    rows = [('$soi$', {'$id$': YIELDS, '+': YIELDS, '*': YIELDS, '(': YIELDS, '$eoi$': EQUAL}),
+            ('$id$', {'+': TAKES, '*': TAKES, ')': TAKES, '$eoi$': TAKES}),
+            ('+', {'$id$': YIELDS, '(': YIELDS, '+': TAKES, '*': YIELDS, ')': TAKES, '$eoi$': TAKES}),
+            ('*', {'$id$': YIELDS, '(': YIELDS, '+': TAKES, '*': TAKES, ')': TAKES, '$eoi$': TAKES}),
+            ('(', {'$id$': YIELDS, '(': YIELDS, '+': YIELDS, '*': YIELDS, ')': EQUAL}),
+            (')', {'+': TAKES, '*': TAKES, ')': TAKES, '$eoi$': TAKES})]
+    for left, row in rows:
+        for right, relation in row.items():
+            relations[(left, right)] = relation
+    return relations
+
+
+def arithmetic_parser(table):
+    parser = operator_precedence.Parser()
+    parser.register_symbol(['+', '*'], 0, 0)
+    parser.register_symbol('(', 0, 0, operator_precedence.open_parenthesis_evaluator)
+    parser.register_symbol(')', 0, 0, operator_precedence.close_parenthesis_evaluator)
+    return parser.load_precedence(table)
+
+
+def check_parsing(parser, s, expected):
+    got = parse(parser, s)
+    if got != expected:
+        print('Failed matrix parse: {} => {} != {}'.format(s, got, expected))
+
+
+def error_tests():
+    table = precedence.compile_relations(arithmetic_relations(), keep_errors=True)
+    if not isinstance(table, precedence.PrecedenceMatrix) or table.cycle is not None:
+        print('Failed compile keeping errors: {}'.format(table))
+    parser = arithmetic_parser(table)
+    check_parsing(parser, 'a + b * c', '(+ a (* b c))')
+    check_parsing(parser, '(a + b) * c', '(* (+ a b) c)')
+    check_parsing(parser, 'a * b + c * d', '(+ (* a b) (* c d))')
+    check_parsing(parser, 'a b', 'RuntimeError: Syntax error: $id$ can not be followed by $id$')
+    check_parsing(parser, 'a (b)', 'RuntimeError: Syntax error: $id$ can not be followed by (')
+    check_parsing(parser, '(a', 'RuntimeError: Syntax error: ( can not be followed by $eoi$')
+    check_parsing(parser, 'a)', 'RuntimeError: Syntax error: $soi$ can not be followed by )')
+    # without the errors, the same matrix has precedence functions, which accept more
+    table = precedence.compile_relations(arithmetic_relations())
+    if not isinstance(table, precedence.PrecedenceFunctions):
+        print('Failed compile without errors: {}'.format(table))
+    parser = arithmetic_parser(table)
+    check_parsing(parser, '(a + b) * c', '(* (+ a b) c)')
+    check_parsing(parser, 'a b', "(ID ERROR <Symbol <Token ID 'a'> None> b)")
+    try:
+        operator_precedence.cexp_parser().load_precedence(table)
+        print('Failed load_precedence with missing symbols')
+    except RuntimeError:
+        pass
+
+
+check_compiled(operator_precedence)
+check_compiled(modified_operator_precedence)
+cycle_tests()
+error_tests()
@@ -52,16 +52,16 @@ class Parser:
     def parse_factor(self):
         if self.cur_token is None:
             return None
-        elif self.cur_token.kind == 'ID':
+        elif self.cur_token.kind == lexer.ID:
             result = Node(self.cur_token)
             self.advance()
             return result
-        elif self.cur_token.kind == 'NUMBER':
+        elif self.cur_token.kind == lexer.NUMBER:
             result = Node(self.cur_token)
             self.advance()
             return result
         else:
-            return Node(lexer.Token('ERROR', 'MISSING VALUE'))
+            return Node(lexer.Token(lexer.ERROR, 'MISSING VALUE'))
 
     def parse_exp(self, prio):
         left_arg = self.parse_factor()
@@ -1,5 +1,7 @@
 # Some tests for rd_to_pratt
 
+from tree import sexp
+
 
 def all_tests(t_parse):
     t_parse('a+b', '(+ a b)')
@@ -18,7 +20,7 @@ def all_tests(t_parse):
 def check_parsing(parser, s, expected):
     try:
         tree = parser.parse(s)
-        sexpr = repr(tree)
+        sexpr = sexp(tree)
         if sexpr != expected:
             if expected == '':
                 print('Failing to parse: {} => {}'.format(s, sexpr))
@@ -2,7 +2,7 @@
 
 import sys
 import lexer
-from tree import Node, CompositeNode
+from tree import node_factory
 
 
 class SymbolDesc:
@@ -16,21 +16,22 @@ class SymbolDesc:
         return '<Symbol {} {}/{}>'.format(self.symbol, self.lprio, self.rprio)
 
 
-def identity_evaluator(args):
+def identity_evaluator(parser, args):
     if len(args) == 1 and type(args[0]) == SymbolDesc:
-        return Node(args[0].symbol)
+        return parser.factory.leaf(args[0].symbol)
     else:
-        return CompositeNode('ID ERROR', args)
+        return parser.factory.composite('ID ERROR', args)
 
 
-def binary_evaluator(args):
+def binary_evaluator(parser, args):
     if len(args) != 3 or type(args[0]) == SymbolDesc or type(args[1]) != SymbolDesc or type(args[2]) == SymbolDesc:
-        return CompositeNode('BINARY ERROR', args)
-    return CompositeNode(args[1].symbol, [args[0], args[2]])
+        return parser.factory.composite('BINARY ERROR', args)
+    return parser.factory.composite(args[1].symbol, [args[0], args[2]])
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.presymbols = {}
         self.postsymbols = {}
 
@@ -52,31 +53,50 @@ class Parser:
             for op in oper:
                 self.postsymbols[op] = SymbolDesc(op, lprio, rprio, evaluator)
 
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+    # Parse s with the explicit stack of IterativeParseContext, whatever its nesting depth; the tree is the
+    # one of parse
+    def parse_iterative(self, s):
+        return IterativeParseContext(self).parse(s)
+
+
+# The lexer and current token of one parse.  The Parser keeps only the symbol tables and is not modified by
+# parse, so threads can share it.  The evaluators get the context as their parser.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.presymbols = parser.presymbols
+        self.postsymbols = parser.postsymbols
+        self.lexer = None
+        self.cur_token = None
+
     def advance(self):
         try:
             self.cur_token = self.lexer.__next__()
         except StopIteration:
             self.cur_token = None
 
-    def reset(self, s):
-        self.lexer = lexer.tokenize(s)
-        self.advance()
-
     def id_symbol(self, id):
         return SymbolDesc(id, 999, 1000, identity_evaluator)
 
     def evaluate_handle(self, args):
         for i in args:
             if type(i) == SymbolDesc:
-                return i.evaluator(args)
+                return i.evaluator(self, args)
         raise RuntimeError('Internal error: no evaluator found in {}'.format(args))
 
     def cur_sym(self, allow_presymbol):
         if self.cur_token is None:
             return None
-        elif self.cur_token.kind == 'ID':
+        elif self.cur_token.kind == lexer.ID:
             return self.id_symbol(self.cur_token)
-        elif self.cur_token.kind == 'NUMBER':
+        elif self.cur_token.kind == lexer.NUMBER:
             return self.id_symbol(self.cur_token)
         elif allow_presymbol and self.cur_token.lexem in self.presymbols:
             return self.presymbols[self.cur_token.lexem]
@@ -109,14 +129,46 @@ class Parser:
             return None
 
     def parse(self, s):
-        self.reset(s)
+        self.lexer = lexer.tokenize(s)
+        self.advance()
         res = self.parse_to(0)
         if self.cur_token is not None:
-            res = CompositeNode('REMAINING INPUT', [res, self.cur_token])
+            res = self.factory.composite('REMAINING INPUT', [res, self.cur_token])
         return res
 
 
-def open_parenthesis_evaluator(args):
+# A ParseContext whose parse_to keeps the calls it would make to itself on a list, so that the nesting of the
+# input is limited by the memory and not by the recursion limit.  Each entry is the priority and the handle
+# of a suspended parse_to, waiting for the operand of the symbol which ends its handle, the priority of that
+# operand being the rprio of the symbol and the one of the parse_to started above it.
+class IterativeParseContext(ParseContext):
+    def parse_to(self, prio):
+        stack = []
+        args = []
+        while True:
+            assert len(args) == 0 or (len(args) == 1 and type(args[0]) != SymbolDesc)
+            sym = self.cur_sym(len(args) == 0)
+            if sym is None or prio >= sym.lprio:
+                result = args[0] if len(args) == 1 else None
+                if not stack:
+                    return result
+                # back in the parse_to which called this one, the handle goes on while the priorities match
+                curprio = prio
+                prio, args = stack.pop()
+                if result is not None:
+                    args.append(result)
+                sym = self.cur_sym(result is None)
+                if sym is None or curprio != sym.lprio:
+                    args = [self.evaluate_handle(args)]
+                    continue
+            args.append(sym)
+            self.advance()
+            stack.append((prio, args))
+            prio = sym.rprio
+            args = []
+
+
+def open_parenthesis_evaluator(parser, args):
     if (len(args) == 3
             and type(args[0]) == SymbolDesc and args[0].symbol == '('
             and type(args[1]) != SymbolDesc
@@ -126,69 +178,68 @@ def open_parenthesis_evaluator(args):
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) == SymbolDesc and args[2].symbol == ')'):
-        return CompositeNode('call', [args[0]])
+        return parser.factory.composite('call', [args[0]])
     elif (len(args) == 4
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '('
             and type(args[2]) != SymbolDesc
             and type(args[3]) == SymbolDesc and args[3].symbol == ')'):
         if args[2].token == ',':
-            callargs = args[2].children
+            callargs = [args[0]] + args[2].children
         else:
-            callargs = [args[2]]
-        callargs.insert(0, args[0])
-        return CompositeNode('call', callargs)
+            callargs = [args[0], args[2]]
+        return parser.factory.composite('call', callargs)
     else:
-        return CompositeNode('( ERROR', args)
+        return parser.factory.composite('( ERROR', args)
 
 
-def close_parenthesis_evaluator(args):
-    return CompositeNode(') ERROR', args)
+def close_parenthesis_evaluator(parser, args):
+    return parser.factory.composite(') ERROR', args)
 
 
-def open_bracket_evaluator(args):
+def open_bracket_evaluator(parser, args):
     if (len(args) == 4
             and type(args[0]) != SymbolDesc
             and type(args[1]) == SymbolDesc and args[1].symbol == '['
             and type(args[2]) != SymbolDesc
             and type(args[3]) == SymbolDesc and args[3].symbol == ']'):
-        return CompositeNode('get', [args[0], args[2]])
+        return parser.factory.composite('get', [args[0], args[2]])
     else:
-        return CompositeNode('[ ERROR', args)
+        return parser.factory.composite('[ ERROR', args)
 
 
-def close_bracket_evaluator(args):
-    return CompositeNode('] ERROR', args)
+def close_bracket_evaluator(parser, args):
+    return parser.factory.composite('] ERROR', args)
 
 
-def coma_evaluator(args):
-    return CompositeNode(',', [x for x in args if type(x) != SymbolDesc])
+def coma_evaluator(parser, args):
+    return parser.factory.composite(',', [x for x in args if type(x) != SymbolDesc])
 
 
-def unary_evaluator(args):
+def unary_evaluator(parser, args):
     if len(args) != 2:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
     if type(args[0]) == SymbolDesc and type(args[1]) != SymbolDesc:
-        return CompositeNode(args[0].symbol, [args[1]])
+        return parser.factory.composite(args[0].symbol, [args[1]])
     elif type(args[0]) != SymbolDesc and type(args[1]) == SymbolDesc:
-        return CompositeNode('post'+args[1].symbol, [args[0]])
+        return parser.factory.composite('post'+args[1].symbol, [args[0]])
     else:
-        return CompositeNode('UNARY ERROR', args)
+        return parser.factory.composite('UNARY ERROR', args)
 
 
-def question_evaluator(args):
+def question_evaluator(parser, args):
     if (len(args) != 5
             or type(args[0]) == SymbolDesc
             or type(args[1]) != SymbolDesc or args[1].symbol != '?'
             or type(args[2]) == SymbolDesc
             or type(args[3]) != SymbolDesc or args[3].symbol != ':'
             or type(args[4]) == SymbolDesc):
-        return CompositeNode('? ERROR', args)
-    return CompositeNode('?', [args[0], args[2], args[4]])
+        return parser.factory.composite('? ERROR', args)
+    return parser.factory.composite('?', [args[0], args[2], args[4]])
 
 
-def colon_evaluator(args):
-    return CompositeNode(': ERROR', args)
+def colon_evaluator(parser, args):
+    return parser.factory.composite(': ERROR', args)
 
 
 def cexp_parser():
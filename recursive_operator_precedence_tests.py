@@ -1,13 +1,20 @@
 #! /usr/bin/env python3
 
 import recursive_operator_precedence
+from tree import sexp
 import andychu_cexp_tests
 import jmb_cexp_tests
 
 
 def check_parsing(s, expected):
-    jmb_cexp_tests.check_parsing(recursive_operator_precedence.cexp_parser(), s, expected)
+    parser = recursive_operator_precedence.cexp_parser()
+    jmb_cexp_tests.check_parsing(parser, s, expected)
+    sexpr = sexp(parser.parse(s))
+    iterative = sexp(parser.parse_iterative(s))
+    if iterative != sexpr:
+        print('Failed iterative: {} => {} != {}'.format(s, iterative, sexpr))
 
 
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
+jmb_cexp_tests.deep_tests(recursive_operator_precedence.cexp_parser().parse_iterative)
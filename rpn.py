@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+# Reverse Polish code for expressions, emitted by the shunting yard parsers instead of trees, and a stack
+# machine running it.  A Program is a node factory: the shunting yard algorithm builds the operands of an
+# operator before the operator, so the factory is called in postfix order and each call appends one
+# instruction, the nodes being replaced by the index of their instruction.
+#
+# The code is a flat array of integers: an operand is the index of its token in operands, an operator is
+# ~(opcode << 16 | arity) with opcode the index of its label in opcodes.  Operands and labels are stored
+# once, whatever the number of their occurrences.  Parenthesis are the '()' operator, of arity 1.
+
+import sys
+from array import array
+import evaluation
+
+MAX_ARITY = 0xffff
+PARENTHESIS = '()'
+
+
+class Program:
+    def __init__(self):
+        self.code = array('i')
+        self.operands = []
+        self.operand_ids = {}
+        self.opcodes = []
+        self.opcode_ids = {}
+
+    def __len__(self):
+        return len(self.code)
+
+    def leaf(self, token):
+        key = (token.kind, token.lexem)
+        i = self.operand_ids.get(key)
+        if i is None:
+            i = self.operand_ids[key] = len(self.operands)
+            self.operands.append(token)
+        self.code.append(i)
+        return len(self.code) - 1
+
+    def operator(self, label, arity):
+        if arity > MAX_ARITY:
+            raise RuntimeError('Too many operands for {}'.format(label))
+        i = self.opcode_ids.get(label)
+        if i is None:
+            i = self.opcode_ids[label] = len(self.opcodes)
+            self.opcodes.append(label)
+        self.code.append(~(i << 16 | arity))
+        return len(self.code) - 1
+
+    def composite(self, label, children):
+        return self.operator(label, len(children))
+
+    # The node can not be extended in place, its children precede it, so the new child becomes the second
+    # operand of another operator with the same label
+    def append(self, node, child):
+        return self.operator(self.opcodes[~self.code[node] >> 16], 2)
+
+    def parenthesized(self, node):
+        return self.operator(PARENTHESIS, 1)
+
+    # The instructions as text, operators followed by their arity when it is not 2
+    def __str__(self):
+        words = []
+        for instruction in self.code:
+            if instruction >= 0:
+                words.append(self.operands[instruction].lexem)
+            else:
+                label = self.opcodes[~instruction >> 16]
+                arity = ~instruction & MAX_ARITY
+                words.append(label if arity == 2 else '{}/{}'.format(label, arity))
+        return ' '.join(words)
+
+    # Run the program on a stack machine: the operands are resolved once, as evaluation.ValueFactory does,
+    # then each operator replaces its operands on the stack by the result of its function in semantics.
+    def evaluate(self, bindings, semantics=evaluation.c_semantics):
+        factory = evaluation.ValueFactory(bindings, semantics)
+        values = [factory.leaf(token) for token in self.operands]
+        functions = []
+        for label in self.opcodes:
+            if label == PARENTHESIS:
+                functions.append(evaluation.value)
+            elif label in semantics:
+                functions.append(semantics[label])
+            else:
+                functions.append(None)
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for instruction in self.code:
+            if instruction >= 0:
+                push(values[instruction])
+                continue
+            instruction = ~instruction
+            function = functions[instruction >> 16]
+            if function is None:
+                raise RuntimeError('Can not evaluate {}'.format(self.opcodes[instruction >> 16]))
+            arity = instruction & MAX_ARITY
+            if arity == 2:
+                right = pop()
+                push(function(pop(), right))
+            elif arity == 1:
+                push(function(pop()))
+            else:
+                first = len(stack) - arity
+                args = stack[first:]
+                del stack[first:]
+                push(function(*args))
+        return evaluation.value(stack[0])
+
+
+# The program of the expression s, parsed by context, a parse context of a shunting yard parser
+def emit(context, s):
+    program = Program()
+    context.factory = program
+    if context.parse(s) != len(program) - 1:
+        raise RuntimeError('Internal error: the result is not the last instruction')
+    return program
+
+
+def main(args):
+    import shunting_yard
+    parser = shunting_yard.cexp_parser()
+    for s in args[1:]:
+        try:
+            print('{} -> {}'.format(s, parser.compile(s)))
+        except RuntimeError as run_error:
+            print('Unable to compile {}: {}'.format(s, run_error))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import evaluation
+import andychu_cexp_tests
+import jmb_cexp_tests
+import shunting_yard
+import dijkstra
+
+
+# Value or type of the exception, the parsers dumping their stacks on some errors
+def result(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as error:
+        return type(error).__name__
+
+
+def run(parser, s, bindings, semantics=evaluation.c_semantics):
+    return parser.compile(s).evaluate(bindings, semantics)
+
+
+bindings = {name: i + 1 for i, name in enumerate('abcdefghijklmnopqrstuvwxyz')}
+bindings.update(f=lambda *args: sum(args), g=max, h=min, x=[3, 4, 5], y=[[6, 7], [8, 9]])
+
+
+def check_code(parser, s, expected):
+    with contextlib.redirect_stdout(io.StringIO()):
+        got = result(lambda: str(parser.compile(s)))
+    if got != expected:
+        print('Failed {} compile: {} => {} != {}'.format(type(parser).__module__, s, got, expected))
+
+
+def check_run(parser, s, bindings, expected, semantics=evaluation.c_semantics):
+    with contextlib.redirect_stdout(io.StringIO()):
+        got = result(run, parser, s, bindings, semantics)
+    if got != expected:
+        print('Failed {} run: {} => {} != {}'.format(type(parser).__module__, s, got, expected))
+
+
+# The program computes the same value as the fused evaluation
+def check_evaluation(s, expected):
+    parser = shunting_yard.cexp_parser()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fused = result(parser.evaluate, s, bindings)
+        ran = result(run, parser, s, bindings)
+    if ran != fused:
+        print('Failed rpn run: {} => {} != {}'.format(s, ran, fused))
+
+
+def shunting_yard_tests():
+    parser = shunting_yard.cexp_parser()
+    check_code(parser, 'a * b + c', 'a b * c +')
+    check_code(parser, 'a * (b + c)', 'a b c + ()/1 *')
+    check_code(parser, '-a ++', 'a post++/1 -/1')
+    check_code(parser, 'f(a, b, c) + f()', 'f a b , c , call f call/1 +')
+    check_code(parser, 'a ? b : c[1]', 'a b c 1 get ?/3')
+    check_code(parser, 'a +', 'RuntimeError')
+    check_run(parser, '2 ** 3 ** 2', {}, 512)
+    check_run(parser, 'f(a, b, c) + g(a, (b, c))', bindings, 6 + 3)
+    check_run(parser, 'unbound + 1', bindings, 'RuntimeError')
+    check_run(parser, 'a = 1', bindings, 'RuntimeError')
+    program = parser.compile('a + a * 2 + a * 2')
+    if len(program.operands) != 2 or len(program.opcodes) != 2:
+        print('Failed rpn operands and opcodes: {} {}'.format(program.operands, program.opcodes))
+    if program.evaluate({'a': 1}) != 5 or program.evaluate({'a': 10}) != 50:
+        print('Failed rpn run with other bindings')
+    check_run(shunting_yard.cexp_parser().freeze(), '-a * (b + c) / 2.0', bindings, -2.5)
+    # the evaluation does not recurse
+    check_run(parser, '- ' * 100000 + 'a', bindings, 1)
+    check_run(parser, '(' * 100000 + 'a' + ')' * 100000, bindings, 1)
+    check_run(parser, ' + '.join(['a'] * 100000), bindings, 100000)
+
+
+def dijkstra_tests():
+    parser = dijkstra.algol_exp_parser()
+    semantics = evaluation.algol_semantics
+    check_code(parser, 'a+b*c', 'a b c * +')
+    check_code(parser, '~a * b', 'a ~/1 b *')
+    check_code(parser, 'a(b, c)', 'a b c , call')
+    check_code(parser, 'a[b][c]', 'a b index c index')
+    check_run(parser, '(a+b)*c^2', {'a': 1, 'b': 2, 'c': 3}, 27, semantics)
+    check_run(parser, 'a(b, c)', {'a': max, 'b': 1, 'c': 2}, 2, semantics)
+    check_run(parser, 'a[b][c]', {'a': [[1, 2], [3, 4]], 'b': 1, 'c': 0}, 3, semantics)
+    check_run(parser, 'a => b & ~b', {'a': False, 'b': True}, True, semantics)
+    check_run(parser, 'a := 1', {'a': 0}, 'RuntimeError', semantics)
+
+
+shunting_yard_tests()
+dijkstra_tests()
+andychu_cexp_tests.all(check_evaluation)
+jmb_cexp_tests.all_tests(check_evaluation)
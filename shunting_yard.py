@@ -2,7 +2,9 @@
 
 import sys
 import lexer
-from tree import Node, CompositeNode
+import evaluation
+import rpn
+from tree import CompositeNode, node_factory
 
 
 class OperatorDesc:
@@ -18,36 +20,39 @@ class OperatorDesc:
 
 def prefix_unary_evaluator(parser):
     oper = parser.operators_stack.pop()
-    parser.values_stack.append(CompositeNode(oper.oper, [parser.values_stack.pop()]))
+    parser.values_stack.append(parser.factory.composite(oper.oper, [parser.values_stack.pop()]))
 
 
 def postfix_unary_evaluator(parser):
     oper = parser.operators_stack.pop()
-    parser.values_stack.append(CompositeNode('post'+oper.oper, [parser.values_stack.pop()]))
+    parser.values_stack.append(parser.factory.composite('post'+oper.oper, [parser.values_stack.pop()]))
 
 
 def binary_evaluator(parser):
     oper = parser.operators_stack.pop()
     val2 = parser.values_stack.pop()
     val1 = parser.values_stack.pop()
-    parser.values_stack.append(CompositeNode(oper.oper, [val1, val2]))
+    parser.values_stack.append(parser.factory.composite(oper.oper, [val1, val2]))
 
 
 class Parser:
     def __init__(self):
+        self.factory = node_factory
         self.prefix_actions = {}
         self.prefix_operators = {}
         self.infix_operators = {}
         self.postfix_actions = {}
         self.postfix_operators = {}
-        self.reset()
+        # merged tables built by freeze
+        self.value_table = None
+        self.operator_table = None
 
-    def reset(self):
-        self.waiting_value = True
-        self.values_stack = []
-        self.operators_stack = []
+    def check_not_frozen(self, oper):
+        if self.value_table is not None:
+            raise RuntimeError('Cannot register {} on a frozen parser'.format(oper))
 
     def register_prefix_action(self, oper, action):
+        self.check_not_frozen(oper)
         if type(oper) is str:
             self.prefix_actions[oper] = action
         else:
@@ -55,6 +60,7 @@ class Parser:
                 self.prefix_actions[op] = action
 
     def register_prefix_operator(self, oper, rprio, evaluator=None):
+        self.check_not_frozen(oper)
         if evaluator is None:
             evaluator = prefix_unary_evaluator
         if type(oper) is str:
@@ -64,6 +70,7 @@ class Parser:
                 self.prefix_operators[op] = OperatorDesc(op, -1, rprio, evaluator)
 
     def register_infix_operator(self, oper, lprio, rprio, evaluator=None):
+        self.check_not_frozen(oper)
         if evaluator is None:
             evaluator = binary_evaluator
         if type(oper) is str:
@@ -73,6 +80,7 @@ class Parser:
                 self.infix_operators[op] = OperatorDesc(op, lprio, rprio, evaluator)
 
     def register_postfix_action(self, oper, action):
+        self.check_not_frozen(oper)
         if type(oper) is str:
             self.postfix_actions[oper] = action
         else:
@@ -80,6 +88,7 @@ class Parser:
                 self.postfix_actions[op] = action
 
     def register_postfix_operator(self, oper, lprio, evaluator=None):
+        self.check_not_frozen(oper)
         if evaluator is None:
             evaluator = postfix_unary_evaluator
         if type(oper) is str:
@@ -88,6 +97,67 @@ class Parser:
             for op in oper:
                 self.postfix_operators[op] = OperatorDesc(op, lprio, -1, evaluator)
 
+    # Merge the registered tables into one table per state, giving for each lexem an (action, OperatorDesc)
+    # pair, so each token is looked up once: the action is called when there is one, otherwise the operator is
+    # pushed.  Actions take precedence over operators, and postfix over infix, as in parse_for_value and
+    # parse_for_operator.  A frozen parser refuses further registrations.
+    def freeze(self):
+        value_table = {}
+        for oper, desc in self.prefix_operators.items():
+            value_table[oper] = (None, desc)
+        for oper, action in self.prefix_actions.items():
+            value_table[oper] = (action, None)
+        operator_table = {}
+        for oper, desc in self.infix_operators.items():
+            operator_table[oper] = (None, desc)
+        for oper, desc in self.postfix_operators.items():
+            operator_table[oper] = (None, desc)
+        for oper, action in self.postfix_actions.items():
+            operator_table[oper] = (action, None)
+        self.value_table = value_table
+        self.operator_table = operator_table
+        return self
+
+    def parse(self, s):
+        return ParseContext(self).parse(s)
+
+    # Compute the value of s while parsing it, the evaluators combining values instead of nodes on the values
+    # stack; see evaluation.py for bindings, the values of the identifiers, and semantics, the operators.
+    def evaluate(self, s, bindings, semantics=evaluation.c_semantics):
+        context = ParseContext(self)
+        context.factory = evaluation.ValueFactory(bindings, semantics)
+        return evaluation.value(context.parse(s))
+
+    # The reverse Polish code of s, see rpn.py, to be run by its evaluate method
+    def compile(self, s):
+        return rpn.emit(ParseContext(self), s)
+
+    # Incremental parsing: feed the tokens one by one to the returned context, then call its finish
+    def start(self):
+        return PushContext(self)
+
+    # Parse a list of expressions, tokenized together by lexer.tokenize_many
+    def parse_many(self, expressions):
+        return [self.parse(tokens) for tokens in lexer.tokenize_many(expressions)]
+
+
+# The stacks of one parse.  The Parser holds only the operator tables, which are not modified while parsing,
+# so a parser can be shared between threads, each parse using its own context.  The evaluators and actions
+# get the context as their parser.
+class ParseContext:
+    def __init__(self, parser):
+        self.factory = parser.factory
+        self.prefix_actions = parser.prefix_actions
+        self.prefix_operators = parser.prefix_operators
+        self.infix_operators = parser.infix_operators
+        self.postfix_actions = parser.postfix_actions
+        self.postfix_operators = parser.postfix_operators
+        self.value_table = parser.value_table
+        self.operator_table = parser.operator_table
+        self.waiting_value = True
+        self.values_stack = []
+        self.operators_stack = []
+
     def evaluate_operator(self):
         self.operators_stack[-1].evaluator(self)
 
@@ -102,15 +172,15 @@ class Parser:
             self.evaluate_operator()
 
     def parse_for_value(self, tk):
-        if tk.kind == 'NUMBER' or tk.kind == 'ID':
-            self.values_stack.append(Node(tk))
+        if tk.kind == lexer.NUMBER or tk.kind == lexer.ID:
+            self.values_stack.append(self.factory.leaf(tk))
             self.waiting_value = False
         elif tk.lexem in self.prefix_actions:
             self.prefix_actions[tk.lexem](self)
         elif tk.lexem in self.prefix_operators:
             self.push_operator(self.prefix_operators[tk.lexem])
         else:
-            self.values_stack.append(Node(lexer.Token('', 'ERROR')))
+            self.values_stack.append(self.factory.leaf(lexer.Token(lexer.ERROR, 'ERROR')))
             self.parse_for_operator(tk)
 
     def parse_for_operator(self, tk):
@@ -123,15 +193,108 @@ class Parser:
             self.push_operator(self.infix_operators[tk.lexem])
         else:
             val = self.values_stack.pop()
-            self.values_stack.append(CompositeNode('MISSING OPERATOR', [val, Node(tk)]))
+            self.values_stack.append(self.factory.composite('MISSING OPERATOR', [val, self.factory.leaf(tk)]))
+
+    def parse_frozen_value(self, tk):
+        if tk.kind == lexer.NUMBER or tk.kind == lexer.ID:
+            self.values_stack.append(self.factory.leaf(tk))
+            self.waiting_value = False
+        else:
+            entry = self.value_table.get(tk.lexem)
+            if entry is not None:
+                action, oper = entry
+                if action is not None:
+                    action(self)
+                else:
+                    self.push_operator(oper)
+            else:
+                self.values_stack.append(self.factory.leaf(lexer.Token(lexer.ERROR, 'ERROR')))
+                self.parse_frozen_operator(tk)
+
+    def parse_frozen_operator(self, tk):
+        entry = self.operator_table.get(tk.lexem)
+        if entry is not None:
+            action, oper = entry
+            if action is not None:
+                action(self)
+            else:
+                # infix operators wait for a value, postfix ones (oper.rprio == -1) do not
+                self.waiting_value = oper.rprio >= 0
+                self.push_operator(oper)
+        else:
+            val = self.values_stack.pop()
+            self.values_stack.append(self.factory.composite('MISSING OPERATOR', [val, self.factory.leaf(tk)]))
 
     def parse(self, s):
-        self.reset()
+        if self.value_table is not None and isinstance(s, lexer.TokenBuffer):
+            return self.parse_buffer(s)
+        if self.value_table is None:
+            parse_for_value = self.parse_for_value
+            parse_for_operator = self.parse_for_operator
+        else:
+            parse_for_value = self.parse_frozen_value
+            parse_for_operator = self.parse_frozen_operator
         for tk in lexer.tokenize(s):
             if self.waiting_value:
-                self.parse_for_value(tk)
+                parse_for_value(tk)
             else:
-                self.parse_for_operator(tk)
+                parse_for_operator(tk)
+        return self.finish()
+
+    # A frozen parser reads a TokenBuffer from its arrays: the operators are looked up by their lexem in the
+    # source, only the operands, which become leaves, and the unexpected tokens are built as tokens.  With the
+    # buffer of an operator lexer, the operators with an id are looked up by id in the tables it resolves.
+    def parse_buffer(self, buffer):
+        kinds = buffer.kinds
+        lexem = buffer.lexem
+        token = buffer.token
+        value_table = self.value_table
+        operator_table = self.operator_table
+        if isinstance(buffer, lexer.OperatorTokenBuffer):
+            opers = buffer.opers
+            value_ids = buffer.operator_lexer.resolve(value_table)
+            operator_ids = buffer.operator_lexer.resolve(operator_table)
+        else:
+            opers = None
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if self.waiting_value:
+                if kind == lexer.NUMBER or kind == lexer.ID:
+                    self.values_stack.append(self.factory.leaf(token(i)))
+                    self.waiting_value = False
+                    continue
+                if opers is not None and opers[i] >= 0:
+                    entry = value_ids[opers[i]]
+                else:
+                    entry = value_table.get(lexem(i))
+                if entry is None:
+                    self.parse_frozen_value(token(i))
+                    continue
+                action, oper = entry
+                if action is not None:
+                    action(self)
+                else:
+                    self.push_operator(oper)
+            else:
+                if kind == lexer.NUMBER or kind == lexer.ID:
+                    entry = None
+                elif opers is not None and opers[i] >= 0:
+                    entry = operator_ids[opers[i]]
+                else:
+                    entry = operator_table.get(lexem(i))
+                if entry is None:
+                    self.parse_frozen_operator(token(i))
+                    continue
+                action, oper = entry
+                if action is not None:
+                    action(self)
+                else:
+                    self.waiting_value = oper.rprio >= 0
+                    self.push_operator(oper)
+        return self.finish()
+
+    # Evaluate the pending operators at the end of the input
+    def finish(self):
         if self.waiting_value:
             self.dump()
             raise RuntimeError('missing value')
@@ -150,6 +313,34 @@ class Parser:
             print('   {}'.format(val))
 
 
+# A parse context fed with the tokens one at a time, from Parser.start.  feed handles a token as soon as it
+# arrives and returns the composite subtrees built by the operators it evaluated, finish evaluates the
+# pending operators and returns the tree.  A coma list is returned again each time it is extended.
+class PushContext(ParseContext):
+    def __init__(self, parser):
+        ParseContext.__init__(self, parser)
+        self.reduced = []
+
+    def evaluate_operator(self):
+        ParseContext.evaluate_operator(self)
+        if isinstance(self.values_stack[-1], CompositeNode):
+            self.reduced.append(self.values_stack[-1])
+
+    def feed(self, tk):
+        if self.value_table is None:
+            if self.waiting_value:
+                self.parse_for_value(tk)
+            else:
+                self.parse_for_operator(tk)
+        elif self.waiting_value:
+            self.parse_frozen_value(tk)
+        else:
+            self.parse_frozen_operator(tk)
+        reduced = self.reduced
+        self.reduced = []
+        return reduced
+
+
 def prefix_open_parenthesis(parser):
     parser.dump()
     raise RuntimeError('Unclosed open parenthesis')
@@ -166,7 +357,7 @@ def prefix_close_parenthesis(parser):
         parser.dump()
         raise RuntimeError('Empty parenthesis')
     val1 = parser.values_stack.pop()
-    parser.values_stack.append(CompositeNode('call', [val1]))
+    parser.values_stack.append(parser.factory.composite('call', [val1]))
     parser.waiting_value = False
 
 
@@ -179,13 +370,13 @@ def postfix_close_parenthesis(parser):
     if op2.evaluator == infix_open_parenthesis:
         val1 = parser.values_stack.pop()
         val2 = parser.values_stack.pop()
-        if type(val1) == CompositeNode and val1.token == ',':
+        if isinstance(val1, CompositeNode) and val1.token == ',':
             args = [val2] + val1.children
         else:
             args = [val2, val1]
-        parser.values_stack.append(CompositeNode('call', args))
+        parser.values_stack.append(parser.factory.composite('call', args))
     else:
-        parser.values_stack[-1].parenthesis = True
+        parser.values_stack.append(parser.factory.parenthesized(parser.values_stack.pop()))
 
 
 def infix_question(parser):
@@ -202,7 +393,7 @@ def infix_colon(parser):
     val1 = parser.values_stack.pop()
     val2 = parser.values_stack.pop()
     val3 = parser.values_stack.pop()
-    parser.values_stack.append(CompositeNode('?', [val3, val2, val1]))
+    parser.values_stack.append(parser.factory.composite('?', [val3, val2, val1]))
 
 
 def infix_open_brackets(parser):
@@ -218,18 +409,17 @@ def postfix_close_brackets(parser):
         raise RuntimeError('Unopened close bracket')
     val1 = parser.values_stack.pop()
     val2 = parser.values_stack.pop()
-    parser.values_stack.append(CompositeNode('get', [val2, val1]))
+    parser.values_stack.append(parser.factory.composite('get', [val2, val1]))
 
 
 def coma_evaluator(parser):
     oper = parser.operators_stack.pop()
     val2 = parser.values_stack.pop()
     val1 = parser.values_stack.pop()
-    if type(val1) is CompositeNode and val1.token == ',' and not val1.parenthesis:
-        val1.children.append(val2)
-        parser.values_stack.append(val1)
+    if isinstance(val1, CompositeNode) and val1.token == ',' and not val1.parenthesis:
+        parser.values_stack.append(parser.factory.append(val1, val2))
     else:
-        parser.values_stack.append(CompositeNode(oper.oper, [val1, val2]))
+        parser.values_stack.append(parser.factory.composite(oper.oper, [val1, val2]))
 
 
 def cexp_parser():
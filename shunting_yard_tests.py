@@ -1,5 +1,8 @@
 #! /usr/bin/env python3
 
+import contextlib
+import io
+import lexer
 import shunting_yard
 import andychu_cexp_tests
 import jmb_cexp_tests
@@ -9,5 +12,69 @@ def check_parsing(s, expected):
     jmb_cexp_tests.check_parsing(shunting_yard.cexp_parser(), s, expected)
 
 
+# The stacks dumped on errors are not printed
+def parse(parser, s):
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return repr(parser.parse(s))
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+def push_parse(parser, s):
+    context = parser.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tk in lexer.tokenize(s):
+                context.feed(tk)
+            return repr(context.finish())
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+# Feeding the tokens one by one gives the result of parse, errors included
+def check_push_parsing(s, expected):
+    for parser in [shunting_yard.cexp_parser(), frozen_parser]:
+        pushed = push_parse(parser, s)
+        parsed = parse(parser, s)
+        if pushed != parsed:
+            print('Failed push parsing: {} => {} != {}'.format(s, pushed, parsed))
+
+
+def push_tests():
+    context = shunting_yard.cexp_parser().start()
+    reduced = [[repr(node) for node in context.feed(tk)] for tk in lexer.tokenize('a * b + c * d - e')]
+    if reduced != [[], [], [], ['(* a b)'], [], [], [], ['(* c d)', '(+ (* a b) (* c d))'], []]:
+        print('Failed push parsing reductions: {}'.format(reduced))
+    if repr(context.finish()) != '(- (+ (* a b) (* c d)) e)':
+        print('Failed push parsing finish')
+
+
+# The frozen parser behaves as the parser it was built from, errors included
+def check_frozen_parsing(s, expected):
+    frozen = parse(frozen_parser, s)
+    unfrozen = parse(shunting_yard.cexp_parser(), s)
+    if frozen != unfrozen:
+        print('Failed frozen parser: {} => {} != {}'.format(s, frozen, unfrozen))
+
+
+def freeze_tests():
+    parser = shunting_yard.cexp_parser().freeze()
+    try:
+        parser.register_infix_operator('@', 28, 28)
+        print('Failed registration on a frozen parser')
+    except RuntimeError:
+        pass
+    if repr(parser.parse('a - -b')) != '(- a (- b))' or repr(parser.parse('f(a)++')) != '(post++ (call f a))':
+        print('Failed frozen parser: {} {}'.format(parser.parse('a - -b'), parser.parse('f(a)++')))
+
+
+frozen_parser = shunting_yard.cexp_parser().freeze()
+freeze_tests()
+push_tests()
+andychu_cexp_tests.all(check_frozen_parsing)
+jmb_cexp_tests.all_tests(check_frozen_parsing)
+andychu_cexp_tests.all(check_push_parsing)
+jmb_cexp_tests.all_tests(check_push_parsing)
 andychu_cexp_tests.all(check_parsing)
 jmb_cexp_tests.all_tests(check_parsing)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+# Parsers shared by several threads give the same results as when used by one
+
+import contextlib
+import io
+import sys
+import threading
+import tree
+import andychu_cexp_tests
+import jmb_cexp_tests
+import dijkstra
+import knuth
+import operator_precedence
+import shunting_yard
+import modified_operator_precedence
+import recursive_operator_precedence
+import pratt
+import pratt_tdop_parser
+
+
+def parse(parser, s):
+    try:
+        return tree.sexp(parser.parse(s))
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error)
+
+
+# The first difference, or None
+def check_shared(name, parser, corpus, threads=4):
+    expected = [parse(parser, s) for s in corpus]
+    results = [None] * threads
+
+    def run(i):
+        results[i] = [parse(parser, s) for s in corpus]
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for result in results:
+        for s, got, wanted in zip(corpus, result, expected):
+            if got != wanted:
+                return 'Failed {} shared by threads: {} => {} != {}'.format(name, s, got, wanted)
+    return None
+
+
+def threading_tests():
+    corpus = []
+    andychu_cexp_tests.all(lambda s, expected: corpus.append(s))
+    jmb_cexp_tests.all_tests(lambda s, expected: corpus.append(s))
+    switch_interval = sys.getswitchinterval()
+    # switch threads as often as possible, and hide the stack dumps of shunting_yard
+    sys.setswitchinterval(1e-6)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            failures = [check_shared(module.__name__, module.cexp_parser(), corpus)
+                        for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                                       recursive_operator_precedence, pratt, pratt_tdop_parser]]
+            failures.append(check_shared('frozen shunting_yard', shunting_yard.cexp_parser().freeze(), corpus))
+            algol = ['a+b*c', '(a+b)*c', 'a(b, c)', 'a[b, c]', '~a * b']
+            failures.append(check_shared('dijkstra', dijkstra.algol_exp_parser(), algol * 20))
+            failures.append(check_shared('knuth', knuth.Parser(), ['a*(b+c)', 'U := B := X + COS(Y*Z)/W'] * 20))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    for failure in failures:
+        if failure is not None:
+            print(failure)
+
+
+threading_tests()
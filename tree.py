@@ -1,7 +1,16 @@
 # Simple syntax tree representation used by all the parsers
+# Nodes do not store their position: start and end are computed when asked for from the offsets of the
+# tokens of the subtree, -1 when none of them has a position.  Use lexer.LineIndex to get lines and columns.
+
+import re
+from array import array
+from itertools import islice
+from lexer import Token, NUMBER, ID
 
 
 class Node:
+    __slots__ = ('token', 'parenthesis')
+
     def __init__(self, token):
         self.token = token
         self.parenthesis = False
@@ -9,12 +18,477 @@ class Node:
     def __repr__(self):
         return self.token.lexem
 
+    # Smallest start and largest end of the tokens of the subtree.  Children of error nodes may be tokens,
+    # parser symbols or None.  The tree is walked with an explicit stack, so deep trees are fine.
+    def span(self):
+        start = end = -1
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, ArenaView):
+                token_start, token_end = node.span()
+            elif isinstance(node, CompositeNode):
+                pending.extend(node.children)
+                continue
+            else:
+                token = node.token if isinstance(node, Node) else node
+                token_start = getattr(token, 'start', -1)
+                token_end = getattr(token, 'end', -1)
+            if token_start >= 0:
+                if start < 0 or token_start < start:
+                    start = token_start
+                if token_end > end:
+                    end = token_end
+        return start, end
+
+    @property
+    def start(self):
+        return self.span()[0]
+
+    @property
+    def end(self):
+        return self.span()[1]
+
 
 class CompositeNode(Node):
+    __slots__ = ('children',)
+
     def __init__(self, token, children):
         Node.__init__(self, token)
         self.children = children
 
     def __repr__(self):
-        args = ''.join([" " + repr(c) for c in self.children])
-        return '(' + self.token + args + ')'
+        return sexp(self)
+
+
+# Pieces of the S-expression of a tree, in order.  The tree is walked with an explicit stack holding the
+# nodes still to write and the strings to write after them, so each piece is produced once, whatever the
+# depth.  Children which are not nodes are written with their repr.
+def sexp_pieces(node):
+    pending = [node]
+    while pending:
+        item = pending.pop()
+        if type(item) is str:
+            yield item
+        elif isinstance(item, CompositeNode):
+            yield '('
+            yield item.token
+            pending.append(')')
+            for child in reversed(item.children):
+                pending.append(child)
+                pending.append(' ')
+        elif isinstance(item, Node):
+            yield item.token.lexem
+        else:
+            yield repr(item)
+
+
+def sexp(node):
+    return ''.join(sexp_pieces(node))
+
+
+# Write the S-expression of a tree to a file, by chunks of chunk_size pieces
+def write_sexp(node, file, chunk_size=4096):
+    pieces = sexp_pieces(node)
+    while True:
+        chunk = ''.join(islice(pieces, chunk_size))
+        if not chunk:
+            return
+        file.write(chunk)
+
+
+# The parsers build their trees through the node factory in their factory attribute:
+#   leaf(token) makes a leaf for an operand token,
+#   composite(label, children) makes a node labelled with an operator, the children are usually nodes but
+#   error nodes may have tokens, parser symbols or None as children,
+#   append(node, child) adds a child to a composite node and returns the node to use in its place,
+#   parenthesized(node) marks a node as written between parenthesis and returns the node to use in its place.
+# The resulting nodes are Node and CompositeNode instances, with the token, children and parenthesis
+# attributes, which the parsers do not modify.
+class NodeFactory:
+    def leaf(self, token):
+        return Node(token)
+
+    def composite(self, label, children):
+        return CompositeNode(label, children)
+
+    def append(self, node, child):
+        node.children.append(child)
+        return node
+
+    def parenthesized(self, node):
+        node.parenthesis = True
+        return node
+
+
+node_factory = NodeFactory()
+
+
+# The key of an interned composite node: its label, parenthesis and children.  The hash is computed child by
+# child, so that adding a child to the key of a node being built by append takes constant time.  The key holds
+# the children list of its node.
+class InternKey:
+    __slots__ = ('label', 'parenthesis', 'children', 'hash')
+
+    def __init__(self, label, parenthesis, children):
+        self.label = label
+        self.parenthesis = parenthesis
+        self.children = children
+        self.hash = hash((label, parenthesis))
+        for child in children:
+            self.hash = hash((self.hash, child))
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return (self.label == other.label and self.parenthesis == other.parenthesis
+                and self.children == other.children)
+
+    def add(self, child):
+        self.children.append(child)
+        self.hash = hash((self.hash, child))
+
+
+# A node factory interning structurally identical subtrees: equal subtrees are built once and shared, so
+# they compare and hash by identity, in constant time.  Leaves are interned by kind and lexem, their tokens
+# have no position.
+#
+# Shared nodes are never modified, parenthesized returns another node.  The node returned by the last append
+# is the exception: until it is shared, by being a child or being returned again by composite or append, it
+# is only referenced by the parser and append extends it in place, moving it to the key of its new children.
+# Long comma lists are thus built in linear time and memory, the table not keeping each of their prefixes.
+class HashConsingFactory:
+    def __init__(self):
+        self.leaves = {}
+        self.composites = {}
+        self.open = None  # the node returned by the last append, while it is not shared
+        self.open_key = None
+
+    def __len__(self):
+        return len(self.leaves) + len(self.composites)
+
+    def leaf(self, token, parenthesis=False):
+        key = (token.kind, token.lexem, parenthesis)
+        node = self.leaves.get(key)
+        if node is None:
+            node = Node(Token(token.kind, token.lexem))
+            node.parenthesis = parenthesis
+            self.leaves[key] = node
+        return node
+
+    def intern(self, key):
+        node = self.composites.get(key)
+        if node is None:
+            node = CompositeNode(key.label, key.children)
+            node.parenthesis = key.parenthesis
+            self.composites[key] = node
+        if node is self.open:
+            self.open = None
+        return node
+
+    def composite(self, label, children, parenthesis=False):
+        if self.open is not None and any(child is self.open for child in children):
+            self.open = None
+        return self.intern(InternKey(label, parenthesis, list(children)))
+
+    def append(self, node, child):
+        if node is not self.open:
+            key = InternKey(node.token, node.parenthesis, node.children + [child])
+            node = self.intern(key)
+            if node.children is key.children:
+                self.open, self.open_key = node, key
+            return node
+        key = self.open_key
+        del self.composites[key]
+        key.add(child)
+        existing = self.composites.get(key)
+        if existing is not None:
+            self.open = None
+            return existing
+        self.composites[key] = node
+        return node
+
+    def parenthesized(self, node):
+        if isinstance(node, CompositeNode):
+            return self.composite(node.token, node.children, True)
+        return self.leaf(node.token, True)
+
+
+# Reading S-expressions back.  The pieces are parenthesis and atoms: reprs, written for the children of error
+# nodes which are not nodes, or runs of characters other than blanks and parenthesis.  The first atom after an
+# open parenthesis is the label of the node, the other atoms are leaves.
+#
+# The labels of error nodes start with a parenthesis or a bracket, like '( ERROR', ') ERROR' or '(] ERROR', so
+# the label is the first character after the open parenthesis, whatever it is, followed by the characters
+# other than blanks and parenthesis.  The second word of the labels 'call (]' and 'get [)' is read as an atom,
+# '(]' being the start of a '] ERROR' node only when ERROR follows.
+label_regex = re.compile(r'\S[^\s()]*')
+atom_regex = re.compile(r'\(\](?!\s+ERROR\b)|\[\)|[^\s()]+')
+blank_regex = re.compile(r'\s*')
+# A repr starts with < and a class name.  Its items are separated by blanks and nested reprs are items; the
+# first item is a lexem which may end with > like in <Symbol >> 22/23>, the repr ends with the first of the
+# other items ending with a > followed by a blank, a close parenthesis or the end.
+repr_start_regex = re.compile(r'<[A-Za-z_]\w*')
+repr_item_regex = re.compile(r'\S*?>(?=\s|\)|$)|\S+')
+
+
+# The end of the repr starting at pos in text
+def repr_end(text, pos):
+    pos = repr_start_regex.match(text, pos).end()
+    items = 0
+    while True:
+        pos = blank_regex.match(text, pos).end()
+        if pos == len(text):
+            raise RuntimeError('Unclosed repr in S-expression')
+        if repr_start_regex.match(text, pos):
+            pos = repr_end(text, pos)
+        else:
+            item = repr_item_regex.match(text, pos).group()
+            pos += len(item)
+            if items > 0 and item.endswith('>'):
+                return pos
+        items += 1
+
+
+# The trees of the S-expressions of text, built with factory
+def read_sexp_sequence(text, factory=node_factory):
+    # the labels of the nodes being read and their children, the last children are those of the sequence
+    labels = []
+    children = [[]]
+    pos = blank_regex.match(text).end()
+    while pos < len(text):
+        if text[pos] == ')':
+            if not labels:
+                raise RuntimeError('Unopened close parenthesis in S-expression')
+            node = factory.composite(labels.pop(), children.pop())
+            children[-1].append(node)
+            pos += 1
+        elif repr_start_regex.match(text, pos):
+            end = repr_end(text, pos)
+            children[-1].append(factory.leaf(Token(ID, text[pos:end])))
+            pos = end
+        else:
+            match = atom_regex.match(text, pos)
+            if match is not None:
+                atom = match.group()
+                children[-1].append(factory.leaf(Token(NUMBER if atom[0].isdigit() else ID, atom)))
+                pos = match.end()
+            else:
+                match = label_regex.match(text, pos + 1)
+                if match is None:
+                    raise RuntimeError('Missing label in S-expression')
+                labels.append(match.group())
+                children.append([])
+                pos = match.end()
+        pos = blank_regex.match(text, pos).end()
+    if labels:
+        raise RuntimeError('Unclosed open parenthesis in S-expression')
+    return children[0]
+
+
+def read_sexp(text, factory=node_factory):
+    nodes = read_sexp_sequence(text, factory)
+    if len(nodes) != 1:
+        raise RuntimeError('{} S-expressions instead of one'.format(len(nodes)))
+    return nodes[0]
+
+
+# Label and children of a composite node as read back from its S-expression: labels of several words (like
+# 'REMAINING INPUT' or 'call (]') and leaves whose lexem has blanks (like MISSING VALUE) are split into atoms, and
+# children which are not nodes become leaves with their repr.
+def sexp_children(node):
+    label, blank, rest = node.token.partition(' ')
+    children = read_sexp_sequence(rest) if rest else []
+    for child in node.children:
+        if isinstance(child, CompositeNode):
+            children.append(child)
+        elif isinstance(child, Node):
+            lexem = child.token.lexem
+            if ' ' in lexem:
+                children.extend(read_sexp_sequence(lexem))
+            else:
+                children.append(child)
+        else:
+            children.append(Node(Token(ID, repr(child))))
+    return label, children
+
+
+# Compare a tree with the tree read from an expected S-expression.  The trees are walked together in
+# preorder, stopping at the first pair of subtrees which differ by their label, number of children or
+# lexem; this pair is returned, or None when the tree has the expected S-expression.  The children of a
+# node are split as by sexp_children only when its label has blanks or its number of children differs.
+def sexp_diff(actual, expected):
+    pending = [(actual, expected)]
+    while pending:
+        actual, expected = pending.pop()
+        if isinstance(actual, CompositeNode):
+            if not isinstance(expected, CompositeNode):
+                return actual, expected
+            label = actual.token
+            children = actual.children
+            expected_children = expected.children
+            if ' ' in label or len(children) != len(expected_children):
+                label, children = sexp_children(actual)
+            if label != expected.token or len(children) != len(expected_children):
+                return actual, expected
+            for i in range(len(children) - 1, -1, -1):
+                pending.append((children[i], expected_children[i]))
+        elif isinstance(expected, CompositeNode):
+            return actual, expected
+        else:
+            lexem = actual.token.lexem if isinstance(actual, Node) else repr(actual)
+            if lexem != expected.token.lexem:
+                return actual, expected
+    return None
+
+
+# Kind of arena nodes, leaves use their token kind
+COMPOSITE = 0x7e
+# Children which are not arena nodes
+FOREIGN = 0x7f
+PARENTHESIS = 0x80
+
+
+# A node factory storing the nodes in parallel arrays instead of objects: per node its kind (token kind
+# for a leaf, COMPOSITE or FOREIGN, with the PARENTHESIS flag), its opcode (index of the lexem or label in
+# strings, or of the object in objects), the index of its first child in links and its number of children,
+# and the span of its tokens.  The children of a node are contiguous in links.  Nodes are identified by
+# their index; the factory returns views, Node and CompositeNode which read the arrays, and node(index)
+# makes a view on any node.  An arena can hold many trees, it is freed as a whole.
+class Arena:
+    def __init__(self):
+        self.kinds = array('B')
+        self.opcodes = array('I')
+        self.firsts = array('I')
+        self.counts = array('I')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.links = array('I')
+        self.strings = []
+        self.string_ids = {}
+        self.objects = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def string_id(self, s):
+        i = self.string_ids.get(s)
+        if i is None:
+            i = self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def add(self, kind, opcode, first, count, start, end):
+        self.kinds.append(kind)
+        self.opcodes.append(opcode)
+        self.firsts.append(first)
+        self.counts.append(count)
+        self.starts.append(start)
+        self.ends.append(end)
+        return len(self.kinds) - 1
+
+    # Index of a child, children which are not views on this arena are stored as FOREIGN nodes
+    def index(self, child):
+        if isinstance(child, ArenaView) and child.arena is self:
+            return child.index
+        self.objects.append(child)
+        start = getattr(child, 'start', -1)
+        end = getattr(child, 'end', -1) if start >= 0 else -1
+        return self.add(FOREIGN, len(self.objects) - 1, 0, 0, start, end)
+
+    def leaf(self, token):
+        return ArenaNode(self, self.add(token.kind, self.string_id(token.lexem), 0, 0, token.start, token.end))
+
+    def composite(self, label, children):
+        first = len(self.links)
+        start = end = -1
+        starts = self.starts
+        ends = self.ends
+        for child in children:
+            if isinstance(child, ArenaView) and child.arena is self:
+                i = child.index
+            else:
+                i = self.index(child)
+            self.links.append(i)
+            if starts[i] >= 0:
+                if start < 0 or starts[i] < start:
+                    start = starts[i]
+                if ends[i] > end:
+                    end = ends[i]
+        i = self.add(COMPOSITE, self.string_id(label), first, len(children), start, end)
+        return ArenaCompositeNode(self, i)
+
+    # The node is extended in place when its children are the last links, otherwise it is copied.
+    def append(self, node, child):
+        i = node.index
+        if self.firsts[i] + self.counts[i] != len(self.links):
+            node = self.composite(node.token, node.children)
+            i = node.index
+        c = self.index(child)
+        self.links.append(c)
+        self.counts[i] += 1
+        if self.starts[c] >= 0:
+            if self.starts[i] < 0 or self.starts[c] < self.starts[i]:
+                self.starts[i] = self.starts[c]
+            if self.ends[c] > self.ends[i]:
+                self.ends[i] = self.ends[c]
+        return node
+
+    def parenthesized(self, node):
+        node.parenthesis = True
+        return node
+
+    def node(self, i):
+        kind = self.kinds[i] & ~PARENTHESIS
+        if kind == COMPOSITE:
+            return ArenaCompositeNode(self, i)
+        elif kind == FOREIGN:
+            return self.objects[self.opcodes[i]]
+        return ArenaNode(self, i)
+
+
+class ArenaView:
+    __slots__ = ()
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def parenthesis(self):
+        return bool(self.arena.kinds[self.index] & PARENTHESIS)
+
+    @parenthesis.setter
+    def parenthesis(self, value):
+        if value:
+            self.arena.kinds[self.index] |= PARENTHESIS
+        else:
+            self.arena.kinds[self.index] &= ~PARENTHESIS
+
+    def span(self):
+        return self.arena.starts[self.index], self.arena.ends[self.index]
+
+
+class ArenaNode(ArenaView, Node):
+    __slots__ = ('arena', 'index')
+
+    @property
+    def token(self):
+        arena = self.arena
+        i = self.index
+        return Token(arena.kinds[i] & ~PARENTHESIS, arena.strings[arena.opcodes[i]], arena.starts[i], arena.ends[i])
+
+
+class ArenaCompositeNode(ArenaView, CompositeNode):
+    __slots__ = ('arena', 'index')
+
+    @property
+    def token(self):
+        return self.arena.strings[self.arena.opcodes[self.index]]
+
+    @property
+    def children(self):
+        arena = self.arena
+        first = arena.firsts[self.index]
+        return [arena.node(c) for c in arena.links[first:first + arena.counts[self.index]]]
@@ -0,0 +1,270 @@
+#! /usr/bin/env python3
+# A compact binary file format for parsed trees, used to cache them between runs.  The file is mapped
+# when opened, so opening is immediate whatever the number of trees, and each tree is decoded when asked for.
+#
+# All integers are little endian.  The file is made of:
+#   the header: magic, version, the number of opcodes, lexemes and trees, and the position of the sections,
+#   the opcode table: the labels of the composite nodes,
+#   the lexeme table: the kind and lexem of the tokens of the leaves,
+#   the trees: the position of the stream of each tree, then the streams.
+# A table of strings is an array of count + 1 offsets (u32) in a blob of UTF-8 strings.  The stream of a tree
+# lists its nodes in preorder, each node is a varint (LEB128) code: the index of its opcode or lexeme shifted
+# by 3, the PARENTHESIS flag and the type of the node; composite nodes are followed by their number of
+# children, also as a varint.  Token positions are not kept.
+#
+# The children of error nodes which are neither nodes, tokens nor None, like the symbols of the operator
+# precedence parsers, can not be written, unless a foreign function is given: the child is then written as a
+# leaf of kind ERROR whose lexem is foreign(child); with repr, the tree read back has the same S-expression.
+
+import io
+import mmap
+import struct
+import sys
+from lexer import Token, ERROR
+from tree import Node, CompositeNode, node_factory
+
+MAGIC = b'TREE'
+VERSION = 1
+
+# magic, version, flags (unused), opcode count, lexeme count, tree count, opcode offsets, opcode strings,
+# lexeme kinds, lexeme offsets, lexeme strings, tree positions, tree streams
+header_format = struct.Struct('<4sHHIIIQQQQQQQ')
+
+# Type of the nodes in the streams
+LEAF = 0
+COMPOSITE = 1
+TOKEN = 2
+NONE = 3
+PARENTHESIS = 4
+
+
+def append_varint(stream, value):
+    while value >= 0x80:
+        stream.append(value & 0x7f | 0x80)
+        value >>= 7
+    stream.append(value)
+
+
+def read_varint(data, pos):
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    value = byte & 0x7f
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# Index of the strings (or (kind, lexem) pairs) of a table, in the order they are first seen
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def id(self, key):
+        i = self.ids.get(key)
+        if i is None:
+            i = self.ids[key] = len(self.strings)
+            self.strings.append(key)
+        return i
+
+
+def encode_tree(tree, opcodes, lexemes, stream, foreign=None):
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, CompositeNode):
+            children = node.children
+            code = opcodes.id(node.token) << 3 | COMPOSITE
+            if node.parenthesis:
+                code |= PARENTHESIS
+            append_varint(stream, code)
+            append_varint(stream, len(children))
+            pending.extend(reversed(children))
+        elif isinstance(node, Node):
+            token = node.token
+            code = lexemes.id((token.kind, token.lexem)) << 3 | LEAF
+            if node.parenthesis:
+                code |= PARENTHESIS
+            append_varint(stream, code)
+        elif isinstance(node, Token):
+            append_varint(stream, lexemes.id((node.kind, node.lexem)) << 3 | TOKEN)
+        elif node is None:
+            append_varint(stream, NONE)
+        elif foreign is not None:
+            append_varint(stream, lexemes.id((ERROR, foreign(node))) << 3 | LEAF)
+        else:
+            raise TypeError('Cannot serialize {!r} in a tree'.format(node))
+
+
+def pad(f):
+    f.write(b'\0' * (-f.tell() % 8))
+    return f.tell()
+
+
+def write_strings(f, strings):
+    offsets_pos = pad(f)
+    blobs = [s.encode('utf-8') for s in strings]
+    offset = 0
+    offsets = [0]
+    for blob in blobs:
+        offset += len(blob)
+        offsets.append(offset)
+    f.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+    strings_pos = f.tell()
+    f.write(b''.join(blobs))
+    return offsets_pos, strings_pos
+
+
+# Write trees, an iterable of trees, to the file at path
+def write_trees(path, trees, foreign=None):
+    with open(path, 'wb') as f:
+        write_tree_file(f, trees, foreign)
+
+
+# The bytes of the file write_trees would write, to send trees to another process
+def dump_trees(trees, foreign=None):
+    f = io.BytesIO()
+    write_tree_file(f, trees, foreign)
+    return f.getvalue()
+
+
+def write_tree_file(f, trees, foreign=None):
+    opcodes = StringTable()
+    lexemes = StringTable()
+    stream = bytearray()
+    positions = [0]
+    for tree in trees:
+        encode_tree(tree, opcodes, lexemes, stream, foreign)
+        positions.append(len(stream))
+    f.write(b'\0' * header_format.size)
+    opcode_offsets, opcode_strings = write_strings(f, opcodes.strings)
+    lexeme_kinds = f.tell()
+    f.write(bytes(kind for kind, lexem in lexemes.strings))
+    lexeme_offsets, lexeme_strings = write_strings(f, [lexem for kind, lexem in lexemes.strings])
+    tree_positions = pad(f)
+    f.write(struct.pack('<{}Q'.format(len(positions)), *positions))
+    tree_streams = f.tell()
+    f.write(stream)
+    f.seek(0)
+    f.write(header_format.pack(MAGIC, VERSION, 0, len(opcodes.strings), len(lexemes.strings), len(positions) - 1,
+                               opcode_offsets, opcode_strings, lexeme_kinds, lexeme_offsets, lexeme_strings,
+                               tree_positions, tree_streams))
+
+
+# The trees of a file written by write_trees.  Only the header is read when the file is opened, tree(i) decodes
+# the tree i, building its nodes with factory, and the strings are decoded as they are first used.
+class TreeFile:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.load(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), path)
+
+    # The trees of data, bytes given by dump_trees, decoded as those of a file
+    @classmethod
+    def from_bytes(cls, data):
+        trees = cls.__new__(cls)
+        trees.load(data, 'data')
+        return trees
+
+    def load(self, mapping, path):
+        self.mapping = mapping
+        if len(self.mapping) < header_format.size:
+            raise ValueError('{} is not a tree file'.format(path))
+        (magic, version, flags, self.opcode_count, self.lexeme_count, self.tree_count,
+         self.opcode_offsets, self.opcode_strings, self.lexeme_kinds, self.lexeme_offsets, self.lexeme_strings,
+         self.tree_positions, self.tree_streams) = header_format.unpack_from(self.mapping)
+        if magic != MAGIC:
+            raise ValueError('{} is not a tree file'.format(path))
+        if version != VERSION:
+            raise ValueError('{}: unsupported tree file version {}'.format(path, version))
+        self.opcodes = {}
+        self.lexemes = {}
+
+    def __len__(self):
+        return self.tree_count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.tree_count:
+            raise IndexError('tree index out of range')
+        return self.tree(i)
+
+    def close(self):
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def string(self, offsets, strings, i):
+        start, end = struct.unpack_from('<II', self.mapping, offsets + 4 * i)
+        return sys.intern(str(self.mapping[strings + start:strings + end], 'utf-8'))
+
+    def opcode(self, i):
+        label = self.opcodes.get(i)
+        if label is None:
+            label = self.opcodes[i] = self.string(self.opcode_offsets, self.opcode_strings, i)
+        return label
+
+    def lexeme(self, i):
+        token = self.lexemes.get(i)
+        if token is None:
+            lexem = self.string(self.lexeme_offsets, self.lexeme_strings, i)
+            token = self.lexemes[i] = (self.mapping[self.lexeme_kinds + i], lexem)
+        return token
+
+    def tree(self, i, factory=node_factory):
+        data = self.mapping
+        pos = self.tree_streams + struct.unpack_from('<Q', data, self.tree_positions + 8 * i)[0]
+        # the composite nodes whose children are being decoded: label, parenthesis, arity, children
+        parents = []
+        while True:
+            code, pos = read_varint(data, pos)
+            node_type = code & 3
+            if node_type == COMPOSITE:
+                arity, pos = read_varint(data, pos)
+                if arity > 0:
+                    parents.append((self.opcode(code >> 3), code & PARENTHESIS, arity, []))
+                    continue
+                node = factory.composite(self.opcode(code >> 3), [])
+            elif node_type == LEAF:
+                node = factory.leaf(Token(*self.lexeme(code >> 3)))
+            elif node_type == TOKEN:
+                node = Token(*self.lexeme(code >> 3))
+            else:
+                node = None
+            if code & PARENTHESIS:
+                node = factory.parenthesized(node)
+            while parents:
+                label, parenthesis, arity, children = parents[-1]
+                children.append(node)
+                if len(children) < arity:
+                    break
+                parents.pop()
+                node = factory.composite(label, children)
+                if parenthesis:
+                    node = factory.parenthesized(node)
+            else:
+                return node
+
+    def __iter__(self):
+        for i in range(self.tree_count):
+            yield self.tree(i)
+
+
+def main(args):
+    with TreeFile(args[1]) as trees:
+        for i in range(len(trees)):
+            print(trees.tree(i))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
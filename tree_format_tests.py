@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import os
+import tempfile
+import tree
+import tree_format
+import andychu_cexp_tests
+import jmb_cexp_tests
+import operator_precedence
+import shunting_yard
+import pratt
+import pratt_tdop_parser
+
+
+def corpus_trees(module):
+    trees = []
+
+    # the stacks dumped by shunting_yard on errors are not printed
+    def parse(s, expected):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                trees.append(module.cexp_parser().parse(s))
+        except Exception:
+            pass
+
+    andychu_cexp_tests.all(parse)
+    jmb_cexp_tests.all_tests(parse)
+    return trees
+
+
+def check_round_trip(path, trees):
+    tree_format.write_trees(path, trees)
+    with tree_format.TreeFile(path) as loaded:
+        if len(loaded) != len(trees):
+            print('Failed tree file: {} trees != {}'.format(len(loaded), len(trees)))
+        for i, expected in enumerate(trees):
+            for factory in [tree.node_factory, tree.Arena(), tree.HashConsingFactory()]:
+                got = loaded.tree(i, factory)
+                if tree.sexp(got) != tree.sexp(expected) or parentheses(got) != parentheses(expected):
+                    print('Failed tree file: {} != {}'.format(tree.sexp(got), tree.sexp(expected)))
+        if [tree.sexp(t) for t in loaded] != [tree.sexp(t) for t in trees]:
+            print('Failed tree file iteration')
+
+
+# S-expression of a tree with the parenthesized nodes marked
+def parentheses(node):
+    if isinstance(node, tree.CompositeNode):
+        result = '(' + node.token + ''.join(' ' + parentheses(child) for child in node.children) + ')'
+    else:
+        result = tree.sexp(node)
+    if isinstance(node, tree.Node) and node.parenthesis:
+        result = '[' + result + ']'
+    return result
+
+
+def tree_file_tests():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for module in [shunting_yard, pratt, pratt_tdop_parser]:
+            check_round_trip(path, corpus_trees(module))
+        check_round_trip(path, [])
+        parser = pratt_tdop_parser.cexp_parser()
+        check_round_trip(path, [parser.parse('(a, b), (c)'), parser.parse('f(x' * 200 + ')' * 200)])
+        check_round_trip(path, [tree.CompositeNode('call', []), None])
+        try:
+            tree_format.write_trees(path, [operator_precedence.cexp_parser().parse(')')])
+            print('Failed tree file: symbol serialized')
+        except TypeError:
+            pass
+        node = operator_precedence.cexp_parser().parse('f(a')
+        tree_format.write_trees(path, [node], repr)
+        with tree_format.TreeFile(path) as loaded:
+            if tree.sexp(loaded.tree(0)) != tree.sexp(node):
+                print('Failed tree file with foreign children: {} != {}'.format(loaded.tree(0), node))
+        with open(path, 'wb') as f:
+            f.write(b'not a tree file' * 10)
+        try:
+            tree_format.TreeFile(path)
+            print('Failed tree file: bad magic accepted')
+        except ValueError:
+            pass
+    finally:
+        os.remove(path)
+
+
+# The bytes of dump_trees are those of the file
+def dump_tests():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        trees = corpus_trees(pratt)
+        tree_format.write_trees(path, trees)
+        with open(path, 'rb') as f:
+            if tree_format.dump_trees(trees) != f.read():
+                print('Failed dump_trees: not the bytes of the file')
+    finally:
+        os.remove(path)
+    loaded = tree_format.TreeFile.from_bytes(tree_format.dump_trees(trees))
+    if [tree.sexp(t) for t in loaded] != [tree.sexp(t) for t in trees]:
+        print('Failed TreeFile.from_bytes')
+
+
+tree_file_tests()
+dump_tests()
@@ -0,0 +1,209 @@
+#! /usr/bin/env python3
+
+import contextlib
+import io
+import tree
+import lexer
+import andychu_cexp_tests
+import jmb_cexp_tests
+import dijkstra
+import knuth
+import operator_precedence
+import shunting_yard
+import modified_operator_precedence
+import recursive_operator_precedence
+import pratt
+import pratt_tdop_parser
+
+
+# The stacks dumped by shunting_yard on errors are not printed
+def parse(parser, code):
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = parser.parse(code)
+        if isinstance(result, tree.Node):
+            return tree.sexp(result), result.span()
+        return tree.sexp(result), None
+    except Exception as error:
+        return '{}: {}'.format(type(error).__name__, error), None
+
+
+def check_arena(s, expected):
+    for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                   recursive_operator_precedence, pratt, pratt_tdop_parser]:
+        parser = module.cexp_parser()
+        from_objects = parse(parser, s)
+        parser.factory = tree.Arena()
+        from_arena = parse(parser, s)
+        if from_arena != from_objects:
+            print('Failed {} arena: {} => {} != {}'.format(module.__name__, s, from_arena, from_objects))
+        parser.factory = hash_consing
+        shared = parse(parser, s)[0]
+        if shared != from_objects[0]:
+            print('Failed {} hash consing: {} => {} != {}'.format(module.__name__, s, shared, from_objects[0]))
+
+
+# shared by all the parsers and expressions
+hash_consing = tree.HashConsingFactory()
+
+
+def check_algol(s):
+    for parser in [dijkstra.algol_exp_parser(), knuth.Parser()]:
+        from_objects = parse(parser, s)
+        parser.factory = tree.Arena()
+        from_arena = parse(parser, s)
+        if from_arena != from_objects:
+            print('Failed {} arena: {} => {} != {}'.format(type(parser).__module__, s, from_arena, from_objects))
+
+
+def arena_tests():
+    check_algol('a*(b+c)')
+    check_algol('COS a + b')
+    arena = tree.Arena()
+    parser = shunting_yard.cexp_parser()
+    parser.factory = arena
+    first = parser.parse('f(a, b, (c, d))')
+    size = len(arena)
+    second = parser.parse('x = y')
+    if repr(first) != '(call f a b (, c d))' or repr(second) != '(= x y)' or len(arena) <= size:
+        print('Failed arena with two trees: {} {}'.format(first, second))
+    if not first.children[3].parenthesis or first.children[1].parenthesis:
+        print('Failed arena parenthesis: {}'.format(first))
+    if type(first.children[1].token).__name__ != 'Token' or first.children[1].token.lexem != 'a':
+        print('Failed arena leaf token: {}'.format(first.children[1].token))
+    node = arena.composite(',', [arena.leaf(first.children[1].token)])
+    parser.parse('y + z')
+    appended = arena.append(node, second)
+    if repr(appended) != '(, a (= x y))' or appended.index == node.index:
+        print('Failed arena append with copy: {}'.format(appended))
+    node = arena.composite(',', [second])
+    appended = arena.append(node, second)
+    if repr(appended) != '(, (= x y) (= x y))' or appended.index != node.index:
+        print('Failed arena append in place: {}'.format(appended))
+
+
+def hash_consing_tests():
+    for module in [operator_precedence, shunting_yard, modified_operator_precedence,
+                   recursive_operator_precedence, pratt, pratt_tdop_parser]:
+        parser = module.cexp_parser()
+        parser.factory = tree.HashConsingFactory()
+        node = parser.parse('a * b + c * d == a * b + c * d')
+        if node.children[0] is not node.children[1] or node.children[0].children[0] is node.children[0].children[1]:
+            print('Failed {} hash consing sharing: {}'.format(module.__name__, node))
+        if parser.parse('a*b+c*d == a*b + c*d') is not node:
+            print('Failed {} hash consing identity: {}'.format(module.__name__, node))
+    # parenthesized nodes are distinct from the others
+    for module in [shunting_yard, pratt_tdop_parser]:
+        parser = module.cexp_parser()
+        parser.factory = tree.HashConsingFactory()
+        for s in ['f((a, b)), c', 'a, b, c', '(a, b), c', 'a, b, c', 'g(a, b), (a, b, c)']:
+            expected = repr(module.cexp_parser().parse(s))
+            got = repr(parser.parse(s))
+            if got != expected:
+                print('Failed {} hash consing: {} => {} != {}'.format(module.__name__, s, got, expected))
+        # the lists built by append keep their sharing, and their prefixes are not kept in the table
+        first = parser.parse('a, b, c')
+        longer = parser.parse('a, b, c, d')
+        if parser.parse('a, b, c') is not first or repr(first) != '(, a b c)' or repr(longer) != '(, a b c d)':
+            print('Failed {} hash consing lists: {} {}'.format(module.__name__, first, longer))
+        parser.factory = tree.HashConsingFactory()
+        n = 10000
+        node = parser.parse(', '.join('a{}'.format(i) for i in range(n)))
+        if len(node.children) != n or len(parser.factory) > n + 2:
+            print('Failed {} hash consing long list: {} nodes'.format(module.__name__, len(parser.factory)))
+
+
+def sexp_tests():
+    terms = 100000
+    s = ' + '.join('a{}'.format(i) for i in range(terms))
+    expected = '(+ ' * (terms - 1) + 'a0' + ''.join(' a{})'.format(i) for i in range(1, terms))
+    for module in [shunting_yard, pratt]:
+        for factory in [tree.node_factory, tree.Arena()]:
+            parser = module.cexp_parser()
+            parser.factory = factory
+            node = parser.parse(s)
+            if tree.sexp(node) != expected or repr(node) != expected:
+                print('Failed {} sexp of a deep tree'.format(module.__name__))
+            out = io.StringIO()
+            tree.write_sexp(node, out, 7)
+            if out.getvalue() != expected:
+                print('Failed {} write_sexp of a deep tree'.format(module.__name__))
+    node = tree.CompositeNode('REMAINING INPUT', [None, tree.Node(lexer.Token(lexer.ID, 'x'))])
+    if tree.sexp(node) != '(REMAINING INPUT None x)' or tree.sexp(None) != 'None':
+        print('Failed sexp of foreign children: {}'.format(tree.sexp(node)))
+
+
+# The S-expressions of every parser, those of its error trees included, are read back as trees with the same
+# S-expression and without differences
+def check_sexp_reader(s, expected):
+    if expected:
+        if tree.sexp(tree.read_sexp(expected)) != expected or \
+                tree.sexp(tree.read_sexp(expected, tree.Arena())) != expected:
+            print('Failed read_sexp: {}'.format(expected))
+        golden = tree.read_sexp(expected)
+    for module in [operator_precedence, modified_operator_precedence, recursive_operator_precedence, shunting_yard,
+                   pratt, pratt_tdop_parser]:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                node = module.cexp_parser().parse(s)
+        except Exception:
+            continue
+        text = tree.sexp(node)
+        try:
+            read = tree.read_sexp(text)
+            if tree.sexp(read) != text or tree.sexp_diff(node, read) is not None:
+                print('Failed {} read_sexp: {} => {} != {}'.format(module.__name__, s, tree.sexp(read), text))
+        except RuntimeError as error:
+            print('Failed {} read_sexp: {} => {}: {}'.format(module.__name__, s, text, error))
+        if expected:
+            diff = tree.sexp_diff(node, golden)
+            if (diff is None) != (text == expected):
+                print('Failed {} sexp_diff: {} => {} != {}: {}'.format(module.__name__, s, text, expected, diff))
+
+
+def sexp_reader_tests():
+    for text in ['(+ a', 'a)', '()', '(+ a b) c']:
+        try:
+            tree.read_sexp(text)
+            print('Failed read_sexp error: {}'.format(text))
+        except RuntimeError:
+            pass
+    if [tree.sexp(node) for node in tree.read_sexp_sequence(' a (- 1)\n(, (f x) <Symbol ) >) ')] != \
+            ['a', '(- 1)', '(, (f x) <Symbol ) >)']:
+        print('Failed read_sexp_sequence')
+    for text in ['(( ERROR a)', '() ERROR (+ a b))', '((] ERROR a)', '(call (] f a)', '(get [) a b)',
+                 '(] ERROR (+ a b))', "(ID ERROR a <Symbol <Token ID 'b'> 999/1000>)", '(+ a <Symbol <= 20/21>)',
+                 "(REMAINING INPUT a <Token OPER '>'>)", '(- <Symbol >> 22/23> <Symbol ( 100/1: None>)']:
+        try:
+            if tree.sexp(tree.read_sexp(text)) != text:
+                print('Failed read_sexp of error labels: {} => {}'.format(text, tree.read_sexp(text)))
+        except RuntimeError as error:
+            print('Failed read_sexp of error labels: {}: {}'.format(text, error))
+    parser = pratt.cexp_parser()
+    diff = tree.sexp_diff(parser.parse('f(a, g(b, c)) + d'), tree.read_sexp('(+ (call f a (call g b e)) d)'))
+    if diff is None or repr(diff) != '(c, e)':
+        print('Failed sexp_diff of leaves: {}'.format(diff))
+    diff = tree.sexp_diff(parser.parse('(a + b) * c'), tree.read_sexp('(* (- a b) c)'))
+    if diff is None or repr(diff) != '((+ a b), (- a b))':
+        print('Failed sexp_diff of labels: {}'.format(diff))
+    diff = tree.sexp_diff(parser.parse('a + b'), tree.read_sexp('(+ a b c)'))
+    if diff is None or repr(diff[0]) != '(+ a b)' or repr(diff[1]) != '(+ a b c)':
+        print('Failed sexp_diff of arity: {}'.format(diff))
+    node = tree.CompositeNode('REMAINING INPUT', [None, tree.Node(lexer.Token(lexer.ID, 'MISSING VALUE'))])
+    if tree.sexp_diff(node, tree.read_sexp(tree.sexp(node))) is not None:
+        print('Failed sexp_diff of error nodes: {}'.format(node))
+    terms = 100000
+    s = ' + '.join('a{}'.format(i) for i in range(terms))
+    node = shunting_yard.cexp_parser().parse(s)
+    if tree.sexp_diff(node, tree.read_sexp(tree.sexp(node))) is not None:
+        print('Failed sexp_diff of a deep tree')
+
+
+arena_tests()
+sexp_tests()
+sexp_reader_tests()
+hash_consing_tests()
+andychu_cexp_tests.all(check_arena)
+jmb_cexp_tests.all_tests(check_arena)
+andychu_cexp_tests.all(check_sexp_reader)
+jmb_cexp_tests.all_tests(check_sexp_reader)